@@ -1,13 +1,35 @@
 import os
+import asyncio
+import functools
 import logging
 import json
-from fastapi import FastAPI, HTTPException
+import re
+import pathlib
+from urllib.parse import quote
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from duckduckgo_search import DDGS
-import google.generativeai as genai
 from dotenv import load_dotenv
+from proposal_cache import shared_cache
+from product_search import open_search_session, search_product_info, search_product_images, search_stats
+from proposal_generation import MODEL_NAME, generate_proposal_json, stream_proposal_json
+from gemini_client import configured_api_keys, get_client_manager
+from proposal_batch import BatchJob
+from rate_limit import background_work
+from proposal_render import proposal_id, render_proposal_fragment, render_proposal_html, template_digest
+from proposal_store import proposal_store
+from image_ranking import best_image, rank_images
+from image_store import VARIANTS, ImageFetchError, image_store
+from proposal_bundle import render_proposal_bundle
+from provider_cassette import REPLAY_API_KEY, replaying
+import metrics
+from static_assets import IMMUTABLE, REVALIDATE, StaticAssets
+from proposal_pdf import PdfUnavailable, html_to_pdf, merge_pdfs, pdf_executor, pdf_font, require_pdf
 
 # Load environment variables
 load_dotenv()
@@ -15,10 +37,60 @@ load_dotenv()
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Create the Gemini client pool once, before the first request needs it
+    if configured_api_keys():
+        get_client_manager(MODEL_NAME)
+    # Read and compress the UI once at startup rather than on the first visit
+    static_assets.get("index.html")
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
+# The UI itself is served from memory with precompressed variants and hashed URLs (/assets).
+# Set STATIC_RELOAD=1 while editing static/ to pick up changes without a restart.
+static_assets = StaticAssets("static", reload=os.environ.get("STATIC_RELOAD") == "1")
+
+# Provider Executors
+# DDGS and the Gemini SDK are blocking clients. Each provider gets its own bounded
+# thread pool so a slow Gemini call never stalls the event loop, and a burst of
+# searches cannot use up the slots reserved for generation (and vice versa).
+PROVIDER_CONCURRENCY = {
+    "search": int(os.environ.get("SEARCH_CONCURRENCY", "8")),
+    "gemini": int(os.environ.get("GEMINI_CONCURRENCY", "16")),
+    "images": int(os.environ.get("IMAGE_CONCURRENCY", "16")),
+    # Local disk work (saved proposals, cache admin) must not queue behind slow DDGS fan-outs
+    "storage": int(os.environ.get("STORAGE_CONCURRENCY", "4")),
+}
+provider_executors = {
+    name: ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"{name}-provider")
+    for name, size in PROVIDER_CONCURRENCY.items()
+}
+
+# PDF layout is CPU-bound, so it runs on a pool of worker processes instead of threads
+provider_executors["pdf"] = pdf_executor()
+
+async def run_provider(provider, func, *args, **kwargs):
+    """Runs a blocking provider call on that provider's executor and awaits the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(provider_executors[provider], functools.partial(func, *args, **kwargs))
+
+# Batch Workers
+# Batch items run on their own pool, calling providers directly rather than through
+# provider_executors, so a large batch never occupies the slots interactive users need.
+# They run as background work, so they only get part of the shared Gemini and DDGS
+# quotas (GEMINI_BATCH_SHARE, DDGS_BATCH_RATE_PER_SECOND) and yield to interactive calls.
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "2"))
+MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", "2000"))
+MAX_BATCH_JOBS = 100
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch-worker")
+batch_jobs = OrderedDict()
+MAX_RANKED_IMAGES = 40
+# Each requested image costs IMAGE_OVERFETCH search results and as many preview downloads.
+MAX_IMAGE_COUNT = 40
 
 # Data Models
 class ProductSearchRequest(BaseModel):
@@ -28,129 +100,217 @@ class ImageSearchRequest(BaseModel):
     product_name: str
     count: int = 20
 
+class PrepareRequest(BaseModel):
+    product_name: str
+    count: int = 8
+    stream: bool = False
+
+class RankImagesRequest(BaseModel):
+    urls: List[str]
+
 class GenerateProposalRequest(BaseModel):
     product_name: str
     price: str
     capacity: str
     image_url: str
     context: str
+    force_regenerate: bool = False
+
+class SaveProposalRequest(BaseModel):
+    data: dict
+    image_url: str
+
+class BatchItem(BaseModel):
+    product_name: str
+    price: str
+    capacity: str
+    image_url: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    force_regenerate: bool = False
+
+class CacheInvalidateRequest(BaseModel):
+    product_name: Optional[str] = None
+    namespace: Optional[str] = None
 
 # Helper Functions (Adapted from create_proposal_v4.py)
-def search_product_info(product_name):
-    """Searches for product information using DuckDuckGo."""
-    logging.info(f"Searching for information on: {product_name}")
-    try:
-        with DDGS(timeout=15) as ddgs:
-            results = [r for r in ddgs.text(f"{product_name} 公式 特徴 レビュー", region='jp-jp', max_results=5)]
-        
-        context = ""
-        if results:
-            for r in results:
-                context += f"Title: {r['title']}\nSnippet: {r['body']}\nURL: {r['href']}\n\n"
-        else:
-             logging.warning("No search results found.")
-        return context
-    except Exception as e:
-        logging.error(f"Search failed: {e}")
-        return ""
+def generate_proposal_content_gemini(api_key, product_name, price, capacity, context, force_regenerate=False):
+    """Generates structured proposal content using Gemini API."""
+    return generate_proposal_json(api_key, product_name, price, capacity, context, force_regenerate=force_regenerate)
+
+def stream_proposal_content_gemini(api_key, product_name, price, capacity, context, force_regenerate=False):
+    """Streams proposal content from Gemini as (event, payload) pairs."""
+    return stream_proposal_json(api_key, product_name, price, capacity, context, force_regenerate=force_regenerate)
 
-def search_product_images(product_name, count=20):
-    """Searches for multiple product images using DuckDuckGo."""
-    logging.info(f"Searching for {count} images of: {product_name}")
+def process_batch_item(job, index, api_key, force_regenerate):
+    """Runs search → image → generation for one batch item on a batch worker thread."""
+    item = job.items[index]
+    job.update(index, "running")
     try:
-        with DDGS(timeout=15) as ddgs:
-            # Added "white background" to query to get cleaner images
-            results = [r for r in ddgs.images(f"{product_name} 商品画像 白背景", region='jp-jp', max_results=count)]
-        
-        if results:
-            return [r['image'] for r in results]
+        with background_work():
+            context = search_product_info(item["product_name"])
+            image_url = item["image_url"]
+            if not image_url:
+                image_url = best_image(search_product_images(item["product_name"], count=8)) or ""
+            data = generate_proposal_content_gemini(
+                api_key, item["product_name"], item["price"], item["capacity"], context,
+                force_regenerate=force_regenerate,
+            )
+        if not data:
+            raise RuntimeError("Failed to generate content")
     except Exception as e:
-        logging.error(f"Image search failed: {e}")
-    return []
+        logging.error(f"Batch {job.id} item {index} failed: {e}")
+        job.update(index, "failed", error=str(e))
+    else:
+        job.update(index, "done", result={"data": data, "image_url": image_url})
 
-def generate_proposal_content_gemini(api_key, product_name, price, capacity, context):
-    """Generates structured proposal content using Gemini API."""
-    logging.info("Generating content with Gemini...")
-    genai.configure(api_key=api_key)
-    
-    # Use the flash preview model as per previous configuration
-    model = genai.GenerativeModel('gemini-3-flash-preview') 
-
-    prompt = f"""
-    あなたはプロのセールスライターです。以下の商品情報をもとに、顧客（バイヤー）向けの提案書を作成するための情報をJSON形式で抽出・生成してください。
-    必ず有効なJSON形式で出力してください。Markdownのコードブロックは使用しないでください。
-
-    【商品名】
-    {product_name}
-
-    【価格】
-    {price}
-
-    【容量】
-    {capacity}
-
-    【検索された背景情報】
-    {context}
-
-    【要件】
-    1.  **catch_copy**: ひと目で興味を惹くキャッチコピー（20文字以内）。
-    2.  **benefits**: 主要なベネフィットを3つ。
-        - title: ベネフィットの見出し（15文字以内）
-        - detail: 詳細説明（50文字以内）
-    3.  **product_specs**: 商品の基本スペックや特徴を3〜5個の箇条書きで。
-    4.  **comment**: バイヤーへの推薦コメント（100文字程度）。ベネフィットを要約し、熱意を持って勧める文章。
-    5.  **target**: どのような顧客層に売れるか（例：30代主婦、健康志向の男性など）。
-
-    【出力JSONフォーマット】
-    {{
-        "product_name": "{product_name}",
-        "price": "{price}",
-        "capacity": "{capacity}",
-        "catch_copy": "...",
-        "benefits": [
-            {{"title": "...", "detail": "..."}},
-            {{"title": "...", "detail": "..."}},
-            {{"title": "...", "detail": "..."}}
-        ],
-        "product_specs": ["...", "..."],
-        "comment": "...",
-        "target": "..."
-    }}
-    """
+def save_proposal(data, image_url):
+    """Stores a generated proposal by content hash so /api/render can serve it."""
+    pid = proposal_id(data, image_url)
+    proposal_store.save(pid, {"data": data, "image_url": image_url})
+    return pid
+
+def load_proposal(pid):
+    """A saved proposal ({data, image_url}), or None for an unknown id."""
+    return proposal_store.load(pid)
+
+def require_api_key():
+    """Returns a configured Gemini API key (GOOGLE_API_KEYS or GOOGLE_API_KEY), or fails the request."""
+    api_keys = configured_api_keys()
+    if not api_keys and replaying():
+        return REPLAY_API_KEY
+    if not api_keys:
+        raise HTTPException(status_code=500, detail="Google API Key not found")
+    return api_keys[0]
+
+def get_batch_job(job_id):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+def get_batch_result(job_id, index):
+    job = get_batch_job(job_id)
+    if not 0 <= index < len(job.items):
+        raise HTTPException(status_code=404, detail="Batch item not found")
+    result = job.results.get(index)
+    if result is None:
+        raise HTTPException(status_code=409, detail=f"Batch item is {job.items[index]['status']}")
+    return result
+
+def proxied_image_url(image_url, variant="print"):
+    """Points a remote image at the local image proxy so pages never hotlink third-party hosts."""
+    if not image_url.startswith(("http://", "https://")):
+        return image_url
+    return f"/api/image-proxy?variant={variant}&url={quote(image_url, safe='')}"
+
+async def pdf_image_url(image_url):
+    """Local file URI of the print rendition for PDF rendering, or the remote URL if it cannot be fetched."""
+    path = await run_provider("images", image_store.localize, image_url) if image_url else None
+    return pathlib.Path(path).as_uri() if path else image_url
+
+def pdf_response(pdf, filename, headers=None):
+    return Response(content=pdf, media_type="application/pdf",
+                    headers={"Content-Disposition": f'inline; filename="{filename}"', **(headers or {})})
+
+async def render_pdf_documents(htmls):
+    """Renders HTML documents to PDF in parallel on the PDF worker processes."""
     try:
-        response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
-        return json.loads(response.text)
-    except Exception as e:
-        logging.error(f"Gemini generation failed: {e}")
-        return None
+        require_pdf()
+    except PdfUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    font = await run_provider("images", pdf_font)
+    return await asyncio.gather(*[run_provider("pdf", html_to_pdf, html, font=font) for html in htmls])
+
+def asset_response(asset, request, cache_control):
+    """Serves an in-memory asset in the best encoding the client accepts, or 304 if its copy is current."""
+    encoding, body = asset.negotiate(request.headers.get("accept-encoding"))
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding", "ETag": asset.etag(encoding)}
+    if asset.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=asset.media_type, headers=headers)
+
+def if_none_match(request):
+    """Entity tags of the If-None-Match header, compared weakly as RFC 9110 requires ('*' kept as is)."""
+    return {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",") if tag.strip()}
+
+def sse_event(event, data):
+    """Formats one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 # API Endpoints
 @app.get("/")
-async def read_root():
-    return HTMLResponse(content=open("static/index.html").read())
+async def read_root(request: Request):
+    return asset_response(static_assets.get("index.html"), request, REVALIDATE)
+
+@app.get("/assets/{name}")
+async def read_asset(name: str, request: Request):
+    asset, immutable = static_assets.resolve(name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return asset_response(asset, request, IMMUTABLE if immutable else REVALIDATE)
 
 @app.post("/api/search")
 async def api_search(request: ProductSearchRequest):
-    context = search_product_info(request.product_name)
+    context = await run_provider("search", search_product_info, request.product_name)
     return {"context": context}
 
+def image_count(count):
+    return max(1, min(count, MAX_IMAGE_COUNT))
+
 @app.post("/api/images")
 async def api_images(request: ImageSearchRequest):
-    images = search_product_images(request.product_name, count=request.count)
+    images = await run_provider("search", search_product_images, request.product_name,
+                               count=image_count(request.count))
     return {"images": images}
 
+@app.post("/api/prepare")
+async def api_prepare(request: PrepareRequest):
+    """Runs context and image search concurrently over one shared DDGS session.
+
+    Returns {"context", "images"} at once, or with `stream` set, one SSE event
+    per half as it completes followed by "done".
+    """
+    session = open_search_session()
+
+    async def search(name, func, **kwargs):
+        return name, await run_provider("search", func, request.product_name, ddgs=session, **kwargs)
+
+    def start_searches():
+        return [
+            search("context", search_product_info),
+            search("images", search_product_images, count=image_count(request.count)),
+        ]
+
+    if not request.stream:
+        with session:
+            return dict(await asyncio.gather(*start_searches()))
+
+    async def stream():
+        with session:
+            for finished in asyncio.as_completed(start_searches()):
+                name, result = await finished
+                yield sse_event(name, {name: result})
+            yield sse_event("done", {})
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.post("/api/generate")
 async def api_generate(request: GenerateProposalRequest):
-    api_key = os.environ.get('GOOGLE_API_KEY')
-    if not api_key:
-        raise HTTPException(status_code=500, detail="Google API Key not found")
+    api_key = require_api_key()
     
-    data = generate_proposal_content_gemini(
-        api_key, 
+    data = await run_provider(
+        "gemini",
+        generate_proposal_content_gemini,
+        api_key,
         request.product_name, 
         request.price, 
         request.capacity, 
-        request.context
+        request.context,
+        force_regenerate=request.force_regenerate,
     )
     
     if not data:
@@ -158,6 +318,232 @@ async def api_generate(request: GenerateProposalRequest):
         
     return data
 
+@app.post("/api/generate/stream")
+async def api_generate_stream(request: GenerateProposalRequest):
+    api_key = require_api_key()
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def produce():
+        # Runs on the Gemini executor; hands each event back to the event loop.
+        # Every field update is followed by the server-rendered preview so the
+        # browser never needs its own copy of the template.
+        emit = lambda event: loop.call_soon_threadsafe(queue.put_nowait, event)
+        partial = {"product_name": request.product_name, "price": request.price, "capacity": request.capacity}
+        try:
+            for event, payload in stream_proposal_content_gemini(
+                api_key, request.product_name, request.price, request.capacity, request.context,
+                force_regenerate=request.force_regenerate,
+            ):
+                if event == "field":
+                    partial[payload["key"]] = payload["value"]
+                elif event == "item":
+                    items = partial.setdefault(payload["key"], [])
+                    items.extend([None] * (payload["index"] + 1 - len(items)))
+                    items[payload["index"]] = payload["value"]
+                elif event == "done":
+                    pid = save_proposal(payload, request.image_url)
+                    emit(("html", {"html": render_proposal_fragment(payload, proxied_image_url(request.image_url))}))
+                    emit(("saved", {"proposal_id": pid, "url": f"/api/render/{pid}"}))
+                emit((event, payload))
+                if event in ("field", "item"):
+                    emit(("html", {"html": render_proposal_fragment(partial, proxied_image_url(request.image_url))}))
+        except Exception as e:
+            logging.error(f"Streaming generation failed: {e}")
+            emit(("error", {"detail": "Failed to generate content"}))
+        finally:
+            emit(None)
+
+    loop.run_in_executor(provider_executors["gemini"], produce)
+
+    async def stream():
+        while (event := await queue.get()) is not None:
+            yield sse_event(*event)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/api/proposals")
+async def api_save_proposal(request: SaveProposalRequest):
+    pid = await run_provider("storage", save_proposal, request.data, request.image_url)
+    return {"proposal_id": pid, "url": f"/api/render/{pid}"}
+
+@app.get("/api/render/{proposal_id}")
+async def api_render(proposal_id: str, request: Request, fragment: bool = False):
+    """Serves a stored proposal as HTML, revalidated by a strong ETag derived from its content.
+
+    The ETag only depends on the proposal id (a content hash), the template digest and
+    the variant, so a matching If-None-Match is answered with 304 before anything is
+    loaded or rendered, and a template change invalidates every copy. `*` only matches
+    a proposal that exists.
+    """
+    etag = f'"{proposal_id}.{template_digest()}{".fragment" if fragment else ""}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    tags = if_none_match(request)
+    if etag in tags:
+        return Response(status_code=304, headers=headers)
+
+    stored = await run_provider("storage", load_proposal, proposal_id)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Proposal not found")
+    if "*" in tags:
+        return Response(status_code=304, headers=headers)
+    render = render_proposal_fragment if fragment else render_proposal_html
+    return HTMLResponse(content=render(stored["data"], proxied_image_url(stored["image_url"])), headers=headers)
+
+@app.get("/api/render/{proposal_id}/bundle")
+async def api_render_bundle(proposal_id: str, request: Request):
+    """Downloads a stored proposal as one self-contained HTML file (embedded image and font subset)."""
+    etag = f'"{proposal_id}.{template_digest()}.bundle"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache",
+               "Content-Disposition": f'attachment; filename="proposal_{proposal_id}.html"'}
+    tags = if_none_match(request)
+    if etag in tags:
+        return Response(status_code=304, headers=headers)
+
+    stored = await run_provider("storage", load_proposal, proposal_id)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Proposal not found")
+    if "*" in tags:
+        return Response(status_code=304, headers=headers)
+    html = await run_provider("images", render_proposal_bundle, stored["data"], stored["image_url"])
+    return HTMLResponse(content=html, headers=headers)
+
+@app.get("/api/render/{proposal_id}/pdf")
+async def api_render_pdf(proposal_id: str, request: Request):
+    etag = f'"{proposal_id}.{template_digest()}.pdf"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    tags = if_none_match(request)
+    if etag in tags:
+        return Response(status_code=304, headers=headers)
+
+    stored = await run_provider("storage", load_proposal, proposal_id)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Proposal not found")
+    if "*" in tags:
+        return Response(status_code=304, headers=headers)
+    [pdf] = await render_pdf_documents([render_proposal_html(stored["data"], await pdf_image_url(stored["image_url"]))])
+    return pdf_response(pdf, f"proposal_{proposal_id}.pdf", headers)
+
+@app.post("/api/images/rank")
+async def api_rank_images(request: RankImagesRequest):
+    """Scores candidate images (resolution, aspect, white background, centering, text) best first."""
+    ranked = await run_provider("images", rank_images, request.urls[:MAX_RANKED_IMAGES])
+    return {"ranked": ranked, "suggested": ranked[0]["url"] if ranked and ranked[0]["score"] > 0 else None}
+
+@app.get("/api/image-proxy")
+async def api_image_proxy(url: str, variant: str = "thumb"):
+    """Downloads a remote image once into the content-addressed store and serves a rendition of it."""
+    if variant not in VARIANTS:
+        raise HTTPException(status_code=400, detail=f"Unknown variant: {variant}")
+    try:
+        digest = await run_provider("images", image_store.fetch, url)
+        path = await run_provider("images", image_store.variant, digest, variant)
+    except ImageFetchError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    # The URL's content could change upstream, so cache for a day; the digest URL is immutable.
+    headers = {"Cache-Control": "public, max-age=86400", "ETag": f'"{digest}.{variant}"',
+               "Content-Location": f"/api/images/{digest}/{variant}"}
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
+
+@app.get("/api/images/{digest}/{variant}")
+async def api_stored_image(digest: str, variant: str):
+    if not re.fullmatch(r"[0-9a-f]{64}", digest) or variant not in VARIANTS or not image_store.has(digest):
+        raise HTTPException(status_code=404, detail="Image not found")
+    path = await run_provider("images", image_store.variant, digest, variant)
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{digest}.{variant}"'}
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
+
+@app.post("/api/batch", status_code=202)
+async def api_batch_create(request: BatchRequest):
+    api_key = require_api_key()
+    if not request.items or len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch must contain 1-{MAX_BATCH_ITEMS} items")
+
+    job = BatchJob([item.model_dump() for item in request.items])
+    batch_jobs[job.id] = job
+    # Forget the oldest finished jobs so memory stays bounded
+    for old_id in [jid for jid, old in batch_jobs.items() if old.finished][:max(0, len(batch_jobs) - MAX_BATCH_JOBS)]:
+        del batch_jobs[old_id]
+
+    for index in range(len(job.items)):
+        batch_executor.submit(process_batch_item, job, index, api_key, request.force_regenerate)
+    logging.info(f"Queued batch {job.id} with {len(job.items)} items")
+    return {"job_id": job.id, "total": len(job.items)}
+
+@app.get("/api/batch/{job_id}")
+async def api_batch_status(job_id: str):
+    return get_batch_job(job_id).summary()
+
+@app.get("/api/batch/{job_id}/events")
+async def api_batch_events(job_id: str):
+    job = get_batch_job(job_id)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    listener = lambda event: loop.call_soon_threadsafe(queue.put_nowait, event)
+    pending = job.subscribe(listener)
+
+    async def stream():
+        try:
+            yield sse_event("status", job.summary(include_items=False))
+            # Finish on the last item's own event: job.finished turns true before it is queued
+            while pending:
+                event = await queue.get()
+                if event["status"] in ("done", "failed"):
+                    pending.discard(event["index"])
+                yield sse_event("item", event)
+            yield sse_event("done", job.summary(include_items=False))
+        finally:
+            job.unsubscribe(listener)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/batch/{job_id}/items/{index}")
+async def api_batch_item(job_id: str, index: int):
+    return get_batch_result(job_id, index)["data"]
+
+@app.get("/api/batch/{job_id}/items/{index}/html")
+async def api_batch_item_html(job_id: str, index: int):
+    result = get_batch_result(job_id, index)
+    return HTMLResponse(content=render_proposal_html(result["data"], proxied_image_url(result["image_url"])))
+
+@app.get("/api/batch/{job_id}/catalog.pdf")
+async def api_batch_catalog(job_id: str):
+    """Merges every finished proposal of a batch, in submission order, into one PDF."""
+    job = get_batch_job(job_id)
+    results = [job.results[index] for index in sorted(job.results)]
+    if not results:
+        raise HTTPException(status_code=409, detail="No finished proposals in this batch yet")
+    image_urls = await asyncio.gather(*[pdf_image_url(r["image_url"]) for r in results])
+    pdfs = await render_pdf_documents([render_proposal_html(r["data"], url) for r, url in zip(results, image_urls)])
+    catalog = await run_provider("pdf", merge_pdfs, pdfs)
+    return pdf_response(catalog, f"catalog_{job_id}.pdf")
+
+@app.get("/metrics")
+async def api_metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms, error counts, result counts and in-flight gauges."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/admin/cache/stats")
+async def api_cache_stats():
+    return shared_cache.stats()
+
+@app.get("/api/admin/search/stats")
+async def api_search_stats():
+    return search_stats()
+
+@app.get("/api/admin/gemini/stats")
+async def api_gemini_stats():
+    if not configured_api_keys():
+        raise HTTPException(status_code=500, detail="Google API Key not found")
+    return get_client_manager(MODEL_NAME).stats()
+
+@app.post("/api/admin/cache/invalidate")
+async def api_cache_invalidate(request: CacheInvalidateRequest):
+    deleted = await run_provider("storage", shared_cache.invalidate, namespace=request.namespace, product_name=request.product_name)
+    logging.info(f"Invalidated {deleted} cache entries (product={request.product_name}, namespace={request.namespace})")
+    return {"deleted": deleted}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from fake_providers import FAKE_API_KEY, FakeProviderConfig, offline_providers
+from profiling import percentile
+
+PRICE = "3,980円"
+CAPACITY = "720ml"
+CONTEXT = "Title: ベンチマーク商品\nSnippet: 容量720mlの日本酒。華やかな香りが特徴。\nURL: https://example.jp/\n\n"
+
+
+async def _post(client, path, payload):
+    response = await client.post(path, json=payload)
+    response.raise_for_status()
+    return response.json()
+
+
+async def api_search(client, product_name):
+    """POST /api/prepare: context fan-out and image search over one session."""
+    return await _post(client, "/api/prepare", {"product_name": product_name, "count": 8})
+
+
+async def api_generate(client, product_name):
+    """POST /api/generate with a fixed context."""
+    return await _post(client, "/api/generate", {"product_name": product_name, "price": PRICE, "capacity": CAPACITY,
+                                                 "image_url": "", "context": CONTEXT})
+
+
+async def api_flow(client, product_name):
+    """What the UI does for one product: prepare → rank images → generate → save → render."""
+    prepared = await api_search(client, product_name)
+    ranked = await _post(client, "/api/images/rank", {"urls": prepared["images"]})
+    image_url = ranked["suggested"] or ""
+    data = await _post(client, "/api/generate", {"product_name": product_name, "price": PRICE, "capacity": CAPACITY,
+                                                 "image_url": image_url, "context": prepared["context"]})
+    saved = await _post(client, "/api/proposals", {"data": data, "image_url": image_url})
+    response = await client.get(saved["url"])
+    response.raise_for_status()
+
+
+API_SCENARIOS = {"search": api_search, "generate": api_generate, "flow": api_flow}
+
+
+def summarize(scenario, concurrency, latencies, errors, elapsed):
+    """Throughput and latency percentiles (seconds) of one concurrency level; failed requests count as errors only."""
+    row = {"scenario": scenario, "concurrency": concurrency, "requests": len(latencies) + errors, "errors": errors,
+           "elapsed": round(elapsed, 3), "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0}
+    for pct in (50, 95, 99):
+        row[f"p{pct}"] = round(percentile(latencies, pct), 4) if latencies else None
+    return row
+
+
+def product_names(level, count, distinct):
+    """One name per request (every request misses the caches) or `distinct` names cycled."""
+    return [f"ベンチマーク商品 {level}-{i % distinct if distinct else i}" for i in range(count)]
+
+
+async def run_api_level(app, scenario, concurrency, names):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(client, name):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await API_SCENARIOS[scenario](client, name)
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                logging.debug(f"{scenario} request failed: {e}")
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, name) for name in names))
+        return latencies, errors, time.perf_counter() - start
+
+
+def run_cli_level(concurrency, names, output_dir):
+    """create_proposal (the batch pipeline) on `concurrency` worker threads."""
+    from create_proposal_v4 import create_proposal
+    latencies, errors = [], 0
+
+    def one(name):
+        start = time.perf_counter()
+        create_proposal(FAKE_API_KEY, name, PRICE, CAPACITY, output_dir=output_dir)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(one, name) for name in names]:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                logging.debug(f"CLI pipeline failed: {e}")
+                errors += 1
+    return latencies, errors, time.perf_counter() - start
+
+
+def run_benchmark(scenarios, levels, rounds, config, distinct=0, rate_limits=False):
+    """Runs every scenario at each concurrency level against the fake providers; returns the result rows."""
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="proposal-bench-") as workdir:
+        modules = ()
+        if any(scenario in API_SCENARIOS for scenario in scenarios):
+            import app_v5
+            modules = (app_v5,)
+        with offline_providers(config, workdir, rate_limits=rate_limits, modules=modules):
+            for scenario in scenarios:
+                for concurrency in levels:
+                    names = product_names(f"{scenario}{concurrency}", concurrency * rounds, distinct)
+                    if scenario == "cli":
+                        result = run_cli_level(concurrency, names, workdir)
+                    else:
+                        result = asyncio.run(run_api_level(modules[0].app, scenario, concurrency, names))
+                    rows.append(summarize(scenario, concurrency, *result))
+                    print(format_row(rows[-1]), flush=True)
+    return rows
+
+
+def format_header():
+    return (f"{'scenario':<10} {'conc':>5} {'reqs':>5} {'errors':>6} {'req/s':>8} "
+            f"{'p50 (s)':>9} {'p95 (s)':>9} {'p99 (s)':>9}")
+
+
+def format_row(row):
+    latency = lambda value: f"{value:>9.3f}" if value is not None else f"{'-':>9}"
+    return (f"{row['scenario']:<10} {row['concurrency']:>5} {row['requests']:>5} {row['errors']:>6} "
+            f"{row['throughput']:>8.2f} {latency(row['p50'])} {latency(row['p95'])} {latency(row['p99'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='DuckDuckGo/Geminiをローカルの疑似サービスに置き換えたオフライン負荷ベンチマーク')
+    parser.add_argument('--scenario', action='append', choices=[*API_SCENARIOS, 'cli'],
+                        help='計測するシナリオ（複数指定可。既定: flow と cli）')
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help='同時実行数の段階（カンマ区切り）')
+    parser.add_argument('--rounds', type=int, default=4, help='各段階で同時実行数×この回数のリクエストを送る')
+    parser.add_argument('--products', type=int, default=0, help='商品名の種類数（0: 全リクエスト別商品でキャッシュが効かない）')
+    parser.add_argument('--search-latency', type=float, default=0.2, help='検索1回の遅延の中央値（秒）')
+    parser.add_argument('--image-latency', type=float, default=0.05, help='画像ダウンロードの遅延の中央値（秒）')
+    parser.add_argument('--gemini-latency', type=float, default=0.8, help='Gemini応答の遅延の中央値（秒）')
+    parser.add_argument('--jitter', type=float, default=0.3, help='遅延のばらつき（対数正規分布のσ）')
+    parser.add_argument('--search-error-rate', type=float, default=0.0, help='検索の失敗率 (0-1)')
+    parser.add_argument('--image-error-rate', type=float, default=0.0, help='画像ダウンロードの失敗率 (0-1)')
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0, help='Gemini呼び出しの失敗率 (0-1)')
+    parser.add_argument('--snippet-chars', type=int, default=200, help='検索結果1件の本文の文字数')
+    parser.add_argument('--image-size', type=int, default=800, help='画像の一辺のピクセル数')
+    parser.add_argument('--response-chars', type=int, default=600, help='Gemini応答JSONの文字数')
+    parser.add_argument('--rate-limits', action='store_true', help='DDGSのトークンバケットとGeminiのRPM/TPM制限を有効のまま計測する')
+    parser.add_argument('--seed', type=int, default=0, help='遅延と失敗の乱数シード')
+    parser.add_argument('--json', help='結果をJSONで保存するパス')
+    args = parser.parse_args(argv)
+
+    # Before app_v5 is imported, so its INFO-level basicConfig does not apply
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = FakeProviderConfig(
+        search_latency=args.search_latency, image_latency=args.image_latency, gemini_latency=args.gemini_latency,
+        jitter=args.jitter, search_error_rate=args.search_error_rate, image_error_rate=args.image_error_rate,
+        gemini_error_rate=args.gemini_error_rate, snippet_chars=args.snippet_chars, image_size=args.image_size,
+        response_chars=args.response_chars, seed=args.seed)
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    scenarios = args.scenario or ['flow', 'cli']
+
+    print(format_header())
+    rows = run_benchmark(scenarios, levels, args.rounds, config, distinct=args.products, rate_limits=args.rate_limits)
+    if args.json:
+        settings = {key: value for key, value in vars(args).items() if key != 'json'}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"settings": settings, "results": rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import time
+from jinja2 import Template
+from proposal_render import TEMPLATE_DIR, render_proposal_html
+
+SAMPLE_DATA = {
+    "product_name": "獺祭 純米大吟醸 磨き二割三分",
+    "price": "5,500円",
+    "capacity": "720ml",
+    "catch_copy": "極限の磨きが生む、至高の一滴",
+    "benefits": [
+        {"title": "華やかな香り", "detail": "果実を思わせる上品な香りと、澄んだ甘みが広がります。"},
+        {"title": "贈答に最適", "detail": "圧倒的な知名度で、ギフト需要に確実に応えます。"},
+        {"title": "食中酒として", "detail": "和食から洋食まで、幅広い料理と好相性です。"},
+    ],
+    "product_specs": ["精米歩合23%", "山田錦100%使用", "アルコール分16度", "要冷蔵"],
+    "comment": "日本酒の最高峰として国内外で評価の高い一本です。贈答需要の高い時期の目玉商品として自信を持っておすすめします。",
+    "target": "贈答需要のある40〜60代、日本酒愛好家",
+}
+IMAGE_URL = "https://example.com/dassai.jpg"
+
+
+def render_inline_per_call(source):
+    """Previous behaviour: build a jinja2.Template from the source string for every proposal."""
+    return Template(source).render(data=SAMPLE_DATA, image_url=IMAGE_URL)
+
+
+def measure(label, render, count):
+    render()  # warm-up (first compile / bytecode cache load)
+    start = time.perf_counter()
+    for _ in range(count):
+        render()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed
+    print(f"{label:<28} {count:>6} proposals  {elapsed:7.3f}s  {rate:9.1f} proposals/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='提案書HTMLレンダリングのマイクロベンチマーク')
+    parser.add_argument('--count', type=int, default=2000, help='レンダリングする提案書の数')
+    args = parser.parse_args()
+
+    with open(f"{TEMPLATE_DIR}/proposal.html", encoding='utf-8') as f:
+        source = f.read()
+
+    before = measure("before (Template per call)", lambda: render_inline_per_call(source), args.count)
+    after = measure("after (shared Environment)", lambda: render_proposal_html(SAMPLE_DATA, IMAGE_URL), args.count)
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
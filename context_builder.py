@@ -0,0 +1,114 @@
+import os
+import re
+import logging
+import unicodedata
+from urllib.parse import urlparse
+from gemini_client import estimate_tokens
+from profiling import record
+from proposal_cache import shared_cache
+from text_rank import text_tokens
+
+# Maximum (estimated) tokens of search context pasted into the Gemini prompt.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 600))
+# Snippets sharing at least this fraction of their character trigrams are duplicates.
+DUPLICATE_SIMILARITY = 0.7
+
+# Shop/SEO boilerplate that carries no product information.
+BOILERPLATE_PATTERNS = [
+    r'【[^】]*(?:送料無料|ポイント|クーポン|楽天|最安|公式通販|セール|即日|あす楽)[^】]*】',
+    r'(?:送料無料|ポイント\d+倍|最大\d+%\s*(?:OFF|オフ)|クーポン(?:配布中|あり)?|あす楽(?:対応)?|即日発送)',
+    r'(?:楽天市場|Amazon\.co\.jp|Yahoo!ショッピング|価格\.com)\s*[-|:：]?',
+    r'\d{4}[/年]\d{1,2}[/月]\d{1,2}日?',
+    r'(?:\.\.\.|…)+',
+    r'[|｜]\s*(?:通販|ショッピング|公式サイト)[^|｜]*$',
+]
+_boilerplate = [re.compile(pattern) for pattern in BOILERPLATE_PATTERNS]
+_block = re.compile(r'Title: (?P<title>.*?)\nSnippet: (?P<snippet>.*?)\nURL: (?P<url>\S*)', re.S)
+
+
+def parse_snippets(context):
+    """Splits search context into [{title, snippet, url}]; free text (e.g. edited in the UI) becomes paragraphs."""
+    snippets = [match.groupdict() for match in _block.finditer(context)]
+    if snippets:
+        return snippets
+    return [{'title': '', 'snippet': part.strip(), 'url': ''} for part in re.split(r'\n\s*\n', context) if part.strip()]
+
+
+def clean_text(text):
+    for pattern in _boilerplate:
+        text = pattern.sub(' ', text)
+    return re.sub(r'\s+', ' ', text).strip(' -|｜:：')
+
+
+def _trigrams(text):
+    text = re.sub(r'\s+', '', unicodedata.normalize('NFKC', text).lower())
+    return {text[i:i + 3] for i in range(max(1, len(text) - 2))}
+
+
+def relevance(product_name, snippet):
+    """Share of the product name's tokens found in the snippet, with title matches counting double."""
+    wanted = set(text_tokens(product_name))
+    if not wanted:
+        return 0.0
+    title, body = set(text_tokens(snippet['title'])), set(text_tokens(snippet['snippet']))
+    return (2 * len(wanted & title) + len(wanted & body)) / (3 * len(wanted))
+
+
+def build_context(product_name, context, budget=CONTEXT_TOKEN_BUDGET):
+    """Turns raw search context into a compact, relevance-ordered block within `budget` tokens.
+
+    Boilerplate is stripped, near-identical snippets are dropped and the most
+    relevant snippets are kept until the budget is reached. Returns
+    (context, stats) where stats reports estimated tokens before/after.
+    """
+    original_tokens = estimate_tokens(context) if context else 0
+    candidates, seen = [], []
+    for snippet in parse_snippets(context or ''):
+        snippet = {
+            'title': clean_text(snippet['title']),
+            'snippet': clean_text(snippet['snippet']),
+            'url': urlparse(snippet['url']).netloc if snippet['url'] else '',
+        }
+        if not snippet['snippet'] and not snippet['title']:
+            continue
+        grams = _trigrams(snippet['title'] + snippet['snippet'])
+        if any(len(grams & other) / max(1, min(len(grams), len(other))) >= DUPLICATE_SIMILARITY for other in seen):
+            continue
+        seen.append(grams)
+        candidates.append(snippet)
+
+    # Stable sort keeps search order among equally relevant snippets; snippets that do not
+    # mention the product at all are dropped as long as some other snippet does
+    scores = {id(s): relevance(product_name, s) for s in candidates}
+    if any(scores.values()):
+        candidates = [s for s in candidates if scores[id(s)] > 0]
+    candidates.sort(key=lambda s: scores[id(s)], reverse=True)
+    blocks, used = [], 0
+    for snippet in candidates:
+        lines = [f"- {snippet['title'] or snippet['snippet']}"]
+        if snippet['title'] and snippet['snippet']:
+            lines.append(f"  {snippet['snippet']}")
+        if snippet['url']:
+            lines.append(f"  ({snippet['url']})")
+        block = '\n'.join(lines)
+        tokens = estimate_tokens(block)
+        if used + tokens > budget:
+            continue  # a shorter snippet further down may still fit
+        blocks.append(block)
+        used += tokens
+
+    built = '\n'.join(blocks)
+    stats = {'snippets': len(blocks), 'original_tokens': original_tokens, 'tokens': estimate_tokens(built) if built else 0}
+    stats['tokens_saved'] = max(0, original_tokens - stats['tokens'])
+    return built, stats
+
+
+def prompt_context(product_name, context):
+    """build_context for a generation request, logging and counting the tokens saved."""
+    built, stats = build_context(product_name, context)
+    shared_cache.record('prompt_context', 'requests')
+    shared_cache.record('prompt_context', 'tokens_saved', stats['tokens_saved'])
+    record('context_tokens_saved', stats['tokens_saved'])
+    logging.info(f"Prompt context for {product_name}: {stats['original_tokens']} -> {stats['tokens']} tokens "
+                 f"({stats['tokens_saved']} saved, {stats['snippets']} snippets)")
+    return built
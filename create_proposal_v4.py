@@ -1,12 +1,26 @@
 import os
+import re
+import sys
 import argparse
-import json
+import shutil
 import logging
+import tempfile
 import subprocess
-from ddgs import DDGS
-import google.generativeai as genai
-from jinja2 import Template
+from contextlib import nullcontext
 from dotenv import load_dotenv
+import product_search
+from product_search import search_product_info
+from proposal_generation import generate_proposal_json
+from gemini_client import configured_api_keys
+from proposal_batch import BatchJournal, item_key, read_catalog, run_batch
+from proposal_render import render_proposal_html, template_env
+from image_ranking import best_image
+from image_store import image_store
+from proposal_bundle import render_proposal_bundle
+import profiling
+import provider_cassette
+from profiling import RunProfile, cprofile_to, stage
+from proposal_pdf import PdfUnavailable, merge_pdfs, render_pdfs, require_pdf
 
 # Load hidden environment variables
 # Load hidden environment variables from script directory
@@ -15,78 +29,22 @@ load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-
-def search_product_info(product_name):
-    """Searches for product information using DuckDuckGo."""
-    logging.info(f"Searching for information on: {product_name}")
-    try:
-        # Use a region valid for Japan to get Japanese results
-        with DDGS(timeout=15) as ddgs:
-            results = [r for r in ddgs.text(f"{product_name} 公式 特徴 レビュー", region='jp-jp', max_results=5)]
-        
-        context = ""
-        if results:
-            for r in results:
-                context += f"Title: {r['title']}\nSnippet: {r['body']}\nURL: {r['href']}\n\n"
-        else:
-             logging.warning("No search results found.")
-        return context
-    except Exception as e:
-        logging.error(f"Search failed: {e}")
-        return ""
+PLACEHOLDER_IMAGE = "https://placehold.co/600x400?text=No+Image+Found"
+# Candidates scored when the image is picked automatically (--auto-image / batch)
+AUTO_IMAGE_CANDIDATES = 8
 
 def search_product_images(product_name, count=5):
     """Searches for multiple product images using DuckDuckGo."""
-    logging.info(f"Searching for {count} images of: {product_name}")
-    try:
-        with DDGS(timeout=15) as ddgs:
-             results = [r for r in ddgs.images(f"{product_name} 商品画像 白背景", region='jp-jp', max_results=count)]
-        
-        if results:
-            return [r['image'] for r in results]
-    except Exception as e:
-        logging.error(f"Image search failed: {e}")
-    return ["https://placehold.co/600x400?text=No+Image+Found"]
+    return product_search.search_product_images(product_name, count=count) or [PLACEHOLDER_IMAGE]
 
 def select_image_interactively(product_name, image_urls):
     """Allows the user to select an image from a list by previewing them in a browser."""
     if not image_urls or image_urls[0].startswith("https://placehold.co"):
-        return image_urls[0] if image_urls else "https://placehold.co/600x400?text=No+Image+Found"
+        return image_urls[0] if image_urls else PLACEHOLDER_IMAGE
 
     preview_filename = "image_preview.html"
     
-    template_str = """
-    <!DOCTYPE html>
-    <html lang="ja">
-    <head>
-        <meta charset="UTF-8">
-        <title>画像選択: {{ product_name }}</title>
-        <style>
-            body { font-family: sans-serif; padding: 20px; background: #f0f2f5; }
-            .grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 20px; }
-            .card { background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1); text-align: center; }
-            img { max-width: 100%; height: 200px; object-fit: contain; border-radius: 4px; }
-            .num { font-size: 24px; font-weight: bold; margin-bottom: 10px; color: #3498db; }
-            h1 { text-align: center; color: #2c3e50; }
-        </style>
-    </head>
-    <body>
-        <h1>どの画像を使用しますか？</h1>
-        <p style="text-align: center;">ターミナルに戻って番号を入力してください。</p>
-        <div class="grid">
-            {% for url in image_urls %}
-            <div class="card">
-                <div class="num">{{ loop.index }}</div>
-                <img src="{{ url }}" alt="Option {{ loop.index }}">
-                <div style="font-size: 10px; color: #888; margin-top: 5px; word-break: break-all;">{{ url }}</div>
-            </div>
-            {% endfor %}
-        </div>
-    </body>
-    </html>
-    """
-    
-    template = Template(template_str)
+    template = template_env.get_template('image_preview.html')
     with open(preview_filename, 'w', encoding='utf-8') as f:
         f.write(template.render(product_name=product_name, image_urls=image_urls))
     
@@ -116,414 +74,259 @@ def select_image_interactively(product_name, image_urls):
                 return image_urls[idx]
         print("無効な入力です。もう一度入力してください。")
 
-def generate_proposal_content(api_key, product_name, price, capacity, context):
+def select_image_automatically(image_urls):
+    """Picks the best-scoring image without prompting, for unattended runs (see image_ranking)."""
+    if not image_urls or image_urls[0] == PLACEHOLDER_IMAGE:
+        return PLACEHOLDER_IMAGE
+    selected = best_image(image_urls)
+    logging.info(f"Auto-selected image: {selected}")
+    return selected
+
+def generate_proposal_content(api_key, product_name, price, capacity, context, force_regenerate=False):
     """Generates structured proposal content using Gemini API."""
-    logging.info("Generating content with Gemini...")
-    genai.configure(api_key=api_key)
-    
-    # Use the user-specified flash preview model
-    model = genai.GenerativeModel('gemini-3-flash-preview') 
-
-    prompt = f"""
-    あなたはプロのセールスライターです。以下の商品情報をもとに、顧客（バイヤー）向けの提案書を作成するための情報をJSON形式で抽出・生成してください。
-    必ず有効なJSON形式で出力してください。Markdownのコードブロックは使用しないでください。
-
-    【商品名】
-    {product_name}
-
-    【価格】
-    {price}
-
-    【容量】
-    {capacity}
-
-    【検索された背景情報】
-    {context}
-
-    【要件】
-    1.  **catch_copy**: ひと目で興味を惹くキャッチコピー（20文字以内）。
-    2.  **benefits**: 主要なベネフィットを3つ。
-        - title: ベネフィットの見出し（15文字以内）
-        - detail: 詳細説明（50文字以内）
-    3.  **product_specs**: 商品の基本スペックや特徴を3〜5個の箇条書きで。
-    4.  **comment**: バイヤーへの推薦コメント（100文字程度）。ベネフィットを要約し、熱意を持って勧める文章。
-    5.  **target**: どのような顧客層に売れるか（例：30代主婦、健康志向の男性など）。
-
-    【出力JSONフォーマット】
-    {{
-        "product_name": "{product_name}",
-        "price": "{price}",
-        "capacity": "{capacity}",
-        "catch_copy": "...",
-        "benefits": [
-            {{"title": "...", "detail": "..."}},
-            {{"title": "...", "detail": "..."}},
-            {{"title": "...", "detail": "..."}}
-        ],
-        "product_specs": ["...", "..."],
-        "comment": "...",
-        "target": "..."
-    }}
-    """
+    return generate_proposal_json(api_key, product_name, price, capacity, context, force_regenerate=force_regenerate)
 
-    try:
-        response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
-        return json.loads(response.text)
-    except Exception as e:
-        logging.error(f"Gemini generation failed: {e}")
-        return None
+def create_html_output(data, image_url, output_filename, bundle=False):
+    """Generates an HTML proposal document.
 
-def create_html_output(data, image_url, output_filename):
-    """Generates an HTML proposal document."""
-    logging.info(f"Creating HTML output: {output_filename}")
-    
-    template_str = """
-    <!DOCTYPE html>
-    <html lang="ja">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>商品提案書: {{ data.product_name }}</title>
-        <style>
-            @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+JP:wght@400;700&display=swap');
-            
-            /* A4 Print Settings */
-            @page { size: A4 portrait; margin: 0; }
-            
-            body { 
-                font-family: 'Noto Sans JP', sans-serif; 
-                line-height: 1.4; /* Tighter line height */
-                color: #333; 
-                background-color: #f4f6f8; 
-                margin: 0; 
-                padding: 20px;
-                display: flex;
-                justify-content: center;
-                -webkit-print-color-adjust: exact;
-                min-width: 210mm; /* Force min width for browser view */
-            }
-            
-            .container { 
-                width: 210mm; 
-                height: 296mm; /* Strict A4 height */
-                box-sizing: border-box;
-                background: #fff; 
-                padding: 35mm 20mm 20mm 20mm; /* Increased padding */
-                margin: 0 auto; 
-                box-shadow: 0 10px 30px rgba(0,0,0,0.08); 
-                position: relative;
-                overflow: hidden;
-                display: flex;
-                flex-direction: column;
-            }
-
-            /* Print-specific overrides */
-            @media print {
-                body { background-color: #fff; padding: 0; }
-                .container { 
-                    width: 100%; 
-                    height: 100%; 
-                    margin: 0; 
-                    box-shadow: none; 
-                    padding: 30mm 15mm 15mm 15mm; /* Reduced padding slightly */
-                    zoom: 0.95; /* Scale down to 95% */
-                }
-                .no-print { display: none !important; }
-            }
-
-            h1 { 
-                color: #2c3e50; 
-                font-size: 24px; /* Increased */
-                border-bottom: 2px solid #eee; 
-                padding-bottom: 10px; /* Increased */
-                margin-bottom: 15px; /* Increased */
-                text-align: center; 
-                letter-spacing: 0.05em; 
-                margin-top: 0;
-            }
-            
-            .hero-section { display: flex; flex-direction: column; align-items: center; margin-bottom: 10px; flex-shrink: 0; }
-            
-            .catch-copy { 
-                font-size: 20px; /* Increased */
-                font-weight: bold; 
-                background: linear-gradient(45deg, #e74c3c, #c0392b); 
-                -webkit-background-clip: text; 
-                -webkit-text-fill-color: transparent; 
-                text-align: center; 
-                margin: 25px 0 35px 0; /* Balanced large margins */
-                line-height: 1.4;
-                padding: 0 5px;
-                flex-shrink: 0;
-            }
-            
-            .product-image img { 
-                max-width: 100%; 
-                height: 225px; 
-                object-fit: contain;
-                border-radius: 8px; 
-                box-shadow: 0 4px 12px rgba(0,0,0,0.1); 
-            }
-
-            .info-grid { 
-                display: grid; 
-                grid-template-columns: 1fr 1fr; 
-                gap: 25px; /* Increased gap */
-                margin-bottom: 25px; 
-                flex-grow: 1; 
-            }
-            
-            .section-title { 
-                font-size: 15px; /* Restored */
-                color: #34495e; 
-                border-left: 4px solid #3498db; 
-                padding-left: 10px; 
-                margin-bottom: 10px; 
-                font-weight: bold; 
-            }
-            
-            .benefit-card { 
-                background: #f8fbff; 
-                border-radius: 6px; 
-                padding: 12px; /* Increased padding */
-                margin-bottom: 12px; 
-                border: 1px solid #e1e8ed; 
-                page-break-inside: avoid; 
-            }
-            .benefit-title { 
-                color: #2980b9; 
-                font-weight: bold; 
-                font-size: 13px; /* Restored */
-                margin-bottom: 4px; 
-                display: flex; 
-                align-items: center; 
-            }
-            .benefit-title::before { content: '✓'; margin-right: 6px; font-weight: bold; }
-            .benefit-detail { font-size: 11px; color: #555; line-height: 1.4; } /* Restored */
-
-            .specs-box { 
-                background: #fafafa; 
-                padding: 15px; /* Increased padding */
-                border-radius: 8px; 
-                border: 1px solid #eee; 
-                height: fit-content; 
-            }
-            .specs-list { list-style: none; padding: 0; margin: 0; }
-            .specs-list li { 
-                margin-bottom: 6px; 
-                padding-bottom: 6px; 
-                border-bottom: 1px dashed #ddd; 
-                font-size: 11px; /* Restored */
-            }
-            .specs-list li:last-child { border-bottom: none; }
-            
-            .price-target-box { 
-                background: #2c3e50; 
-                color: white; 
-                padding: 12px; 
-                border-radius: 6px; 
-                margin-top: 15px; 
-                text-align: center; 
-            }
-            .price-group { 
-                color: #f1c40f; 
-                font-weight: bold; 
-            }
-            .price-label { font-size: 13px; }
-            .price-val { font-size: 20px; margin: 0 2px; }
-            .tax-label { font-size: 11px; }
-            
-            .target-val { font-size: 11px; opacity: 0.9; margin-top: 4px; }
-
-            .comment-section { 
-                background: #fffbe6; 
-                padding: 20px; 
-                border-radius: 8px; 
-                position: relative; 
-                border: 1px solid #fae588; 
-                page-break-inside: avoid; 
-                flex-shrink: 0;
-                margin-top: auto; 
-                margin-bottom: 10mm;
-            }
-            .comment-section::before { 
-                content: 'RECOMMEND'; 
-                position: absolute; 
-                top: -10px; 
-                left: 20px; 
-                background: #f1c40f; 
-                color: #fff; 
-                padding: 3px 10px; 
-                font-size: 11px; 
-                font-weight: bold; 
-                border-radius: 4px; 
-            }
-            .comment-text { font-style: italic; color: #5d5d5d; line-height: 1.6; font-size: 13px; }
-
-            /* Print Button Style */
-            .print-btn-container {
-                position: fixed;
-                top: 20px;
-                right: 20px;
-                z-index: 1000;
-            }
-            .print-btn {
-                background-color: #3498db;
-                color: white;
-                border: none;
-                padding: 10px 20px;
-                border-radius: 5px;
-                font-weight: bold;
-                cursor: pointer;
-                box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-                transition: background 0.3s;
-                font-size: 14px;
-                display: flex;
-                align-items: center;
-                gap: 8px;
-            }
-            .print-btn:hover { background-color: #2980b9; }
-            
-            /* Company Header Info */
-            .company-header {
-                position: absolute;
-                top: 10mm;
-                right: 15mm;
-                text-align: right;
-                font-size: 9px;
-                color: #555;
-                font-family: "Hiragino Sans", "Hiragino Kaku Gothic ProN", Meiryo, sans-serif;
-                line-height: 1.2;
-            }
-            .company-name {
-                font-size: 11px;
-                font-weight: bold;
-                color: #333;
-                margin-bottom: 2px;
-                letter-spacing: 0.05em;
-            }
-
-            @media (max-width: 768px) {
-                /* No responsive adjustments needed for fixed A4 */
-            }
-        </style>
-    </head>
-    <body>
-        <div class="print-btn-container no-print">
-            <button class="print-btn" onclick="window.print()">
-                🖨️ 印刷 / PDF保存
-            </button>
-        </div>
-
-        <div class="container">
-            <!-- Company Info Header -->
-            <div class="company-header">
-                <div class="company-name">株式会社よつや</div>
-                <div>TEL 045-593-5547</div>
-                <div>FAX 045-590-1171</div>
-                <div>Mail: yotsuya.center@gmail.com</div>
-            </div>
-
-            <h1>商品提案書</h1>
-            
-            <div class="hero-section">
-                <div class="product-image">
-                    <img src="{{ image_url }}" alt="{{ data.product_name }}">
-                </div>
-            </div>
-
-            <div class="catch-copy">
-                {{ data.catch_copy }}
-            </div>
-
-            <div class="info-grid">
-                <div>
-                    <div class="section-title">お客様への3つのベネフィット</div>
-                    {% for benefit in data.benefits %}
-                    <div class="benefit-card">
-                        <div class="benefit-title">{{ benefit.title }}</div>
-                        <div class="benefit-detail">{{ benefit.detail }}</div>
-                    </div>
-                    {% endfor %}
-                </div>
-
-                <div>
-                    <div class="section-title">商品情報</div>
-                    <div class="specs-box">
-                        <h3 style="margin-top: 0; font-size: 16px;">{{ data.product_name }}</h3>
-                        <ul class="specs-list">
-                        {% for spec in data.product_specs %}
-                            <li>{{ spec }}</li>
-                        {% endfor %}
-                        </ul>
-                        
-                        <div class="price-target-box">
-                            <div>{{ data.capacity }}　<span class="price-group"><span class="price-label">納品価格</span> <span class="price-val">{{ data.price }}</span><span class="tax-label">(税別)</span></span></div>
-                            <div class="target-val">ターゲット: {{ data.target }}</div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-
-            <div class="comment-section">
-                <div class="comment-text">
-                    "{{ data.comment }}"
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
+    With `bundle`, the file is fully self-contained (embedded image and font subset).
     """
-    
-    template = Template(template_str)
-    html_content = template.render(data=data, image_url=image_url)
+    logging.info(f"Creating HTML output: {output_filename}")
+    if bundle:
+        html_content = render_proposal_bundle(data, image_url)
+    else:
+        # Point the proposal at a local print-resolution copy so it renders offline
+        # (not in record/replay mode, where replays must not download anything)
+        local_image = None
+        if image_url and not provider_cassette.bypasses_cache():
+            local_image = image_store.localize(image_url)
+        if local_image:
+            # Copied next to the HTML: the store may evict its print rendition later
+            output_dir = os.path.dirname(os.path.abspath(output_filename))
+            copy = os.path.join(output_dir, 'images', os.path.basename(local_image))
+            if not os.path.exists(copy):
+                os.makedirs(os.path.dirname(copy), exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(copy), prefix='.tmp-')
+                os.close(fd)
+                shutil.copyfile(local_image, tmp)
+                os.replace(tmp, copy)  # batch workers may copy the same image at once
+            image_url = os.path.relpath(copy, output_dir)
+        html_content = render_proposal_html(data, image_url)
     
     with open(output_filename, 'w', encoding='utf-8') as f:
         f.write(html_content)
     logging.info(f"Proposal saved to {output_filename}")
 
+def create_pdf_outputs(html_paths, catalog_path=None, per_product=True):
+    """Converts proposal HTML files to PDF on the worker-process pool.
+
+    Writes a .pdf next to each HTML file and/or merges them, in order, into one catalog PDF.
+    """
+    htmls = []
+    for path in html_paths:
+        with open(path, encoding='utf-8') as f:
+            htmls.append(f.read())
+    logging.info(f"Rendering {len(htmls)} PDF(s)")
+    # Locally stored images are referenced relative to each HTML file
+    pdfs = render_pdfs(htmls, base_urls=[os.path.dirname(os.path.abspath(path)) + os.sep for path in html_paths])
+    written = []
+    if per_product:
+        for path, pdf in zip(html_paths, pdfs):
+            pdf_path = os.path.splitext(path)[0] + '.pdf'
+            with open(pdf_path, 'wb') as f:
+                f.write(pdf)
+            written.append(pdf_path)
+    if catalog_path:
+        with open(catalog_path, 'wb') as f:
+            f.write(merge_pdfs(pdfs))
+        written.append(catalog_path)
+    for path in written:
+        logging.info(f"PDF saved to {path}")
+    return written
+
+def add_provider_arguments(parser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', metavar='CASSETTE', help='検索結果とGeminiの応答をカセットファイルに記録する')
+    group.add_argument('--replay', metavar='CASSETTE', help='記録済みのカセットから応答を再生する（ネットワーク不要）')
+
+def resolve_api_key(args):
+    """Applies --record/--replay and returns the Gemini API key to use (a placeholder when replaying)."""
+    if args.record:
+        provider_cassette.configure('record', args.record)
+    elif args.replay:
+        provider_cassette.configure('replay', args.replay)
+    api_key = args.api_key or next(iter(configured_api_keys()), None)
+    return api_key or (provider_cassette.REPLAY_API_KEY if provider_cassette.replaying() else None)
+
+def proposal_filename(product_name, output_dir='', key=''):
+    """Output path for a product's proposal, with characters that are unsafe in file names replaced.
+
+    `key` (e.g. a catalog row's item_key) is appended so rows for the same product
+    with a different price or capacity do not overwrite each other.
+    """
+    safe_name = re.sub(r'[\\/:*?"<>|]', '_', product_name.replace(' ', '_'))
+    return os.path.join(output_dir, f"proposal_{safe_name}{'_' + key if key else ''}.html")
+
+def create_proposal(api_key, product_name, price, capacity, image_url=None, output_dir='', force_regenerate=False,
+                    bundle=False, output_key=''):
+    """Runs search → image → generation → HTML for one product without prompting. Returns the output path."""
+    with stage('context_search'):
+        context = search_product_info(product_name)
+    if not image_url:
+        with stage('image_selection'):
+            image_url = select_image_automatically(search_product_images(product_name, count=AUTO_IMAGE_CANDIDATES))
+    with stage('generation'):
+        data = generate_proposal_content(api_key, product_name, price, capacity, context, force_regenerate=force_regenerate)
+    if not data:
+        raise RuntimeError("Failed to generate content")
+    output_filename = proposal_filename(product_name, output_dir, output_key)
+    with stage('html_output'):
+        create_html_output(data, image_url, output_filename, bundle=bundle)
+    return output_filename
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(prog='create_proposal_v4.py batch', description='CSV/TSVの商品リストから提案書を一括作成')
+    parser.add_argument('catalog', help='商品リスト (CSV/TSV: name, price, capacity, image_url)')
+    parser.add_argument('--jobs', type=int, default=4, help='同時に処理する商品数')
+    parser.add_argument('--journal', help='進捗ジャーナルのパス（再実行時に完了済みの商品をスキップ）')
+    parser.add_argument('--output-dir', default=os.path.join('output', 'html'), help='提案書の出力先')
+    parser.add_argument('--api_key', help='Google API Key')
+    parser.add_argument('--force-regenerate', action='store_true', help='キャッシュを使わずGeminiで再生成する')
+    parser.add_argument('--pdf', action='store_true', help='商品ごとのPDFも出力する')
+    parser.add_argument('--bundle', action='store_true', help='画像とフォントを埋め込んだ単体で開けるHTMLにする')
+    parser.add_argument('--catalog', dest='catalog_pdf', help='全商品の提案書を1つにまとめたPDFの出力先')
+    parser.add_argument('--profile', nargs='?', const='', metavar='JSON',
+                        help='工程ごとの時間を計測し、商品全体のp50/p95を表示してJSONに保存する')
+    parser.add_argument('--cprofile', metavar='PSTATS', help='cProfileの結果を保存する（メインスレッドのみ。--jobs 1 推奨）')
+    add_provider_arguments(parser)
+    args = parser.parse_args(argv)
+
+    api_key = resolve_api_key(args)
+    if not api_key:
+        print("Error: Google API Key is required. Set GOOGLE_API_KEY environment variable or pass --api_key.")
+        return 1
+    if args.pdf or args.catalog_pdf:
+        try:
+            require_pdf()
+        except PdfUnavailable as e:
+            print(f"Error: {e}")
+            return 1
+
+    items = read_catalog(args.catalog)
+    os.makedirs(args.output_dir, exist_ok=True)
+    journal = BatchJournal(args.journal or os.path.splitext(args.catalog)[0] + '.journal.jsonl')
+
+    profiles = []
+
+    def process(item):
+        profile = RunProfile(item['name']) if args.profile is not None else None
+        try:
+            with profile.activate() if profile else nullcontext():
+                return create_proposal(api_key, item['name'], item['price'], item['capacity'], item.get('image_url'),
+                                       output_dir=args.output_dir, force_regenerate=args.force_regenerate,
+                                       bundle=args.bundle, output_key=item_key(item)[:8])
+        finally:
+            if profile:
+                profiles.append(profile.to_dict())
+
+    with cprofile_to(args.cprofile):
+        summary = run_batch(items, process, journal, jobs=args.jobs)
+    print(f"Batch finished: {summary['done']} created, {summary['failed']} failed, {summary['skipped']} already done "
+          f"(journal: {journal.path})")
+    if args.profile is not None and profiles:
+        report = profiling.aggregate(profiles)
+        print(profiling.format_aggregate(report))
+        profiling.write_json(args.profile or os.path.join(args.output_dir, 'batch_profile.json'),
+                             {**report, 'runs': profiles})
+
+    if args.pdf or args.catalog_pdf:
+        # Include rows finished by earlier runs too, in catalog order
+        finished = journal.load()
+        html_paths = [finished[key]['output'] for key in map(item_key, items)
+                      if finished.get(key, {}).get('status') == 'done' and os.path.exists(finished[key]['output'])]
+        create_pdf_outputs(html_paths, catalog_path=args.catalog_pdf, per_product=args.pdf)
+    return 1 if summary['failed'] else 0
+
 
 def main():
-    parser = argparse.ArgumentParser(description='商品提案書自動作成エージェント')
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch_main(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(description='商品提案書自動作成エージェント',
+                                     epilog='一括作成: python3 create_proposal_v4.py batch catalog.csv --jobs 8 --catalog buyers.pdf')
     parser.add_argument('name', help='商品名')
     parser.add_argument('price', help='納品価格')
     parser.add_argument('capacity', help='容量 (例: 1,800ml)')
     parser.add_argument('--image', help='画像URL（指定がない場合は自動検索）')
+    parser.add_argument('--auto-image', action='store_true', help='画像を自動評価して最適なものを選ぶ（選択画面を出さない）')
     parser.add_argument('--api_key', help='Google API Key')
+    parser.add_argument('--force-regenerate', action='store_true', help='キャッシュを使わずGeminiで再生成する')
+    parser.add_argument('--pdf', action='store_true', help='HTMLと同名のPDFも出力する')
+    parser.add_argument('--bundle', action='store_true', help='画像とフォントを埋め込んだ単体で開けるHTMLにする')
+    parser.add_argument('--profile', nargs='?', const='', metavar='JSON',
+                        help='工程ごとの時間・通信量・プロンプトサイズを表示してJSONに保存する')
+    parser.add_argument('--cprofile', metavar='PSTATS', help='cProfileの結果を保存する')
+    add_provider_arguments(parser)
     
     args = parser.parse_args()
 
     # Get API Key
-    api_key = args.api_key or os.environ.get('GOOGLE_API_KEY')
+    api_key = resolve_api_key(args)
     if not api_key:
         print("Error: Google API Key is required. Set GOOGLE_API_KEY environment variable or pass --api_key.")
         return
 
+    profile = RunProfile(args.name) if args.profile is not None else None
+    with profile.activate() if profile else nullcontext(), cprofile_to(args.cprofile):
+        output_filename = run_pipeline(args, api_key)
+    if profile:
+        report = profile.to_dict()
+        print(profiling.format_run(report))
+        profiling.write_json(args.profile or os.path.splitext(proposal_filename(args.name))[0] + '.profile.json', report)
+    if not output_filename:
+        return
+
+    # 自動でファイルを開く
+    try:
+        subprocess.call(['open', output_filename])
+    except Exception as e:
+        logging.error(f"Failed to open the file: {e}")
+
+def run_pipeline(args, api_key):
+    """The interactive single-product flow; returns the path to open, or None if generation failed."""
     # 1. Product Context Search
-    context = search_product_info(args.name)
+    with stage('context_search'):
+        context = search_product_info(args.name)
     
     # 2. Image Search & Selection
     image_url = args.image
-    if not image_url:
-        image_urls = search_product_images(args.name, count=5)
-        image_url = select_image_interactively(args.name, image_urls)
+    with stage('image_selection'):
+        if not image_url and args.auto_image:
+            image_url = select_image_automatically(search_product_images(args.name, count=AUTO_IMAGE_CANDIDATES))
+        elif not image_url:
+            image_urls = search_product_images(args.name, count=5)
+            image_url = select_image_interactively(args.name, image_urls)
     
     # 3. Content Generation
-    data = generate_proposal_content(api_key, args.name, args.price, args.capacity, context)
+    with stage('generation'):
+        data = generate_proposal_content(api_key, args.name, args.price, args.capacity, context,
+                                         force_regenerate=args.force_regenerate)
     if not data:
         print("Error: Failed to generate content.")
-        return
+        return None
 
     # 4. Output Generation
-    output_filename = f"proposal_{args.name.replace(' ', '_')}.html"
-    create_html_output(data, image_url, output_filename)
+    output_filename = proposal_filename(args.name)
+    with stage('html_output'):
+        create_html_output(data, image_url, output_filename, bundle=args.bundle)
     print(f"Successfully created proposal: {output_filename}")
-
-    # 自動でファイルを開く
-    try:
-        subprocess.call(['open', output_filename])
-    except Exception as e:
-        logging.error(f"Failed to open the file: {e}")
+    if args.pdf:
+        try:
+            with stage('pdf_output'):
+                output_filename = create_pdf_outputs([output_filename])[0]
+        except PdfUnavailable as e:
+            print(f"Error: {e}")
+    return output_filename
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,241 @@
+import io
+import os
+import json
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+import httpx
+from PIL import Image
+from google.api_core import exceptions as google_exceptions
+import context_builder
+import gemini_client
+import image_dedup
+import product_search
+import proposal_generation
+from image_store import image_store
+from proposal_cache import ProposalCache
+from proposal_store import proposal_store
+from rate_limit import TokenBucket
+
+FAKE_API_KEY = 'offline-benchmark-key'
+IMAGE_VARIETY = 6
+
+
+class FakeProviderError(RuntimeError):
+    """Injected failure of a fake search or image request."""
+
+
+class FakeProviderConfig:
+    """Latency (median seconds), error rate (0-1) and payload size of the fake providers.
+
+    Latencies are log-normal around the median with `jitter` as sigma, so the
+    stand-ins have a tail like the real services; `seed` makes a run repeatable.
+    """
+
+    def __init__(self, search_latency=0.2, image_latency=0.05, gemini_latency=0.8, jitter=0.3,
+                 search_error_rate=0.0, image_error_rate=0.0, gemini_error_rate=0.0,
+                 snippet_chars=200, image_size=800, response_chars=600, stream_chunks=8, seed=0):
+        self.search_latency = search_latency
+        self.image_latency = image_latency
+        self.gemini_latency = gemini_latency
+        self.jitter = jitter
+        self.search_error_rate = search_error_rate
+        self.image_error_rate = image_error_rate
+        self.gemini_error_rate = gemini_error_rate
+        self.snippet_chars = snippet_chars
+        self.image_size = image_size
+        self.response_chars = response_chars
+        self.stream_chunks = stream_chunks
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, median):
+        if median <= 0:
+            return 0.0
+        with self._lock:
+            return median * self._random.lognormvariate(0, self.jitter)
+
+    def fails(self, rate):
+        with self._lock:
+            return self._random.random() < rate
+
+
+class FakeDDGS:
+    """Stand-in for ddgs.DDGS: text() and images() return synthetic results after a simulated delay."""
+
+    config = FakeProviderConfig()
+
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _wait(self, median, error_rate, what):
+        time.sleep(self.config.delay(median))
+        if self.config.fails(error_rate):
+            raise FakeProviderError(f"Injected {what} failure")
+
+    def text(self, query, region=None, max_results=10, **kwargs):
+        self._wait(self.config.search_latency, self.config.search_error_rate, 'search')
+        filler = ('容量・原材料・保存方法などの詳しい商品説明。' * (self.config.snippet_chars // 20 + 1))[:self.config.snippet_chars]
+        return [{
+            'title': f"{query} - 商品ページ {i + 1}",
+            'body': f"{query} の特徴。{filler}",
+            'href': f"https://shop{i}.example.jp/{zlib.crc32(query.encode('utf-8'))}/{i}",
+        } for i in range(max_results)]
+
+    def images(self, query, region=None, max_results=10, **kwargs):
+        self._wait(self.config.search_latency, self.config.search_error_rate, 'image search')
+        key = zlib.crc32(query.encode('utf-8'))
+        return [{
+            'title': f"{query} {i + 1}",
+            'image': f"https://img.example.jp/{key}/{i}.jpg",
+            'thumbnail': f"https://img.example.jp/{key}/{i}.jpg?thumb=1",
+            'width': self.config.image_size,
+            'height': self.config.image_size,
+        } for i in range(max_results)]
+
+
+def fake_proposal(product_name, response_chars=600):
+    """Proposal JSON shaped like Gemini's answer, padded to roughly `response_chars` characters."""
+    data = {
+        'product_name': product_name,
+        'catch_copy': f"{product_name}で、毎日をもっと豊かに",
+        'benefits': [{'title': f"魅力{i + 1}", 'detail': f"{product_name}ならではの特長{i + 1}です。"} for i in range(3)],
+        'product_specs': ['内容量: 720ml', '保存方法: 冷暗所', '原産国: 日本'],
+        'comment': '',
+        'target': '贈答需要のある30〜60代',
+    }
+    padding = max(0, response_chars - len(json.dumps(data, ensure_ascii=False)))
+    data['comment'] = ('売場の目玉として自信を持っておすすめできる一品です。' * (padding // 25 + 1))[:padding]
+    return data
+
+
+class _Usage:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = gemini_client.estimate_tokens(prompt)
+        self.candidates_token_count = gemini_client.estimate_tokens(text)
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class _Response:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeGenerativeModel:
+    """Stand-in for genai.GenerativeModel; streaming spreads the latency over `stream_chunks` chunks."""
+
+    config = FakeProviderConfig()
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        product_name = prompt.split('【商品名】', 1)[-1].strip().split('\n', 1)[0].strip() or '商品'
+        text = json.dumps(fake_proposal(product_name, self.config.response_chars), ensure_ascii=False)
+        latency = self.config.delay(self.config.gemini_latency)
+        if self.config.fails(self.config.gemini_error_rate):
+            time.sleep(latency / 2)
+            raise google_exceptions.ServiceUnavailable('Injected Gemini failure')
+        if not stream:
+            time.sleep(latency)
+            return _Response(text, _Usage(prompt, text))
+        return self._stream(prompt, text, latency)
+
+    def _stream(self, prompt, text, latency):
+        chunks = max(1, self.config.stream_chunks)
+        size = len(text) // chunks + 1
+        for i in range(0, len(text), size):
+            time.sleep(latency / chunks)
+            last = i + size >= len(text)
+            yield _Response(text[i:i + size], _Usage(prompt, text) if last else None)
+
+
+class FakeImageHost:
+    """httpx transport serving a generated JPEG for any URL, with the configured latency and errors.
+
+    URLs map onto IMAGE_VARIETY distinct pictures, so deduplication and ranking
+    have real work to do.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._images = {}
+        self._lock = threading.Lock()
+
+    def _jpeg(self, size, variety):
+        with self._lock:
+            if (size, variety) not in self._images:
+                image = Image.new('RGB', (size, size), (255, 255, 255))
+                left = size * variety // (2 * IMAGE_VARIETY)
+                image.paste((180, 40 + 20 * variety, 40), (left, size // 8, left + size // 2, size * 7 // 8))
+                output = io.BytesIO()
+                image.save(output, 'JPEG', quality=85)
+                self._images[size, variety] = output.getvalue()
+            return self._images[size, variety]
+
+    def handle(self, request):
+        time.sleep(self.config.delay(self.config.image_latency))
+        if self.config.fails(self.config.image_error_rate):
+            return httpx.Response(503, request=request)
+        size = 120 if 'thumb' in request.url.query.decode() else self.config.image_size
+        variety = zlib.crc32(request.url.path.encode('utf-8')) % IMAGE_VARIETY
+        return httpx.Response(200, content=self._jpeg(size, variety), headers={'Content-Type': 'image/jpeg'}, request=request)
+
+    def client(self):
+        return httpx.Client(transport=httpx.MockTransport(self.handle))
+
+
+@contextmanager
+def offline_providers(config, workdir, rate_limits=False, modules=()):
+    """Routes DDGS, Gemini and image downloads to the fakes, with a fresh cache and stores in `workdir`.
+
+    Unless `rate_limits` is set, the DDGS token bucket and Gemini per-key quotas
+    are lifted so the benchmark measures this process rather than the free tier.
+    `modules` lists further importers of shared_cache (e.g. app_v5) to point at
+    the fresh cache. Everything patched is restored on exit.
+    """
+    patches = []
+
+    def patch(target, name, value):
+        patches.append((target, name, getattr(target, name)))
+        setattr(target, name, value)
+
+    cache = ProposalCache(path=os.path.join(workdir, 'cache.sqlite3'))
+    host = FakeImageHost(config)
+    patch(FakeDDGS, 'config', config)
+    patch(FakeGenerativeModel, 'config', config)
+    patch(product_search, 'DDGS', FakeDDGS)
+    patch(gemini_client.genai, 'GenerativeModel', FakeGenerativeModel)
+    for module in (product_search, proposal_generation, context_builder, *modules):
+        patch(module, 'shared_cache', cache)
+    patch(image_dedup, 'hash_cache', ProposalCache(path=os.path.join(workdir, 'image_hashes.sqlite3')))
+    patch(image_store, 'cache', cache)
+    patch(image_store, 'root', os.path.join(workdir, 'images'))
+    patch(image_store, 'client', host.client())
+    patch(proposal_store, 'root', os.path.join(workdir, 'proposals'))
+    if not rate_limits:
+        patch(product_search, 'ddgs_limiter', TokenBucket(rate=1e9, capacity=1e9))
+    manager = gemini_client.GeminiClientManager(
+        [FAKE_API_KEY], proposal_generation.MODEL_NAME,
+        **({} if rate_limits else {'rpm_limit': 10 ** 9, 'tpm_limit': 10 ** 12}))
+    patch(gemini_client, '_manager', manager)
+    saved_keys = os.environ.get('GOOGLE_API_KEYS')
+    os.environ['GOOGLE_API_KEYS'] = FAKE_API_KEY
+    try:
+        yield cache
+    finally:
+        for target, name, value in reversed(patches):
+            setattr(target, name, value)
+        if saved_keys is None:
+            os.environ.pop('GOOGLE_API_KEYS', None)
+        else:
+            os.environ['GOOGLE_API_KEYS'] = saved_keys
@@ -0,0 +1,251 @@
+import os
+import logging
+import threading
+import time
+from collections import deque
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
+from provider_cassette import generative_model, replaying
+from rate_limit import is_background
+
+# Per-key quotas; defaults match the Gemini free tier for flash models.
+GEMINI_RPM_LIMIT = int(os.environ.get('GEMINI_RPM_LIMIT', 10))
+GEMINI_TPM_LIMIT = int(os.environ.get('GEMINI_TPM_LIMIT', 250000))
+# Share of each key's RPM/TPM that background (batch) work may use; the rest is
+# kept free for interactive requests, which are also served first when queued.
+GEMINI_BATCH_SHARE = float(os.environ.get('GEMINI_BATCH_SHARE', 0.5))
+# How long a request may wait for quota before giving up.
+GEMINI_MAX_QUEUE_WAIT = float(os.environ.get('GEMINI_MAX_QUEUE_WAIT', 60))
+# Cooldown for a key that returned 429 when the error carries no retry delay.
+GEMINI_COOLDOWN = float(os.environ.get('GEMINI_COOLDOWN', 30))
+# Rough output size used to reserve token quota before the real usage is known.
+ESTIMATED_RESPONSE_TOKENS = 1000
+
+RATE_LIMIT_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+WINDOW = 60.0
+
+
+class QuotaExhausted(RuntimeError):
+    """Raised when no API key gets quota within GEMINI_MAX_QUEUE_WAIT."""
+
+
+def estimate_tokens(text):
+    """Cheap local token estimate: CJK characters are ~1 token each, other text ~4 characters per token."""
+    cjk = sum(1 for ch in text if ord(ch) >= 0x3000)
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+class _KeyState:
+    def __init__(self, api_key, model):
+        self.api_key = api_key
+        self.model = model
+        self.requests = deque()  # request start times in the last WINDOW seconds
+        self.tokens = deque()    # [time, tokens] reservations in the last WINDOW seconds
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.rate_limited = 0
+
+    @property
+    def label(self):
+        return f"...{self.api_key[-4:]}"
+
+    def prune(self, now):
+        while self.requests and now - self.requests[0] >= WINDOW:
+            self.requests.popleft()
+        while self.tokens and now - self.tokens[0][0] >= WINDOW:
+            self.tokens.popleft()
+
+    def tokens_used(self):
+        return sum(tokens for _, tokens in self.tokens)
+
+    def available_at(self, now, tokens, rpm_limit, tpm_limit):
+        """Earliest time this key can take a request of `tokens`, given its current window."""
+        ready = max(now, self.cooldown_until)
+        if len(self.requests) >= rpm_limit:
+            ready = max(ready, self.requests[len(self.requests) - rpm_limit] + WINDOW)
+        used = self.tokens_used()
+        if used and used + tokens > tpm_limit:
+            freed = used
+            for at, reserved in self.tokens:
+                freed -= reserved
+                if freed + tokens <= tpm_limit:
+                    ready = max(ready, at + WINDOW)
+                    break
+        return ready
+
+
+class GeminiClientManager:
+    """Process-wide pool of Gemini API keys with rate-limit aware dispatch.
+
+    Each key gets its own long-lived GenerativeModel/gRPC client. Requests go to
+    the least-loaded key that has requests-per-minute and tokens-per-minute quota
+    left; if every key is saturated the caller waits for the earliest free slot
+    instead of hitting a 429. A key that still returns 429 is cooled down and the
+    request is retried on another key. Background work (see rate_limit.background_work)
+    only gets `batch_share` of each key's quota and waits while interactive
+    requests are queued.
+    """
+
+    def __init__(self, api_keys, model_name, rpm_limit=GEMINI_RPM_LIMIT, tpm_limit=GEMINI_TPM_LIMIT,
+                 max_queue_wait=GEMINI_MAX_QUEUE_WAIT, batch_share=GEMINI_BATCH_SHARE):
+        if not api_keys:
+            raise ValueError("At least one Gemini API key is required")
+        self.model_name = model_name
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.max_queue_wait = max_queue_wait
+        self.batch_share = batch_share
+        self._condition = threading.Condition()
+        self._interactive_waiting = 0
+        self._keys = []
+        for api_key in api_keys:
+            self.add_key(api_key)
+
+    def _make_model(self, api_key):
+        def make_live():
+            model = genai.GenerativeModel(self.model_name)
+            # genai.configure() is global; give each key its own client instead.
+            model._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+            return model
+        return generative_model(self.model_name, make_live)
+
+    def add_key(self, api_key):
+        with self._condition:
+            if any(state.api_key == api_key for state in self._keys):
+                return
+            self._keys.append(_KeyState(api_key, self._make_model(api_key)))
+            self._condition.notify_all()
+
+    def _acquire(self, tokens, exclude=()):
+        background = is_background()
+        rpm_limit, tpm_limit = self.rpm_limit, self.tpm_limit
+        if background:
+            rpm_limit = max(1, int(rpm_limit * self.batch_share))
+            tpm_limit = int(tpm_limit * self.batch_share)
+        deadline = time.monotonic() + self.max_queue_wait
+        queued = False
+        with self._condition:
+            try:
+                while True:
+                    now = time.time()
+                    candidates = [state for state in self._keys if state not in exclude] or self._keys
+                    for state in candidates:
+                        state.prune(now)
+                    ready = {state: state.available_at(now, tokens, rpm_limit, tpm_limit) for state in candidates}
+                    yielding = background and self._interactive_waiting > 0
+                    available = [] if yielding else [state for state in candidates if ready[state] <= now]
+                    if available:
+                        state = min(available, key=lambda s: (s.in_flight + len(s.requests), s.tokens_used()))
+                        state.requests.append(now)
+                        state.tokens.append([now, tokens])
+                        state.in_flight += 1
+                        return state, state.tokens[-1]
+                    wait = min(ready.values()) - now
+                    if yielding:
+                        # Interactive requests are queued: poll until they have been served
+                        wait = max(wait, 0.05)
+                    if time.monotonic() + wait > deadline:
+                        raise QuotaExhausted("All Gemini API keys are at their rate limit")
+                    if not background and not queued:
+                        queued = True
+                        self._interactive_waiting += 1
+                    logging.info(f"All Gemini keys busy; waiting {wait:.1f}s for quota")
+                    self._condition.wait(timeout=wait)
+            finally:
+                if queued:
+                    self._interactive_waiting -= 1
+                    self._condition.notify_all()
+
+    def _release(self, state, reservation, total_tokens=None):
+        with self._condition:
+            state.in_flight -= 1
+            if total_tokens:
+                reservation[1] = total_tokens
+            self._condition.notify_all()
+
+    def _cool_down(self, state, error):
+        delay = getattr(getattr(error, 'retry_delay', None), 'seconds', None) or GEMINI_COOLDOWN
+        with self._condition:
+            state.cooldown_until = time.time() + delay
+            state.rate_limited += 1
+        logging.warning(f"Gemini key {state.label} rate limited; cooling down for {delay:.0f}s")
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        """Calls GenerativeModel.generate_content on the least-loaded key, retrying 429s on other keys."""
+        if replaying():
+            # Replayed responses cost no quota
+            return self._keys[0].model.generate_content(prompt, generation_config=generation_config, stream=stream)
+        tokens = estimate_tokens(prompt) + ESTIMATED_RESPONSE_TOKENS
+        tried = []
+        while True:
+            state, reservation = self._acquire(tokens, exclude=tried)
+            try:
+                response = state.model.generate_content(prompt, generation_config=generation_config, stream=stream)
+            except RATE_LIMIT_ERRORS as e:
+                self._release(state, reservation)
+                self._cool_down(state, e)
+                tried.append(state)
+                if len(tried) >= len(self._keys) * 2:
+                    raise
+                continue
+            except Exception:
+                self._release(state, reservation)
+                raise
+            if stream:
+                return self._stream(state, reservation, response)
+            usage = getattr(response, 'usage_metadata', None)
+            self._release(state, reservation, getattr(usage, 'total_token_count', None))
+            return response
+
+    def _stream(self, state, reservation, response):
+        try:
+            for chunk in response:
+                yield chunk
+        finally:
+            usage = getattr(response, 'usage_metadata', None)
+            self._release(state, reservation, getattr(usage, 'total_token_count', None))
+
+    def stats(self):
+        with self._condition:
+            now = time.time()
+            keys = []
+            for state in self._keys:
+                state.prune(now)
+                keys.append({
+                    "key": state.label,
+                    "requests_last_minute": len(state.requests),
+                    "tokens_last_minute": state.tokens_used(),
+                    "in_flight": state.in_flight,
+                    "cooling_down": state.cooldown_until > now,
+                    "rate_limited": state.rate_limited,
+                })
+        return {"model": self.model_name, "rpm_limit": self.rpm_limit, "tpm_limit": self.tpm_limit,
+                "batch_share": self.batch_share, "keys": keys}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def configured_api_keys():
+    """API keys from GOOGLE_API_KEYS (comma-separated) and GOOGLE_API_KEY."""
+    keys = [key.strip() for key in os.environ.get('GOOGLE_API_KEYS', '').split(',') if key.strip()]
+    if os.environ.get('GOOGLE_API_KEY'):
+        keys.append(os.environ['GOOGLE_API_KEY'])
+    return list(dict.fromkeys(keys))
+
+
+def get_client_manager(model_name, api_key=None):
+    """Returns the process-wide manager, creating it on first use. `api_key` is added to the pool."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            keys = configured_api_keys()
+            if api_key and api_key not in keys:
+                keys.append(api_key)
+            _manager = GeminiClientManager(keys, model_name)
+            logging.info(f"Gemini client manager started with {len(keys)} API key(s)")
+        elif api_key:
+            _manager.add_key(api_key)
+        return _manager
@@ -0,0 +1,96 @@
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from PIL import Image, UnidentifiedImageError
+from image_store import image_store
+from profiling import in_context, record
+from proposal_cache import CACHE_PATH, ProposalCache
+import provider_cassette
+
+# Two candidates whose 64-bit difference hashes differ in at most this many bits
+# are treated as the same picture (re-encoded, resized or lightly cropped).
+DEDUP_THRESHOLD = int(os.environ.get('IMAGE_DEDUP_THRESHOLD', 8))
+DEDUP_WORKERS = int(os.environ.get('IMAGE_DEDUP_WORKERS', 8))
+# Every image search hashes count * IMAGE_OVERFETCH previews, so the hashes get their
+# own cache file and bound instead of evicting search and Gemini results from shared_cache.
+IMAGE_HASH_CACHE_PATH = os.environ.get('IMAGE_HASH_CACHE_PATH',
+                                       os.path.join(os.path.dirname(CACHE_PATH), 'image_hashes.sqlite3'))
+IMAGE_HASH_MAX_ENTRIES = int(os.environ.get('IMAGE_HASH_MAX_ENTRIES', 50000))
+
+hash_cache = ProposalCache(path=IMAGE_HASH_CACHE_PATH, max_entries=IMAGE_HASH_MAX_ENTRIES, memory_bytes=1024 * 1024)
+
+
+def dhash(image, size=8):
+    """64-bit difference hash: compares neighbouring pixels of a tiny grayscale copy."""
+    image.draft('L', (size * 4, size * 4))  # Let the JPEG decoder downscale while decoding
+    pixels = image.convert('L').resize((size + 1, size), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            value = (value << 1) | (left < pixels[row * (size + 1) + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def preview_hash(url, client=None):
+    """dHash of the image at `url` (ideally a small thumbnail), or None if it cannot be read.
+
+    Hashes are recorded in provider record mode, so replays never download previews.
+    """
+    return provider_cassette.recorded('image.dhash', {'url': url}, lambda: _preview_hash(url, client))
+
+
+def _preview_hash(url, client):
+    cached = hash_cache.lookup('image_hashes', url)
+    if cached:
+        return int(cached['dhash'], 16)
+    try:
+        response = (client or image_store.client).get(url)
+        response.raise_for_status()
+        record('bytes_fetched_images', len(response.content))
+        with Image.open(io.BytesIO(response.content)) as image:
+            value = dhash(image)
+    except (httpx.HTTPError, UnidentifiedImageError, OSError) as e:
+        logging.debug(f"Could not hash image preview {url}: {e}")
+        return None
+    hash_cache.store('image_hashes', url, {'dhash': f"{value:016x}"})
+    return value
+
+
+def dedupe_candidates(candidates, threshold=DEDUP_THRESHOLD, client=None):
+    """Collapses near-identical image search results, keeping the highest-resolution copy.
+
+    `candidates` are dicts with `image` and optional `thumbnail`, `width` and `height`
+    (as returned by DDGS). Previews are hashed in parallel; each group of duplicates
+    keeps the search rank of its first member. Candidates that cannot be hashed are kept.
+    """
+    if not candidates:
+        return []
+    with ThreadPoolExecutor(max_workers=DEDUP_WORKERS, thread_name_prefix='image-dedup') as executor:
+        hashes = list(executor.map(in_context(lambda c: preview_hash(c.get('thumbnail') or c['image'], client)), candidates))
+
+    groups = []  # [representative hash, best candidate]
+    for candidate, value in zip(candidates, hashes):
+        group = None
+        if value is not None:
+            group = next((g for g in groups if g[0] is not None and hamming(g[0], value) <= threshold), None)
+        if group is None:
+            groups.append([value, candidate])
+        elif _pixels(candidate) > _pixels(group[1]):
+            group[1] = candidate
+    if len(groups) < len(candidates):
+        logging.info(f"Image dedup: {len(candidates)} candidates -> {len(groups)} distinct")
+    return [candidate for _, candidate in groups]
+
+
+def _pixels(candidate):
+    try:
+        return int(candidate.get('width') or 0) * int(candidate.get('height') or 0)
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,133 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from image_store import ImageFetchError, image_store
+from profiling import in_context
+import provider_cassette
+
+# Every candidate is reduced to the same small RGB grid so the whole batch is
+# scored as one (N, SIZE, SIZE, 3) array.
+SIZE = 64
+# Near-white threshold (all channels) for "background" pixels.
+WHITE_LEVEL = 235
+# Pixel count at which resolution stops adding to the score (~1000x1000).
+FULL_RESOLUTION = 1_000_000
+RANK_WORKERS = int(os.environ.get('IMAGE_RANK_WORKERS', 8))
+WEIGHTS = {
+    'resolution': 0.25,
+    'aspect': 0.15,
+    'white_background': 0.25,
+    'centered': 0.2,
+    'clean': 0.15,  # 1 - text/watermark likelihood
+}
+
+
+def load_candidate(url, store=image_store):
+    """Downloads a candidate into the image store; returns (original size, SIZE x SIZE RGB array)."""
+    digest = store.fetch(url)
+    with Image.open(store.original_path(digest)) as original:
+        size = original.size
+    with Image.open(store.variant(digest, 'thumb')) as thumb:
+        pixels = np.asarray(thumb.convert('RGB').resize((SIZE, SIZE), Image.BILINEAR), dtype=np.float32)
+    return size, pixels
+
+
+def score_images(pixels, sizes):
+    """Scores a batch of candidates in one vectorized pass.
+
+    `pixels` is an (N, SIZE, SIZE, 3) float array and `sizes` an (N, 2) array of
+    original (width, height). Returns per-feature scores in [0, 1] and the
+    weighted total, each as an (N,) array.
+    """
+    pixels = np.asarray(pixels, dtype=np.float32)
+    sizes = np.asarray(sizes, dtype=np.float32)
+    gray = pixels.mean(axis=3)
+    background = (pixels >= WHITE_LEVEL).all(axis=3)          # (N, H, W)
+    foreground = ~background
+
+    # Resolution: log-scaled up to FULL_RESOLUTION pixels
+    area = sizes[:, 0] * sizes[:, 1]
+    resolution = np.clip(np.log1p(area) / np.log1p(FULL_RESOLUTION), 0, 1)
+
+    # Aspect ratio: square-ish shots fit the proposal's image box; banners do not
+    aspect = np.exp(-np.abs(np.log(np.maximum(sizes[:, 0], 1) / np.maximum(sizes[:, 1], 1))))
+
+    # White background: share of near-white pixels in the outer frame (12% per side)
+    border = max(1, SIZE * 12 // 100)
+    frame = np.ones((SIZE, SIZE), dtype=bool)
+    frame[border:-border, border:-border] = False
+    white_background = background[:, frame].mean(axis=1)
+
+    # Centeredness: distance of the foreground centroid from the middle (0 at a corner, 1 centered)
+    coords = (np.arange(SIZE, dtype=np.float32) + 0.5) / SIZE - 0.5
+    mass = foreground.sum(axis=(1, 2))
+    safe_mass = np.maximum(mass, 1)
+    cx = (foreground * coords[None, None, :]).sum(axis=(1, 2)) / safe_mass
+    cy = (foreground * coords[None, :, None]).sum(axis=(1, 2)) / safe_mass
+    centered = 1 - np.clip(np.hypot(cx, cy) / np.hypot(0.5, 0.5), 0, 1)
+    centered = np.where(mass > 0, centered, 0)  # blank images have no subject
+
+    # Text / watermarks: more high-contrast edges than one product outline produces
+    # (~6% of the grid), or any in the outer frame where banners and logos sit
+    edges = np.zeros_like(gray, dtype=bool)
+    edges[:, :, 1:] |= np.abs(np.diff(gray, axis=2)) > 40
+    edges[:, 1:, :] |= np.abs(np.diff(gray, axis=1)) > 40
+    excess_edges = (edges.mean(axis=(1, 2)) - 0.08) / 0.12
+    frame_edges = edges[:, frame].mean(axis=1) * 5
+    clean = 1 - np.clip(np.maximum(excess_edges, frame_edges), 0, 1)
+
+    features = {
+        'resolution': resolution,
+        'aspect': aspect,
+        'white_background': white_background,
+        'centered': centered,
+        'clean': clean,
+    }
+    total = sum(WEIGHTS[name] * values for name, values in features.items())
+    return features, total
+
+
+def rank_images(urls, store=image_store):
+    """Downloads candidates in parallel and returns them best first.
+
+    Each entry is {"url", "score", "features"}; candidates that cannot be
+    downloaded or decoded are listed last with a score of 0. Rankings are recorded
+    in provider record mode, so replays never download the candidates.
+    """
+    return provider_cassette.recorded('image.rank', {'urls': list(urls)}, lambda: _rank_images(urls, store))
+
+
+def _rank_images(urls, store):
+    def load(url):
+        try:
+            return load_candidate(url, store)
+        except (ImageFetchError, OSError) as e:
+            logging.warning(f"Could not rank image {url}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=RANK_WORKERS, thread_name_prefix='image-rank') as executor:
+        loaded = list(executor.map(in_context(load), urls))
+
+    usable = [(url, candidate) for url, candidate in zip(urls, loaded) if candidate is not None]
+    ranked = []
+    if usable:
+        features, total = score_images(np.stack([pixels for _, (_, pixels) in usable]),
+                                       np.array([size for _, (size, _) in usable]))
+        for i, (url, _) in enumerate(usable):
+            ranked.append({
+                'url': url,
+                'score': round(float(total[i]), 4),
+                'features': {name: round(float(values[i]), 4) for name, values in features.items()},
+            })
+        ranked.sort(key=lambda entry: entry['score'], reverse=True)
+    ranked += [{'url': url, 'score': 0.0, 'features': {}} for url, candidate in zip(urls, loaded) if candidate is None]
+    return ranked
+
+
+def best_image(urls, store=image_store):
+    """URL of the highest-scoring candidate (the first one if none could be scored)."""
+    if len(urls) < 2:
+        return urls[0] if urls else None
+    return rank_images(urls, store)[0]['url']
@@ -0,0 +1,253 @@
+import io
+import os
+import socket
+import hashlib
+import logging
+import tempfile
+import threading
+import ipaddress
+import httpx
+from PIL import Image, UnidentifiedImageError
+from proposal_cache import shared_cache
+import provider_cassette
+from provider_cassette import CassetteMiss
+from metrics import track
+from profiling import record
+from rate_limit import SingleFlight
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIR = os.path.join(BASE_DIR, 'output', 'images')
+IMAGE_FETCH_TIMEOUT = 10
+IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 15 * 1024 * 1024))
+# Derived renditions: longest edge in pixels and JPEG quality. `thumb` fills the
+# web image grid; `print` is enough for the ~90mm image box on an A4 proposal at 300dpi.
+VARIANTS = {
+    'thumb': (320, 75),
+    'print': (1200, 90),
+}
+USER_AGENT = 'Mozilla/5.0 (compatible; ProposalImageProxy/1.0)'
+# Originals and renditions beyond this many bytes are evicted, least recently used first.
+IMAGE_STORE_MAX_BYTES = int(os.environ.get('IMAGE_STORE_MAX_BYTES', 2 * 1024 ** 3))
+# Image URLs come from search results and API clients, so by default only public
+# addresses are fetched. Set IMAGE_ALLOW_PRIVATE_HOSTS=1 for intranet image servers.
+IMAGE_ALLOW_PRIVATE_HOSTS = os.environ.get('IMAGE_ALLOW_PRIVATE_HOSTS') == '1'
+
+
+class ImageFetchError(RuntimeError):
+    """Raised when a remote image cannot be downloaded or is not a readable image."""
+
+
+def check_public_host(host, port):
+    """Raises ValueError unless every address `host` resolves to is globally routable."""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve {host}: {e}") from e
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%', 1)[0])
+        if getattr(address, 'ipv4_mapped', None):
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise ValueError(f"Refusing to fetch from non-public address {address} ({host})")
+
+
+class PublicOnlyTransport(httpx.BaseTransport):
+    """Checks each request, redirect hops included, against check_public_host before sending it.
+
+    Keeps the image proxy and ranking endpoints from being used to reach loopback,
+    private or link-local services (e.g. cloud metadata). Resolution is checked
+    separately from the connection, so this does not stop DNS rebinding.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        port = request.url.port or (443 if request.url.scheme == 'https' else 80)
+        try:
+            check_public_host(request.url.host, port)
+        except ValueError as e:
+            raise httpx.ConnectError(str(e), request=request) from e
+        return self.transport.handle_request(request)
+
+    def close(self):
+        self.transport.close()
+
+
+def _write_atomically(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+class ImageStore:
+    """Content-addressed store for remote product images.
+
+    Each URL is downloaded once; the bytes are stored under their SHA-256 so the
+    same picture served by several retailers is kept only once. URL → digest
+    mappings live in the shared cache ('image_urls' namespace) and renditions
+    (see VARIANTS) are generated lazily next to the originals. Past `max_bytes`
+    the least recently used files under `original/` and the variant directories
+    are deleted (anything else in `root` is left alone); evicted images are
+    simply downloaded or regenerated again on their next use.
+    """
+
+    def __init__(self, root=IMAGE_DIR, cache=shared_cache, client=None, max_bytes=IMAGE_STORE_MAX_BYTES):
+        self.root = root
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.client = client or httpx.Client(
+            timeout=IMAGE_FETCH_TIMEOUT, follow_redirects=True, headers={'User-Agent': USER_AGENT},
+            transport=None if IMAGE_ALLOW_PRIVATE_HOSTS else PublicOnlyTransport())
+        self._flights = SingleFlight(name='image_fetch')
+        self._size = None  # bytes on disk, counted on the first write
+        self._size_lock = threading.Lock()
+
+    def original_path(self, digest):
+        return os.path.join(self.root, 'original', digest[:2], digest)
+
+    def variant_path(self, digest, variant):
+        return os.path.join(self.root, variant, digest[:2], f"{digest}.jpg")
+
+    def has(self, digest):
+        return os.path.exists(self.original_path(digest))
+
+    def fetch(self, url):
+        """Returns the digest of the image at `url`, downloading it on first use.
+
+        In provider record mode the URL → digest mapping is saved to the cassette;
+        replays answer from it and serve the file already in the store, never
+        downloading (so replay needs the store the recording filled).
+        """
+        try:
+            digest = provider_cassette.recorded('image.fetch', {'url': url}, lambda: self._fetch(url))
+        except CassetteMiss as e:
+            raise ImageFetchError(str(e)) from e
+        if provider_cassette.replaying():
+            if not self.has(digest):
+                raise ImageFetchError(f"Recorded image {digest[:12]} for {url} is not in the image store")
+            self._touch(self.original_path(digest))
+        return digest
+
+    def _fetch(self, url):
+        cached = self.cache.lookup('image_urls', url)
+        if cached and self.has(cached['digest']):
+            self.cache.record('image_urls', 'hit')
+            self._touch(self.original_path(cached['digest']))
+            return cached['digest']
+        self.cache.record('image_urls', 'miss')
+        return self._flights.do(url, lambda: self._track_download(url))
+
+    def _track_download(self, url):
+        with track('image_fetch'):
+            return self._download(url)
+
+    def _download(self, url):
+        if not url.startswith(('http://', 'https://')):
+            raise ImageFetchError(f"Unsupported image URL: {url}")
+        try:
+            with self.client.stream('GET', url) as response:
+                response.raise_for_status()
+                chunks, size = [], 0
+                for chunk in response.iter_bytes():
+                    size += len(chunk)
+                    if size > IMAGE_MAX_BYTES:
+                        raise ImageFetchError(f"Image larger than {IMAGE_MAX_BYTES} bytes: {url}")
+                    chunks.append(chunk)
+        except httpx.HTTPError as e:
+            raise ImageFetchError(f"Image download failed for {url}: {e}") from e
+        content = b''.join(chunks)
+        record('bytes_fetched_images', len(content))
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                image.verify()
+                width, height = image.size
+        except (UnidentifiedImageError, OSError, SyntaxError) as e:
+            raise ImageFetchError(f"Not an image: {url}") from e
+
+        digest = hashlib.sha256(content).hexdigest()
+        if not self.has(digest):
+            self._write(self.original_path(digest), content)
+        self.cache.store('image_urls', url, {'digest': digest, 'width': width, 'height': height, 'bytes': len(content)})
+        logging.info(f"Stored image {digest[:12]} ({width}x{height}, {len(content)} bytes) from {url}")
+        return digest
+
+    def variant(self, digest, variant):
+        """Path of a JPEG rendition of a stored image, generating it on first use."""
+        path = self.variant_path(digest, variant)
+        if os.path.exists(path):
+            self._touch(path)
+            return path
+        max_edge, quality = VARIANTS[variant]
+        with Image.open(self.original_path(digest)) as image:
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # Flatten transparency onto white, like the proposal background
+                image = image.convert('RGBA')
+                flattened = Image.new('RGB', image.size, (255, 255, 255))
+                flattened.paste(image, mask=image.getchannel('A'))
+                image = flattened
+            output = io.BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+        self._write(path, output.getvalue())
+        return path
+
+    def _touch(self, path):
+        # Modification time doubles as last use for eviction (atime is often disabled)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _files(self):
+        # Only the store's own subdirectories: IMAGE_DIR also holds unrelated files
+        for subdir in ('original', *VARIANTS):
+            for directory, _, names in os.walk(os.path.join(self.root, subdir)):
+                for name in names:
+                    if not name.startswith('.tmp-'):
+                        path = os.path.join(directory, name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        yield stat.st_mtime, stat.st_size, path
+
+    def _write(self, path, content):
+        _write_atomically(path, content)
+        with self._size_lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._files())
+            else:
+                self._size += len(content)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Deletes least recently used files until the store is back under 90% of max_bytes."""
+        files = sorted(self._files())
+        self._size = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in files:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            removed += 1
+        logging.info(f"Image store over {self.max_bytes} bytes: evicted {removed} files")
+
+    def localize(self, url, variant='print'):
+        """Local path of `url`'s rendition, or None if it cannot be fetched (callers keep the remote URL)."""
+        try:
+            return self.variant(self.fetch(url), variant)
+        except (ImageFetchError, OSError) as e:
+            logging.warning(f"Could not localize image {url}: {e}")
+            return None
+
+
+image_store = ImageStore()
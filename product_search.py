@@ -0,0 +1,209 @@
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    from ddgs import DDGS
+except ImportError:  # Older installs only have the duckduckgo_search package
+    from duckduckgo_search import DDGS
+
+from image_dedup import dedupe_candidates
+from metrics import count_results, track
+from profiling import in_context, record
+from proposal_cache import normalize_product_name, shared_cache
+import provider_cassette
+from provider_cassette import search_session
+import search_backends
+from search_backends import DDGSBackend, build_backends
+from rate_limit import SingleFlight, TokenBucket, is_background
+from text_rank import bm25_scores
+
+# Query templates double as part of the cache key, so changing one naturally
+# invalidates results fetched with the old wording.
+# Context search fans out over several query variants at once (official page, specs,
+# reviews, maker) and keeps the CONTEXT_TOP_K results that rank best under BM25.
+CONTEXT_QUERIES = [
+    "{product_name} 公式",
+    "{product_name} 仕様 スペック 原材料",
+    "{product_name} レビュー 口コミ",
+    "{product_name} メーカー 製造元",
+]
+CONTEXT_QUERY = " | ".join(CONTEXT_QUERIES)
+CONTEXT_RESULTS_PER_QUERY = 5
+CONTEXT_TOP_K = int(os.environ.get('CONTEXT_TOP_K', 8))
+# Words that mark the pages most useful for a proposal, added to the product name when ranking.
+CONTEXT_RANKING_TERMS = "公式 特徴 仕様 スペック"
+IMAGE_QUERY = "{product_name} 商品画像 白背景"
+# DDGS returns a whole results page per request, so asking for fewer images saves
+# nothing upstream. Always fetch at least this many so CLI (5) and UI (8) calls
+# leave a list in the cache that can serve either.
+IMAGE_FETCH_MIN = 20
+# The same bottle shot often comes from several retailers; ask DDGS for this many
+# times more results so `count` distinct images remain after deduplication.
+IMAGE_OVERFETCH = int(os.environ.get('IMAGE_OVERFETCH', 2))
+SEARCH_TIMEOUT = int(os.environ.get('SEARCH_TIMEOUT', 15))
+# Search backends in priority order (ddgs, catalog, searxng). With more than one,
+# searches are hedged: a backend slower than its observed p90 gets the next one fired too.
+SEARCH_BACKENDS = [name.strip() for name in os.environ.get('SEARCH_BACKENDS', 'ddgs').split(',') if name.strip()]
+
+# All DDGS traffic in this process shares one token bucket, and identical
+# queries already in flight are coalesced into a single upstream call.
+# The burst covers one context fan-out plus the image search of the same request.
+ddgs_limiter = TokenBucket(
+    rate=float(os.environ.get('DDGS_RATE_PER_SECOND', 1.0)),
+    capacity=int(os.environ.get('DDGS_BURST', len(CONTEXT_QUERIES) + 1)),
+    name='ddgs',
+)
+# Background (batch) searches also wait on their own, slower bucket, so a running
+# batch takes at most this share of ddgs_limiter and interactive searches keep the rest.
+ddgs_batch_limiter = TokenBucket(
+    rate=float(os.environ.get('DDGS_BATCH_RATE_PER_SECOND', 0.5)),
+    capacity=1,
+    name='ddgs_batch',
+)
+ddgs_flights = SingleFlight(name='ddgs')
+# Query variants run on their own pool so a fan-out never waits on the caller's executor.
+fanout_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('SEARCH_FANOUT_WORKERS', 8)),
+                                     thread_name_prefix='ddgs-fanout')
+
+
+def acquire_ddgs():
+    """Waits for a DDGS token; background work first waits on its own ddgs_batch_limiter budget."""
+    if is_background():
+        ddgs_batch_limiter.acquire()
+    return ddgs_limiter.acquire()
+
+
+# Only DuckDuckGo calls wait on the limiter, so a hedge to another backend is never throttled by it.
+backends = build_backends(SEARCH_BACKENDS, DDGSBackend(lambda: DDGS(timeout=SEARCH_TIMEOUT),
+                                                       acquire_ddgs))
+
+
+def search_stats():
+    """Limiter wait, request coalescing, record/replay counters and backend latency for the stats endpoint."""
+    return {"limiter": ddgs_limiter.stats(), "batch_limiter": ddgs_batch_limiter.stats(),
+            "singleflight": ddgs_flights.stats(), "providers": provider_cassette.stats(),
+            "backends": [backend.name for backend in backends], "latency": search_backends.latency_tracker.stats()}
+
+
+def open_search_session():
+    """Opens a search session (over SEARCH_BACKENDS) that several searches for the same request can share.
+
+    In record/replay provider mode the session records to or answers from the cassette.
+    """
+    return search_session(lambda: search_backends.open_session(backends))
+
+
+@contextmanager
+def _session(ddgs=None):
+    if ddgs is not None:
+        yield ddgs
+    else:
+        with open_search_session() as session:
+            yield session
+
+
+def _text_search(query, ddgs=None):
+    with track('ddgs_text'), _session(ddgs) as session:
+        # Use a region valid for Japan to get Japanese results
+        results = count_results('ddgs_text', list(session.text(query, region='jp-jp', max_results=CONTEXT_RESULTS_PER_QUERY)))
+    # Size of the parsed results, not of the HTTP responses (DDGS does not expose those)
+    record('search_result_bytes', len(json.dumps(results, ensure_ascii=False).encode('utf-8')))
+    return results
+
+
+def rank_results(product_name, results, top_k=CONTEXT_TOP_K):
+    """Merges results from several queries (deduplicated by URL) and returns the top_k by BM25."""
+    unique = list({r['href']: r for r in reversed(results)}.values())[::-1]  # first occurrence wins
+    scores = bm25_scores(f"{product_name} {CONTEXT_RANKING_TERMS}", [f"{r['title']} {r['body']}" for r in unique])
+    ranked = sorted(zip(scores, range(len(unique))), key=lambda pair: (-pair[0], pair[1]))
+    return [unique[index] for _, index in ranked[:top_k]]
+
+
+def fetch_product_info(product_name, ddgs=None):
+    """Queries DuckDuckGo for product context with every CONTEXT_QUERIES variant concurrently.
+
+    Wall-clock time is that of the slowest variant. `ddgs` (if given) serves the
+    first variant; the others open their own sessions. Raises only if every
+    variant fails.
+    """
+    queries = [template.format(product_name=product_name) for template in CONTEXT_QUERIES]
+    futures = [fanout_executor.submit(in_context(_text_search), query, ddgs if i == 0 else None) for i, query in enumerate(queries)]
+    results, errors = [], []
+    for query, future in zip(queries, futures):
+        try:
+            results.extend(future.result())
+        except Exception as e:
+            logging.warning(f"Search variant failed ({query}): {e}")
+            errors.append(e)
+    if errors and len(errors) == len(queries):
+        raise errors[0]
+
+    context = ""
+    ranked = rank_results(product_name, results)
+    if ranked:
+        for r in ranked:
+            context += f"Title: {r['title']}\nSnippet: {r['body']}\nURL: {r['href']}\n\n"
+    else:
+        logging.warning("No search results found.")
+    return context
+
+
+def search_product_info(product_name, ddgs=None):
+    """Searches for product information using DuckDuckGo, served from the shared cache when possible.
+
+    Pass `ddgs` to reuse an open session (see open_search_session).
+    """
+    logging.info(f"Searching for information on: {product_name}")
+    try:
+        flight = ("context", normalize_product_name(product_name))
+        fetch = lambda: ddgs_flights.do(flight, lambda: fetch_product_info(product_name, ddgs))
+        if provider_cassette.bypasses_cache():
+            return fetch()
+        return shared_cache.get_or_fetch("context", product_name, CONTEXT_QUERY, fetch)
+    except Exception as e:
+        logging.error(f"Search failed: {e}")
+        return ""
+
+
+def fetch_product_images(product_name, count, ddgs=None):
+    """Queries DuckDuckGo for up to `count` distinct image URLs. Raises on network/provider errors.
+
+    Over-fetches by IMAGE_OVERFETCH and collapses near-duplicates (see image_dedup).
+    `exhausted` records that fewer than `count` distinct images were found, so a
+    later call asking for more can still be served from the cache.
+    """
+    with track('ddgs_images'), _session(ddgs) as session:
+        # Added "white background" to query to get cleaner images
+        results = count_results('ddgs_images', [r for r in session.images(
+            IMAGE_QUERY.format(product_name=product_name), region='jp-jp', max_results=count * IMAGE_OVERFETCH)])
+    record('search_result_bytes', len(json.dumps(results, ensure_ascii=False).encode('utf-8')))
+    urls = [r['image'] for r in dedupe_candidates(results)]
+    return {"urls": urls, "exhausted": len(urls) < count} if urls else None
+
+
+def search_product_images(product_name, count=20, ddgs=None):
+    """Searches for multiple product images using DuckDuckGo.
+
+    Results are cached per (product, query) regardless of `count`; a cached list at
+    least as long as the request (or one the provider could not extend) is sliced.
+    """
+    logging.info(f"Searching for {count} images of: {product_name}")
+    fetch_count = max(count, IMAGE_FETCH_MIN)
+    flight = ("images", normalize_product_name(product_name), fetch_count)
+    try:
+        fetch = lambda: ddgs_flights.do(flight, lambda: fetch_product_images(product_name, fetch_count, ddgs))
+        if provider_cassette.bypasses_cache():
+            entry = fetch()
+        else:
+            entry = shared_cache.get_or_fetch(
+                "images", product_name, IMAGE_QUERY, fetch,
+                accept=lambda cached: cached["exhausted"] or len(cached["urls"]) >= count,
+            )
+        if entry:
+            return entry["urls"][:count]
+    except Exception as e:
+        logging.error(f"Image search failed: {e}")
+    return []
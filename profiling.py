@@ -0,0 +1,147 @@
+import json
+import math
+import time
+import logging
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# The profile of the run (or batch item) executing in this context. Helpers below
+# are no-ops when no profile is active, so library code can call them freely.
+_active = contextvars.ContextVar('proposal_profile', default=None)
+
+
+class RunProfile:
+    """Wall/CPU time per stage plus counters (bytes fetched, search result sizes, prompt and response sizes) for one run.
+
+    CPU time is that of the thread running the stage; work a stage hands to
+    other pools shows up in its wall time and, via `in_context`, its counters.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def add_stage(self, stage, wall, cpu):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {'wall': 0.0, 'cpu': 0.0})
+            entry['wall'] += wall
+            entry['cpu'] += cpu
+
+    def add(self, counter, amount):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'stages': {stage: {k: round(v, 6) for k, v in times.items()} for stage, times in self.stages.items()},
+                'total_wall': round(sum(times['wall'] for times in self.stages.values()), 6),
+                'counters': dict(self.counters),
+            }
+
+
+@contextmanager
+def stage(name):
+    """Times a stage of the active profile (wall and this thread's CPU)."""
+    profile = _active.get()
+    if profile is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        profile.add_stage(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+
+def record(counter, amount):
+    """Adds to a counter of the active profile, if any."""
+    profile = _active.get()
+    if profile is not None:
+        profile.add(counter, amount)
+
+
+def in_context(fn):
+    """Wraps `fn` for an executor so each call runs in a copy of the submitting context (keeps the profile)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def aggregate(profiles):
+    """Per-stage count/mean/p50/p95 of wall and CPU time, and counter totals, across batch items."""
+    stages, counters = {}, {}
+    for profile in profiles:
+        for name, times in profile['stages'].items():
+            for kind in ('wall', 'cpu'):
+                stages.setdefault(name, {'wall': [], 'cpu': []})[kind].append(times[kind])
+        for name, amount in profile['counters'].items():
+            counters[name] = counters.get(name, 0) + amount
+    summary = {}
+    for name, samples in stages.items():
+        summary[name] = {'count': len(samples['wall'])}
+        for kind, values in samples.items():
+            summary[name][kind] = {
+                'mean': round(sum(values) / len(values), 6),
+                'p50': round(percentile(values, 50), 6),
+                'p95': round(percentile(values, 95), 6),
+            }
+    return {'items': len(profiles), 'stages': summary, 'counters': counters}
+
+
+def format_run(profile):
+    lines = [f"{'stage':<18} {'wall (s)':>10} {'cpu (s)':>10}"]
+    for name, times in profile['stages'].items():
+        lines.append(f"{name:<18} {times['wall']:>10.3f} {times['cpu']:>10.3f}")
+    lines.append(f"{'total':<18} {profile['total_wall']:>10.3f}")
+    lines.extend(f"{name:<28} {amount:>12,}" for name, amount in sorted(profile['counters'].items()))
+    return '\n'.join(lines)
+
+
+def format_aggregate(summary):
+    lines = [f"{'stage':<18} {'n':>5} {'wall p50':>10} {'wall p95':>10} {'cpu p50':>10} {'cpu p95':>10}"]
+    for name, stats in summary['stages'].items():
+        lines.append(f"{name:<18} {stats['count']:>5} {stats['wall']['p50']:>10.3f} {stats['wall']['p95']:>10.3f} "
+                     f"{stats['cpu']['p50']:>10.3f} {stats['cpu']['p95']:>10.3f}")
+    lines.extend(f"{name:<28} {amount:>12,}" for name, amount in sorted(summary['counters'].items()))
+    return '\n'.join(lines)
+
+
+def write_json(path, report):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logging.info(f"Profile written to {path}")
+
+
+@contextmanager
+def cprofile_to(path):
+    """Runs the block under cProfile (calling thread only) and dumps pstats to `path` if given."""
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        logging.info(f"cProfile stats written to {path} (view with: python -m pstats {path})")
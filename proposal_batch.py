@@ -0,0 +1,178 @@
+import os
+import csv
+import json
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Catalog headers we accept for each field (supplier lists come in English or Japanese).
+COLUMN_ALIASES = {
+    'name': ('name', 'product_name', '商品名'),
+    'price': ('price', '納品価格', '価格'),
+    'capacity': ('capacity', '容量'),
+    'image_url': ('image_url', 'image', '画像URL', '画像'),
+}
+
+
+def item_key(item):
+    """Stable id for a catalog row, so a resumed run recognizes it even if rows are reordered."""
+    payload = json.dumps([item['name'], item['price'], item['capacity'], item.get('image_url') or ''], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def read_catalog(path):
+    """Reads a CSV/TSV catalog of name, price, capacity and optional image URL."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        delimiter = '\t' if path.lower().endswith('.tsv') or sample.count('\t') > sample.count(',') else ','
+        reader = csv.DictReader(f, delimiter=delimiter)
+        columns = {}
+        for field, aliases in COLUMN_ALIASES.items():
+            for header in reader.fieldnames or []:
+                if header.strip().lower() in aliases:
+                    columns[field] = header
+                    break
+        missing = [field for field in ('name', 'price', 'capacity') if field not in columns]
+        if missing:
+            raise ValueError(f"Catalog {path} is missing columns: {', '.join(missing)}")
+
+        items = []
+        for row in reader:
+            item = {field: (row.get(header) or '').strip() for field, header in columns.items()}
+            if item['name']:
+                items.append(item)
+    return items
+
+
+class BatchJournal:
+    """Append-only JSONL checkpoint of finished catalog rows.
+
+    Each line records one attempt; the last line for a key wins. Rows whose last
+    status is 'done' are skipped when the batch is run again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        records = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn last line from a crash
+                    records[record['key']] = record
+        return records
+
+    def record(self, key, status, **fields):
+        entry = {'key': key, 'status': status, 'at': time.time(), **fields}
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def run_batch(items, process, journal, jobs=4):
+    """Runs `process(item)` for every catalog row not yet done, `jobs` at a time.
+
+    `process` returns the output path and raises on failure. Returns a dict with
+    done/failed/skipped counts.
+    """
+    finished = journal.load()
+    pending = [item for item in items if finished.get(item_key(item), {}).get('status') != 'done']
+    summary = {'done': 0, 'failed': 0, 'skipped': len(items) - len(pending)}
+    if summary['skipped']:
+        logging.info(f"Resuming batch: {summary['skipped']} of {len(items)} products already done")
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(process, item): item for item in pending}
+        try:
+            for position, future in enumerate(as_completed(futures), start=1):
+                item = futures[future]
+                key = item_key(item)
+                try:
+                    output = future.result()
+                except Exception as e:
+                    logging.error(f"[{position}/{len(pending)}] Failed: {item['name']}: {e}")
+                    journal.record(key, 'failed', name=item['name'], error=str(e))
+                    summary['failed'] += 1
+                else:
+                    logging.info(f"[{position}/{len(pending)}] Done: {item['name']} -> {output}")
+                    journal.record(key, 'done', name=item['name'], output=output)
+                    summary['done'] += 1
+        except KeyboardInterrupt:
+            logging.warning("Interrupted; finished products are kept in the journal.")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return summary
+
+
+class BatchJob:
+    """In-memory state of a batch submitted through the web API.
+
+    Worker threads call `update()`; subscribers (e.g. an SSE stream) get each
+    item event through the callbacks registered with `subscribe()`.
+    """
+
+    def __init__(self, items):
+        self.id = uuid.uuid4().hex
+        self.created_at = time.time()
+        self.items = [{'index': i, **item, 'status': 'queued', 'error': None} for i, item in enumerate(items)]
+        self.results = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    @property
+    def finished(self):
+        return all(item['status'] in ('done', 'failed') for item in self.items)
+
+    def update(self, index, status, error=None, result=None):
+        with self._lock:
+            item = self.items[index]
+            item['status'] = status
+            item['error'] = error
+            if result is not None:
+                self.results[index] = result
+            event = dict(item)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(event)
+
+    def subscribe(self, listener):
+        """Registers `listener` for item events; returns the indices of items not finished yet.
+
+        Both happen under one lock, so each returned item is guaranteed a later
+        'done' or 'failed' event.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            return {item['index'] for item in self.items if item['status'] not in ('done', 'failed')}
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def summary(self, include_items=True):
+        with self._lock:
+            counts = {status: 0 for status in ('queued', 'running', 'done', 'failed')}
+            for item in self.items:
+                counts[item['status']] += 1
+            summary = {
+                'job_id': self.id,
+                'created_at': self.created_at,
+                'total': len(self.items),
+                'finished': counts['done'] + counts['failed'] == len(self.items),
+                **counts,
+            }
+            if include_items:
+                summary['items'] = [dict(item) for item in self.items]
+        return summary
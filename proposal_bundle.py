@@ -0,0 +1,93 @@
+import io
+import os
+import base64
+import logging
+import threading
+import httpx
+from fontTools import subset
+from fontTools.ttLib import TTFont
+from markupsafe import Markup
+from image_store import image_store
+from proposal_render import BASE_DIR, render_proposal_html
+
+# Noto Sans JP (variable weight) used for self-contained bundles. Set NOTO_FONT_PATH
+# to a local copy; otherwise it is downloaded once from Google Fonts' repository.
+FONT_PATH = os.environ.get(
+    'NOTO_FONT_PATH', os.path.join(BASE_DIR, 'output', 'cache', 'fonts', 'NotoSansJP-VariableFont_wght.ttf'))
+FONT_URL = 'https://github.com/google/fonts/raw/main/ofl/notosansjp/NotoSansJP%5Bwght%5D.ttf'
+FONT_FAMILY = 'Noto Sans JP'
+
+_font_lock = threading.Lock()
+
+try:
+    import brotli  # noqa: F401  (needed by fontTools for WOFF2)
+    FONT_FLAVOR, FONT_MIME, FONT_FORMAT = 'woff2', 'font/woff2', 'woff2'
+except ImportError:
+    FONT_FLAVOR, FONT_MIME, FONT_FORMAT = 'woff', 'font/woff', 'woff'
+
+
+def font_path():
+    """Local path of the bundle font, downloading it on first use."""
+    with _font_lock:
+        if not os.path.exists(FONT_PATH):
+            logging.info(f"Downloading {FONT_FAMILY} to {FONT_PATH}")
+            response = httpx.get(FONT_URL, follow_redirects=True, timeout=60)
+            response.raise_for_status()
+            os.makedirs(os.path.dirname(FONT_PATH), exist_ok=True)
+            with open(FONT_PATH + '.part', 'wb') as f:
+                f.write(response.content)
+            os.replace(FONT_PATH + '.part', FONT_PATH)
+    return FONT_PATH
+
+
+def used_characters(html):
+    """Every character that can appear on the page: text, attribute values and CSS `content:` strings."""
+    return ''.join(sorted(ch for ch in set(html) if ch.isprintable() and not ch.isspace()))
+
+
+def subset_font(text, path=None):
+    """Returns a WOFF2 (or WOFF) subset of the font containing only the glyphs for `text`."""
+    options = subset.Options()
+    options.flavor = FONT_FLAVOR
+    options.layout_features = ['*']  # keep kerning, vertical/proportional alternates
+    options.name_IDs = []
+    options.notdef_outline = True
+    font = TTFont(path or font_path())
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+    output = io.BytesIO()
+    font.flavor = FONT_FLAVOR
+    font.save(output)
+    return output.getvalue()
+
+
+def font_face_css(font_bytes):
+    encoded = base64.b64encode(font_bytes).decode('ascii')
+    return Markup(
+        f"@font-face {{ font-family: '{FONT_FAMILY}'; font-weight: 100 900; font-display: block; "
+        f"src: url(data:{FONT_MIME};base64,{encoded}) format('{FONT_FORMAT}'); }}"
+    )
+
+
+def embedded_image(image_url):
+    """data: URI of the proposal's print-resolution image, or the original URL if it cannot be fetched."""
+    path = image_store.localize(image_url) if image_url else None
+    if not path:
+        return image_url
+    with open(path, 'rb') as f:
+        return f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+
+def render_proposal_bundle(data, image_url, font=None):
+    """Renders a single self-contained proposal HTML file.
+
+    The stylesheet is already inline in the template; the image is embedded as a
+    data URI and the Google Fonts import is replaced by a Noto Sans JP subset
+    holding only the glyphs this proposal uses, so it opens and prints offline.
+    """
+    text = used_characters(render_proposal_html(data, image_url))
+    font_bytes = subset_font(text, font)
+    html = render_proposal_html(data, embedded_image(image_url), font_face=font_face_css(font_bytes))
+    logging.info(f"Bundled proposal: {len(text)} glyphs, {len(font_bytes) // 1024} KB font, {len(html) // 1024} KB total")
+    return html
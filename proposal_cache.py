@@ -0,0 +1,264 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+# Shared by create_proposal_v4.py and app_v5.py so CLI and web runs reuse each other's results.
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output', 'cache', 'proposal_cache.sqlite3')
+CACHE_PATH = os.environ.get('PROPOSAL_CACHE_PATH', DEFAULT_CACHE_PATH)
+CACHE_TTL = float(os.environ.get('PROPOSAL_CACHE_TTL', 7 * 24 * 3600))
+CACHE_STALE_TTL = float(os.environ.get('PROPOSAL_CACHE_STALE_TTL', 30 * 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get('PROPOSAL_CACHE_MAX_ENTRIES', 5000))
+CACHE_MEMORY_BYTES = int(os.environ.get('PROPOSAL_CACHE_MEMORY_BYTES', 8 * 1024 * 1024))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    product TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS entries_product ON entries (product);
+"""
+
+
+def normalize_product_name(product_name):
+    """Normalizes a product name so full/half-width and spacing variants share a cache entry."""
+    return " ".join(unicodedata.normalize("NFKC", product_name).lower().split())
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU bounded by the approximate size of its values in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def discard_where(self, predicate):
+        """Drops every entry for which predicate(key, value) is true."""
+        with self._lock:
+            for key in [k for k, (value, _) in self._entries.items() if predicate(k, value)]:
+                self._size -= self._entries.pop(key)[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ProposalCache:
+    """SQLite-backed key/value cache with TTL, stale-while-revalidate and LRU eviction.
+
+    Entries younger than `ttl` are fresh. Entries older than that but within
+    `ttl + stale_ttl` are returned immediately while a background thread refreshes
+    them. Anything older is treated as a miss. Recently used entries are also kept
+    in a memory-bounded LRU so hot keys skip SQLite entirely.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, max_entries=CACHE_MAX_ENTRIES,
+                 memory_bytes=CACHE_MEMORY_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.memory = LRUCache(memory_bytes)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._touched = {}
+        self._initialized = False
+        self._stats = Counter()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            # Switching to WAL needs an exclusive lock; doing it (and the schema) once, under
+            # the lock, keeps threads that connect at the same time from waiting out the timeout.
+            with self._lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        """Returns (value, state) where state is 'fresh', 'stale' or None for a miss."""
+        now = time.time()
+        cached = self.memory.get((namespace, key))
+        if cached is None:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created_at, product FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                return None, None
+            raw, created_at, product = row
+            cached = (json.loads(raw), created_at, product)
+            self.memory.set((namespace, key), cached, len(raw))
+        value, created_at, _ = cached
+        age = now - created_at
+        if age >= self.ttl + self.stale_ttl:
+            return None, None
+        # Recency is written back lazily on the next write so memory hits never touch SQLite.
+        with self._lock:
+            self._touched[(namespace, key)] = now
+        return value, ('fresh' if age < self.ttl else 'stale')
+
+    def set(self, namespace, key, value, product=''):
+        conn = self._connect()
+        now = time.time()
+        raw = json.dumps(value, ensure_ascii=False)
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, product, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, product, raw, now, now),
+            )
+            self._evict(conn)
+        self.memory.set((namespace, key), (value, now, product), len(raw))
+
+    def _evict(self, conn):
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        conn.executemany(
+            "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+            [(at, namespace, key) for (namespace, key), at in touched.items()],
+        )
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            evicted = conn.execute(
+                "SELECT namespace, key FROM entries ORDER BY accessed_at LIMIT ?", (overflow,)
+            ).fetchall()
+            conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", evicted)
+            evicted = set(evicted)
+            self.memory.discard_where(lambda k, _: k in evicted)
+
+    def invalidate(self, namespace=None, product_name=None):
+        """Deletes entries matching the namespace and/or product name. Returns the number removed."""
+        clauses, params = [], []
+        if namespace:
+            clauses.append("namespace = ?")
+            params.append(namespace)
+        if product_name:
+            clauses.append("product = ?")
+            params.append(normalize_product_name(product_name))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        product = normalize_product_name(product_name) if product_name else None
+        # Match on the stored product, not the key: gemini/proposals keys are content hashes
+        self.memory.discard_where(
+            lambda k, cached: (not namespace or k[0] == namespace) and (not product or cached[2] == product)
+        )
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(f"DELETE FROM entries{where}", params)
+        return cursor.rowcount
+
+    def lookup(self, namespace, key):
+        """Returns the cached value (fresh or stale) or None, treating storage errors as a miss."""
+        try:
+            value, state = self.get(namespace, key)
+        except sqlite3.Error as e:
+            logging.warning(f"Cache read failed: {e}")
+            return None
+        return value if state else None
+
+    def record(self, namespace, outcome, amount=1):
+        """Counts a cache outcome (hit, stale, miss, ...) for the stats endpoint."""
+        with self._lock:
+            self._stats[(namespace, outcome)] += amount
+
+    def stats(self):
+        """Returns per-namespace outcome counters since process start."""
+        with self._lock:
+            snapshot = {}
+            for (namespace, outcome), count in self._stats.items():
+                snapshot.setdefault(namespace, {})[outcome] = count
+        return snapshot
+
+    def get_or_fetch(self, namespace, product_name, query_template, fetch, accept=None):
+        """Returns the cached value for (product, query), calling `fetch()` on a miss.
+
+        `accept(value)` can reject a cached value that cannot serve this call (for
+        example too few images), which is then treated as a miss. Falsy results
+        (no search hits) are not cached so they are retried next time.
+        """
+        product = normalize_product_name(product_name)
+        key = f"{product}\x1f{query_template}"
+        try:
+            value, state = self.get(namespace, key)
+        except sqlite3.Error as e:
+            logging.warning(f"Cache read failed: {e}")
+            value, state = None, None
+        if state and accept is not None and not accept(value):
+            state = None
+        self.record(namespace, {'fresh': 'hit', 'stale': 'stale_hit'}.get(state, 'miss'))
+        if state == 'fresh':
+            return value
+        if state == 'stale':
+            self._refresh_in_background(namespace, key, product, fetch)
+            return value
+        value = fetch()
+        self.store(namespace, key, value, product=product)
+        return value
+
+    def store(self, namespace, key, value, product=''):
+        """Writes a value unless it is empty, logging (not raising) storage errors."""
+        if not value:
+            return
+        try:
+            self.set(namespace, key, value, product=product)
+        except sqlite3.Error as e:
+            logging.warning(f"Cache write failed: {e}")
+
+    def _refresh_in_background(self, namespace, key, product, fetch):
+        with self._lock:
+            if (namespace, key) in self._refreshing:
+                return
+            self._refreshing.add((namespace, key))
+
+        def refresh():
+            try:
+                self.store(namespace, key, fetch(), product=product)
+            except Exception as e:
+                logging.warning(f"Background cache refresh failed for {product}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard((namespace, key))
+
+        threading.Thread(target=refresh, name="cache-refresh", daemon=True).start()
+
+
+shared_cache = ProposalCache()
@@ -0,0 +1,259 @@
+import json
+import hashlib
+import logging
+from context_builder import prompt_context
+from gemini_client import get_client_manager
+from metrics import track
+from profiling import record
+from proposal_cache import normalize_product_name, shared_cache
+import provider_cassette
+
+MODEL_NAME = 'gemini-3-flash-preview'
+GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+
+def build_proposal_prompt(product_name, price, capacity, context):
+    """Builds the Gemini prompt shared by the CLI and the web app."""
+    return f"""
+    あなたはプロのセールスライターです。以下の商品情報をもとに、顧客（バイヤー）向けの提案書を作成するための情報をJSON形式で抽出・生成してください。
+    必ず有効なJSON形式で出力してください。Markdownのコードブロックは使用しないでください。
+
+    【商品名】
+    {product_name}
+
+    【価格】
+    {price}
+
+    【容量】
+    {capacity}
+
+    【検索された背景情報】
+    {context}
+
+    【要件】
+    1.  **catch_copy**: ひと目で興味を惹くキャッチコピー（20文字以内）。
+    2.  **benefits**: 主要なベネフィットを3つ。
+        - title: ベネフィットの見出し（15文字以内）
+        - detail: 詳細説明（50文字以内）
+    3.  **product_specs**: 商品の基本スペックや特徴を3〜5個の箇条書きで。
+    4.  **comment**: バイヤーへの推薦コメント（100文字程度）。ベネフィットを要約し、熱意を持って勧める文章。
+    5.  **target**: どのような顧客層に売れるか（例：30代主婦、健康志向の男性など）。
+
+    【出力JSONフォーマット】
+    {{
+        "product_name": "{product_name}",
+        "price": "{price}",
+        "capacity": "{capacity}",
+        "catch_copy": "...",
+        "benefits": [
+            {{"title": "...", "detail": "..."}},
+            {{"title": "...", "detail": "..."}},
+            {{"title": "...", "detail": "..."}}
+        ],
+        "product_specs": ["...", "..."],
+        "comment": "...",
+        "target": "..."
+    }}
+    """
+
+
+def response_cache_key(model_name, prompt, generation_config):
+    """Content address for a Gemini response: any change to model, prompt or config is a new key."""
+    payload = json.dumps([model_name, prompt, generation_config], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _cached_response(key, force_regenerate):
+    """Returns cached proposal data for `key` (recording hit/miss/forced), or None.
+
+    Always None in record/replay mode, where Gemini answers come from the cassette.
+    """
+    if provider_cassette.bypasses_cache():
+        return None
+    if force_regenerate:
+        shared_cache.record("gemini", "forced")
+        return None
+    cached = shared_cache.lookup("gemini", key)
+    if cached:
+        shared_cache.record("gemini", "hit")
+        shared_cache.record("gemini", "tokens_saved", cached.get("total_tokens", 0))
+        record('gemini_cache_hits', 1)
+        logging.info("Using cached Gemini response.")
+        return cached["data"]
+    shared_cache.record("gemini", "miss")
+    return None
+
+
+def _store_response(key, product_name, data, response):
+    usage = getattr(response, 'usage_metadata', None)
+    total_tokens = getattr(usage, 'total_token_count', 0) or 0
+    record('prompt_tokens', getattr(usage, 'prompt_token_count', 0) or 0)
+    record('response_tokens', getattr(usage, 'candidates_token_count', 0) or 0)
+    shared_cache.store("gemini", key, {"data": data, "total_tokens": total_tokens},
+                       product=normalize_product_name(product_name))
+
+
+def generate_proposal_json(api_key, product_name, price, capacity, context, force_regenerate=False):
+    """Generates structured proposal content using Gemini API, reusing cached responses.
+
+    Identical requests (same model, final prompt and generation config) return the
+    previously parsed JSON without calling Gemini unless `force_regenerate` is set.
+    """
+    prompt = build_proposal_prompt(product_name, price, capacity, prompt_context(product_name, context))
+    record('prompt_chars', len(prompt))
+    key = response_cache_key(MODEL_NAME, prompt, GENERATION_CONFIG)
+    cached = _cached_response(key, force_regenerate)
+    if cached:
+        return cached
+
+    logging.info("Generating content with Gemini...")
+    try:
+        with track('gemini_generate'):
+            response = get_client_manager(MODEL_NAME, api_key).generate_content(prompt, generation_config=GENERATION_CONFIG)
+        with track('json_parse'):
+            record('response_chars', len(response.text))
+            data = json.loads(response.text)
+    except Exception as e:
+        logging.error(f"Gemini generation failed: {e}")
+        return None
+
+    _store_response(key, product_name, data, response)
+    return data
+
+
+class ProposalStreamParser:
+    """Incrementally parses the top-level JSON object Gemini streams back.
+
+    `feed()` takes the next chunk of text and returns the events that became
+    complete with it: ("field", {"key", "value"}) for a finished top-level value
+    and ("item", {"key", "index", "value"}) for each finished element of a
+    top-level array (benefits, product_specs), so the UI can fill sections
+    before the whole response has arrived.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.key = None
+        self.array_index = None
+        self._decoder = json.JSONDecoder()
+
+    def _skip_whitespace(self):
+        while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+            self.pos += 1
+
+    def _next_char_after(self, end):
+        while end < len(self.buffer) and self.buffer[end] in " \t\r\n":
+            end += 1
+        return self.buffer[end] if end < len(self.buffer) else None
+
+    def _decode_value(self):
+        """Decodes the value at pos, or returns None if more text is needed to be sure it is complete."""
+        try:
+            value, end = self._decoder.raw_decode(self.buffer, self.pos)
+        except ValueError:
+            return None
+        # Strings and containers end with their own delimiter; numbers and literals
+        # ("12" of "123") are only known to be complete once a separator follows.
+        if self.buffer[self.pos] not in '"{[' and self._next_char_after(end) is None:
+            return None
+        return value, end
+
+    def feed(self, text):
+        self.buffer += text
+        events = []
+        while True:
+            self._skip_whitespace()
+            if self.pos >= len(self.buffer):
+                break
+            char = self.buffer[self.pos]
+            if not self.started:
+                if char != '{':
+                    raise ValueError("Expected a JSON object")
+                self.started = True
+                self.pos += 1
+            elif self.key is None:
+                if char in ',}':
+                    self.pos += 1
+                    continue
+                try:
+                    key, end = self._decoder.raw_decode(self.buffer, self.pos)
+                except ValueError:
+                    break
+                if self._next_char_after(end) != ':':
+                    break
+                self.pos = self.buffer.index(':', end) + 1
+                self.key = key
+            elif self.array_index is None and char == '[':
+                self.array_index = 0
+                self.pos += 1
+            elif self.array_index is not None:
+                if char == ',':
+                    self.pos += 1
+                elif char == ']':
+                    self.pos += 1
+                    self.key, self.array_index = None, None
+                else:
+                    decoded = self._decode_value()
+                    if decoded is None:
+                        break
+                    value, self.pos = decoded
+                    events.append(("item", {"key": self.key, "index": self.array_index, "value": value}))
+                    self.array_index += 1
+            else:
+                decoded = self._decode_value()
+                if decoded is None:
+                    break
+                value, self.pos = decoded
+                events.append(("field", {"key": self.key, "value": value}))
+                self.key = None
+        return events
+
+
+def proposal_events(data):
+    """Expands finished proposal data into the same events the stream parser emits."""
+    for key, value in data.items():
+        if isinstance(value, list):
+            for index, item in enumerate(value):
+                yield "item", {"key": key, "index": index, "value": item}
+        else:
+            yield "field", {"key": key, "value": value}
+
+
+def stream_proposal_json(api_key, product_name, price, capacity, context, force_regenerate=False):
+    """Streams proposal generation as (event, payload) pairs.
+
+    Yields field/item events as soon as each value is complete, then ("done", data)
+    with the full parsed JSON, or ("error", {...}) if generation fails. Cached
+    responses are replayed as events immediately.
+    """
+    prompt = build_proposal_prompt(product_name, price, capacity, prompt_context(product_name, context))
+    record('prompt_chars', len(prompt))
+    key = response_cache_key(MODEL_NAME, prompt, GENERATION_CONFIG)
+    cached = _cached_response(key, force_regenerate)
+    if cached:
+        yield from proposal_events(cached)
+        yield "done", cached
+        return
+
+    logging.info("Streaming content from Gemini...")
+    parser = ProposalStreamParser()
+    try:
+        with track('gemini_generate'):
+            chunks = get_client_manager(MODEL_NAME, api_key).generate_content(
+                prompt, generation_config=GENERATION_CONFIG, stream=True)
+            chunk = None
+            for chunk in chunks:
+                yield from parser.feed(chunk.text)
+        with track('json_parse'):
+            record('response_chars', len(parser.buffer))
+            data = json.loads(parser.buffer)
+    except Exception as e:
+        logging.error(f"Gemini generation failed: {e}")
+        yield "error", {"detail": "Failed to generate content"}
+        return
+
+    # The last chunk carries the usage totals for the whole response
+    _store_response(key, product_name, data, chunk)
+    yield "done", data
@@ -0,0 +1,117 @@
+import io
+import os
+import logging
+import pathlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# WeasyPrint (HTML → PDF) and pypdf (merging) are optional; without them the
+# rest of the app works and PDF export reports that it is unavailable.
+try:
+    from weasyprint import CSS, HTML, default_url_fetcher
+    from weasyprint.text.fonts import FontConfiguration
+except (ImportError, OSError):  # OSError: installed, but the Pango system libraries are missing
+    HTML = None
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Layout is CPU-bound and holds the GIL, so PDFs are rendered in worker processes.
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', os.cpu_count() or 1))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PdfUnavailable(RuntimeError):
+    """Raised when the optional PDF dependencies are not installed."""
+
+
+def pdf_available():
+    return HTML is not None and PdfWriter is not None
+
+
+def require_pdf():
+    if not pdf_available():
+        raise PdfUnavailable("PDF export needs the optional packages weasyprint and pypdf (pip install weasyprint pypdf)")
+
+
+def pdf_executor():
+    """Process-wide pool of PDF workers, created on first use.
+
+    Workers are spawned rather than forked so they never inherit the web server's
+    threads or open SQLite handles; each worker imports WeasyPrint once and reuses it.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def pdf_font():
+    """Local path of the Noto Sans JP file PDFs use, downloading it once; None if it cannot be fetched.
+
+    Called in the parent process so workers never race to download the font.
+    """
+    import httpx
+    from proposal_bundle import font_path  # not imported by the workers, which only need the path
+    try:
+        return font_path()
+    except (httpx.HTTPError, OSError) as e:
+        logging.warning(f"Noto Sans JP unavailable, PDFs fall back to system fonts: {e}")
+        return None
+
+
+def local_url_fetcher(url, *args, **kwargs):
+    """WeasyPrint URL fetcher that only reads local (file: and data:) resources.
+
+    The proposal template still @imports Google Fonts and may point at a remote
+    image if it could not be stored locally; neither is fetched during rendering.
+    """
+    if not url.startswith(('file:', 'data:')):
+        raise ValueError(f"Remote resource not fetched while rendering PDF: {url}")
+    return default_url_fetcher(url, *args, **kwargs)
+
+
+def html_to_pdf(html, base_url=BASE_DIR, font=None):
+    """Renders one standalone proposal HTML document to PDF bytes (runs in a worker process).
+
+    Relative URLs (e.g. locally stored images) resolve against `base_url`; remote
+    URLs are not fetched. `font` (see pdf_font) supplies Noto Sans JP from disk.
+    """
+    require_pdf()
+    document = HTML(string=html, base_url=base_url, url_fetcher=local_url_fetcher)
+    if not font:
+        return document.write_pdf()
+    font_config = FontConfiguration()
+    css = CSS(string=f"@font-face {{ font-family: 'Noto Sans JP'; src: url('{pathlib.Path(font).as_uri()}'); }}",
+              font_config=font_config, url_fetcher=local_url_fetcher)
+    return document.write_pdf(stylesheets=[css], font_config=font_config)
+
+
+def merge_pdfs(pdfs):
+    """Concatenates PDF documents (bytes) into one multi-page PDF."""
+    require_pdf()
+    writer = PdfWriter()
+    for pdf in pdfs:
+        writer.append(io.BytesIO(pdf))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def render_pdfs(htmls, executor=None, base_urls=None):
+    """Renders HTML documents to PDF bytes in parallel, preserving order."""
+    require_pdf()
+    font = pdf_font()
+    return list((executor or pdf_executor()).map(html_to_pdf, htmls, base_urls or [BASE_DIR] * len(htmls),
+                                                [font] * len(htmls)))
+
+
+def render_catalog_pdf(htmls, executor=None, base_urls=None):
+    """Renders every proposal in parallel and merges them into one catalog PDF, one proposal per page."""
+    return merge_pdfs(render_pdfs(htmls, executor, base_urls))
@@ -0,0 +1,67 @@
+import os
+import json
+import hashlib
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from metrics import track
+
+# A4 proposal layout shared by the CLI (create_proposal_v4.py) and the web app (app_v5.py).
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+BYTECODE_CACHE_DIR = os.path.join(BASE_DIR, 'output', 'cache', 'jinja')
+
+
+class LazyBytecodeCache(FileSystemBytecodeCache):
+    """FileSystemBytecodeCache that creates its directory on the first write rather than at import."""
+
+    def dump_bytecode(self, bucket):
+        os.makedirs(self.directory, exist_ok=True)
+        super().dump_bytecode(bucket)
+
+
+# One environment per process: templates are compiled once and kept in memory,
+# and the compiled bytecode is cached on disk so new processes skip compilation too.
+# Set PROPOSAL_TEMPLATE_RELOAD=1 while editing templates to pick up changes.
+template_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(['html']),
+    bytecode_cache=LazyBytecodeCache(BYTECODE_CACHE_DIR),
+    auto_reload=os.environ.get('PROPOSAL_TEMPLATE_RELOAD') == '1',
+)
+
+
+def render_proposal_html(data, image_url, font_face=None):
+    """Renders proposal data into the standalone A4 HTML document.
+
+    `font_face` (trusted CSS) replaces the Google Fonts import, e.g. with an embedded subset.
+    """
+    with track('render'):
+        return template_env.get_template('proposal.html').render(data=data, image_url=image_url, font_face=font_face)
+
+
+def render_proposal_fragment(data, image_url, editable=True):
+    """Renders just the proposal body for embedding in the web preview."""
+    with track('render'):
+        return template_env.get_template('proposal_content.html').render(data=data, image_url=image_url, editable=editable)
+
+
+_template_digests = {}
+
+
+def template_digest(names=('proposal.html', 'proposal_content.html')):
+    """Short hash of the proposal templates, so render ETags change whenever a template does."""
+    paths = [os.path.join(TEMPLATE_DIR, name) for name in names]
+    stamp = tuple(os.stat(path).st_mtime_ns for path in paths)
+    digest = _template_digests.get(stamp)
+    if digest is None:
+        h = hashlib.sha256()
+        for path in paths:
+            with open(path, 'rb') as f:
+                h.update(f.read())
+        digest = _template_digests[stamp] = h.hexdigest()[:12]
+    return digest
+
+
+def proposal_id(data, image_url):
+    """Content hash of a proposal; identical data and image always map to the same id (and ETag)."""
+    payload = json.dumps({"data": data, "image_url": image_url}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
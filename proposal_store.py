@@ -0,0 +1,50 @@
+import os
+import re
+import json
+import logging
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROPOSAL_DIR = os.environ.get('PROPOSAL_DIR', os.path.join(BASE_DIR, 'output', 'proposals'))
+PROPOSAL_ID = re.compile(r'[0-9a-f]{8,64}')
+
+
+class ProposalStore:
+    """Saved proposals as JSON files named by proposal id (a content hash).
+
+    Unlike the shared cache nothing here expires or is evicted, so /api/render,
+    bundle and PDF links stay valid for as long as the directory is kept.
+    """
+
+    def __init__(self, root=PROPOSAL_DIR):
+        self.root = root
+
+    def path(self, pid):
+        return os.path.join(self.root, pid[:2], f"{pid}.json")
+
+    def save(self, pid, proposal):
+        """Writes {data, image_url} under `pid`; ids are content hashes, so an existing file is kept."""
+        path = self.path(pid)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(proposal, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def load(self, pid):
+        """The saved proposal, or None for an unknown (or malformed) id."""
+        if not PROPOSAL_ID.fullmatch(pid):
+            return None
+        try:
+            with open(self.path(pid), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read saved proposal {pid}: {e}")
+            return None
+
+
+proposal_store = ProposalStore()
@@ -0,0 +1,270 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from types import SimpleNamespace
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# live: call DDGS/Gemini as usual. record: call them and save every response to
+# the cassette. replay: answer from the cassette only, never touching the network.
+PROVIDER_MODES = ('live', 'record', 'replay')
+PROVIDER_MODE = os.environ.get('PROVIDER_MODE', 'live')
+PROVIDER_CASSETTE = os.environ.get('PROVIDER_CASSETTE', os.path.join(BASE_DIR, 'output', 'cassettes', 'providers.jsonl.gz'))
+# Gemini needs some key to build its client; replays never send it anywhere.
+REPLAY_API_KEY = 'replay'
+USAGE_FIELDS = ('prompt_token_count', 'candidates_token_count', 'total_token_count')
+
+
+class CassetteMiss(RuntimeError):
+    """Raised in replay mode for a request the cassette has no recording of."""
+
+
+def request_key(kind, request):
+    payload = json.dumps([kind, request], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """Provider responses keyed by request, stored as gzip-compressed JSON lines.
+
+    Each line is {key, kind, request, response}; the request is kept only so a
+    cassette can be read and diffed. Recording appends every new response as its
+    own gzip member (later lines win), so an interrupted run keeps what it had;
+    a cassette that ends in such a damaged member is rewritten without it before
+    the next append, since loading stops there.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.hits = self.misses = self.recorded = 0
+        self._lock = threading.Lock()
+        self._damaged = False
+        if os.path.exists(path):
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self.entries[entry['key']] = entry
+            except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+                # A run killed mid-append leaves a truncated last member
+                logging.warning(f"Cassette {path} ends with a damaged entry, ignoring it: {e}")
+                self._damaged = True
+
+    def get(self, kind, request):
+        key = request_key(kind, request)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded {kind} response for {json.dumps(request, ensure_ascii=False)[:200]}")
+            self.hits += 1
+        return entry['response']
+
+    def put(self, kind, request, response):
+        key = request_key(kind, request)
+        with self._lock:
+            if key in self.entries and self.entries[key]['response'] == response:
+                return  # e.g. the same image served again; nothing new to append
+            self.entries[key] = {'key': key, 'kind': kind, 'request': request, 'response': response}
+            self.recorded += 1
+            self._append(self.entries[key])
+
+    def _append(self, entry):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self._damaged:
+            self._rewrite()  # already holds `entry`
+            return
+        with open(self.path, 'ab') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+            f.write((json.dumps(entry, ensure_ascii=False, sort_keys=True) + '\n').encode('utf-8'))
+
+    def _rewrite(self):
+        """Replaces the file with every loaded entry as one intact gzip member."""
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+            for entry in self.entries.values():
+                f.write((json.dumps(entry, ensure_ascii=False, sort_keys=True) + '\n').encode('utf-8'))
+        os.replace(tmp, self.path)
+        self._damaged = False
+
+    def stats(self):
+        with self._lock:
+            return {'path': self.path, 'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                    'recorded': self.recorded}
+
+
+_mode = None
+_cassette = None
+_state_lock = threading.Lock()
+
+
+def configure(mode, path=None):
+    """Switches provider mode for this process (the CLI's --record/--replay; app_v5 uses the env vars)."""
+    global _mode, _cassette
+    if mode not in PROVIDER_MODES:
+        raise ValueError(f"Unknown provider mode {mode!r}; expected one of {', '.join(PROVIDER_MODES)}")
+    with _state_lock:
+        _mode = mode
+        _cassette = Cassette(path or PROVIDER_CASSETTE) if mode != 'live' else None
+    if _cassette is not None:
+        logging.info(f"Provider {mode} mode: {_cassette.path} ({len(_cassette.entries)} recorded responses)")
+    return _cassette
+
+
+def current():
+    """(mode, cassette), configured from PROVIDER_MODE/PROVIDER_CASSETTE on first use."""
+    if _mode is None:
+        configure(PROVIDER_MODE)
+    return _mode, _cassette
+
+
+def replaying():
+    return current()[0] == 'replay'
+
+
+def bypasses_cache():
+    """Record and replay skip the shared cache for provider answers, so every call reaches the cassette."""
+    return current()[0] != 'live'
+
+
+def recorded(kind, request, compute):
+    """compute() when live; saved to the cassette when recording and answered from it when replaying.
+
+    For results derived from downloads (image hashes and scores) that a replay must not refetch.
+    """
+    mode, cassette = current()
+    if mode == 'replay':
+        return cassette.get(kind, request)
+    result = compute()
+    if mode == 'record':
+        cassette.put(kind, request, result)
+    return result
+
+
+def stats():
+    mode, cassette = current()
+    return {'mode': mode, **(cassette.stats() if cassette else {})}
+
+
+class RecordingSearch:
+    """Wraps a DDGS session, saving each text/images result list."""
+
+    def __init__(self, session, cassette):
+        self.session = session
+        self.cassette = cassette
+
+    def __enter__(self):
+        self.session.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self.session.__exit__(*exc)
+
+    def _call(self, kind, query, region, max_results):
+        results = list(getattr(self.session, kind)(query, region=region, max_results=max_results))
+        self.cassette.put(f"ddgs.{kind}", {'query': query, 'region': region, 'max_results': max_results}, results)
+        return results
+
+    def text(self, query, region=None, max_results=None):
+        return self._call('text', query, region, max_results)
+
+    def images(self, query, region=None, max_results=None):
+        return self._call('images', query, region, max_results)
+
+
+class ReplaySearch:
+    """DDGS look-alike answering from the cassette."""
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def text(self, query, region=None, max_results=None):
+        return self.cassette.get('ddgs.text', {'query': query, 'region': region, 'max_results': max_results})
+
+    def images(self, query, region=None, max_results=None):
+        return self.cassette.get('ddgs.images', {'query': query, 'region': region, 'max_results': max_results})
+
+
+def search_session(open_live):
+    """A DDGS session for the current mode; `open_live` creates the real one (not called when replaying)."""
+    mode, cassette = current()
+    if mode == 'replay':
+        return ReplaySearch(cassette)
+    if mode == 'record':
+        return RecordingSearch(open_live(), cassette)
+    return open_live()
+
+
+def _usage_dict(usage):
+    return {field: getattr(usage, field, 0) or 0 for field in USAGE_FIELDS} if usage is not None else None
+
+
+def _response(text, usage):
+    return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(**usage) if usage else None)
+
+
+class RecordingModel:
+    """Wraps a GenerativeModel, saving each response's text chunks and token usage.
+
+    Streaming and blocking calls share a recording, so a proposal recorded in the
+    web UI (streamed) replays in the CLI (blocking) and vice versa.
+    """
+
+    def __init__(self, model, model_name, cassette):
+        self.model = model
+        self.model_name = model_name
+        self.cassette = cassette
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        request = {'model': self.model_name, 'prompt': prompt, 'generation_config': generation_config}
+        response = self.model.generate_content(prompt, generation_config=generation_config, stream=stream)
+        if stream:
+            return self._record_stream(request, response)
+        self.cassette.put('gemini', request, {'chunks': [response.text], 'usage': _usage_dict(response.usage_metadata)})
+        return response
+
+    def _record_stream(self, request, response):
+        chunks, usage = [], None
+        for chunk in response:
+            chunks.append(chunk.text)
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            yield chunk
+        # Only complete streams are recorded
+        self.cassette.put('gemini', request, {'chunks': chunks, 'usage': _usage_dict(usage)})
+
+
+class ReplayModel:
+    """GenerativeModel look-alike answering from the cassette; streams replay the recorded chunking."""
+
+    def __init__(self, model_name, cassette):
+        self.model_name = model_name
+        self.cassette = cassette
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        request = {'model': self.model_name, 'prompt': prompt, 'generation_config': generation_config}
+        recorded = self.cassette.get('gemini', request)
+        if not stream:
+            return _response(''.join(recorded['chunks']), recorded['usage'])
+        chunks = recorded['chunks']
+        return iter([_response(text, recorded['usage'] if i == len(chunks) - 1 else None)
+                     for i, text in enumerate(chunks)])
+
+
+def generative_model(model_name, make_live):
+    """A Gemini model for the current mode; `make_live` builds the real one (not called when replaying)."""
+    mode, cassette = current()
+    if mode == 'replay':
+        return ReplayModel(model_name, cassette)
+    if mode == 'record':
+        return RecordingModel(make_live(), model_name, cassette)
+    return make_live()
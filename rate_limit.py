@@ -0,0 +1,133 @@
+import threading
+import time
+import contextvars
+from contextlib import contextmanager
+from metrics import Counter, Histogram, registry
+
+# Set while running work for a background job (the /api/batch workers). Shared
+# quotas (the Gemini key pool, the DDGS limiter) give such work a smaller share
+# so interactive requests keep headroom while a batch is running.
+_background = contextvars.ContextVar('background_work', default=False)
+
+
+limiter_wait_seconds = registry.register(Histogram(
+    'rate_limiter_wait_seconds', 'Time callers waited for a rate limiter token.', labels=('limiter',),
+    buckets=(0, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)))
+singleflight_calls = registry.register(Counter(
+    'singleflight_calls_total', 'Calls that ran upstream (executed) or shared one in flight (coalesced).',
+    labels=('flight', 'outcome')))
+
+
+@contextmanager
+def background_work():
+    """Marks provider calls made in this context as background (lower-priority) work."""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def is_background():
+    return _background.get()
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second with bursts of up to `capacity`.
+
+    `acquire()` blocks until a token is available and returns how long it waited;
+    cumulative waits are kept for the stats endpoint and, for a named bucket,
+    exported on /metrics.
+    """
+
+    def __init__(self, rate, capacity, name=None):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now (possibly going negative) so concurrent callers queue up in order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.acquired += 1
+            if wait:
+                self.waited += 1
+                self.wait_seconds += wait
+        if self.name:
+            limiter_wait_seconds.observe(wait, limiter=self.name)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.capacity,
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "wait_seconds_total": round(self.wait_seconds, 3),
+            }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The first caller for a key runs `fn`; callers arriving while it is in flight
+    wait and receive the same result (or exception). A named instance exports
+    its counts on /metrics.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if self.name:
+            singleflight_calls.inc(flight=self.name, outcome='executed' if leader else 'coalesced')
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
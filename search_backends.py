@@ -0,0 +1,360 @@
+import os
+import abc
+import csv
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
+from metrics import Counter, Histogram, registry
+from profiling import in_context, percentile
+from text_rank import bm25_scores
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Local product master for the `catalog` backend: CSV/TSV with name and optional
+# description, url and image columns (several image URLs separated by spaces or |).
+PRODUCT_MASTER_PATH = os.environ.get('PRODUCT_MASTER_PATH', os.path.join(BASE_DIR, 'output', 'product_master.csv'))
+# Base URL of a SearxNG instance (or anything serving its /search?format=json API).
+SEARXNG_URL = os.environ.get('SEARXNG_URL', 'http://localhost:8888')
+SEARXNG_TIMEOUT = float(os.environ.get('SEARXNG_TIMEOUT', 10))
+# Hedging: fire the next backend once the primary has taken longer than its observed
+# p90. Until HEDGE_MIN_SAMPLES calls have been seen, HEDGE_DEFAULT_DELAY is used.
+HEDGE_DEFAULT_DELAY = float(os.environ.get('SEARCH_HEDGE_DELAY', 2.0))
+HEDGE_MIN_DELAY = 0.05
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+PRODUCT_MASTER_COLUMNS = {
+    'name': ('name', 'product_name', '商品名'),
+    'description': ('description', 'body', '説明', '商品説明'),
+    'url': ('url', 'href', 'URL', '商品URL'),
+    'images': ('image_url', 'images', 'image', '画像URL', '画像'),
+}
+
+backend_seconds = registry.register(Histogram(
+    'proposal_search_backend_duration_seconds', 'Latency of each search backend call, including hedge losers.',
+    labels=('backend', 'kind')))
+hedged_requests = registry.register(Counter(
+    'proposal_search_hedges_total', 'Searches that fired a hedge, by the backend that answered first.',
+    labels=('kind', 'winner')))
+# Hedged calls run here so the caller can stop waiting for a slow backend.
+hedge_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('SEARCH_HEDGE_WORKERS', 16)),
+                                    thread_name_prefix='search-hedge')
+
+
+class SearchBackend(abc.ABC):
+    """A search provider. `open()` returns a session (context manager) with DDGS's text()/images() methods.
+
+    text() yields {title, body, href} and images() {image, thumbnail, title, width,
+    height}, the shapes product_search already consumes.
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    def open(self):
+        """A new session for one request's searches."""
+
+
+class _Session:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _RateLimitedSession(_Session):
+    def __init__(self, session, acquire):
+        self.session = session
+        self.acquire = acquire
+
+    def __enter__(self):
+        self.session.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self.session.__exit__(*exc)
+
+    def text(self, query, **kwargs):
+        self.acquire()
+        return list(self.session.text(query, **kwargs))
+
+    def images(self, query, **kwargs):
+        self.acquire()
+        return list(self.session.images(query, **kwargs))
+
+
+class DDGSBackend(SearchBackend):
+    """DuckDuckGo through a DDGS session from `open_session`, waiting on `acquire` (the shared limiter) per call."""
+
+    name = 'ddgs'
+
+    def __init__(self, open_session, acquire):
+        self.open_session = open_session
+        self.acquire = acquire
+
+    def open(self):
+        return _RateLimitedSession(self.open_session(), self.acquire)
+
+
+def read_product_master(path):
+    """Reads the local product master; returns [{name, description, url, images}]."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        delimiter = '\t' if path.lower().endswith('.tsv') or sample.count('\t') > sample.count(',') else ','
+        reader = csv.DictReader(f, delimiter=delimiter)
+        columns = {}
+        for field, aliases in PRODUCT_MASTER_COLUMNS.items():
+            header = next((h for h in reader.fieldnames or [] if h.strip().lower() in [a.lower() for a in aliases]), None)
+            if header:
+                columns[field] = header
+        if 'name' not in columns:
+            raise ValueError(f"Product master {path} has no name column")
+        products = []
+        for row in reader:
+            product = {field: (row.get(header) or '').strip() for field, header in columns.items()}
+            product['images'] = product.get('images', '').replace('|', ' ').split()
+            if product['name']:
+                products.append(product)
+    return products
+
+
+class LocalCatalogBackend(SearchBackend):
+    """Searches the local product master with BM25; never slow, but only knows the products listed."""
+
+    name = 'catalog'
+
+    def __init__(self, path=PRODUCT_MASTER_PATH):
+        self.path = path
+        self._products = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def products(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with self._lock:
+            if self._products is None or mtime != self._mtime:
+                self._products, self._mtime = read_product_master(self.path), mtime
+            return self._products
+
+    def matches(self, query, max_results):
+        products = self.products()
+        scores = bm25_scores(query, [f"{p['name']} {p.get('description', '')}" for p in products])
+        ranked = sorted((pair for pair in zip(scores, range(len(products))) if pair[0] > 0),
+                        key=lambda pair: (-pair[0], pair[1]))
+        return [products[index] for _, index in ranked[:max_results or len(products)]]
+
+    def open(self):
+        return _CatalogSession(self)
+
+
+class _CatalogSession(_Session):
+    def __init__(self, backend):
+        self.backend = backend
+
+    def text(self, query, region=None, max_results=None):
+        return [{'title': p['name'], 'body': p.get('description', ''), 'href': p.get('url', '')}
+                for p in self.backend.matches(query, max_results)]
+
+    def images(self, query, region=None, max_results=None):
+        images = [{'title': p['name'], 'image': url, 'thumbnail': url, 'url': p.get('url', '')}
+                  for p in self.backend.matches(query, None) for url in p['images']]
+        return images[:max_results]
+
+
+def _resolution(value):
+    try:
+        width, height = (int(part) for part in str(value).lower().replace('×', 'x').split('x'))
+        return width, height
+    except ValueError:
+        return 0, 0
+
+
+class SearxNGBackend(SearchBackend):
+    """A SearxNG instance (or a stand-in with the same JSON API) at `base_url`."""
+
+    name = 'searxng'
+
+    def __init__(self, base_url=SEARXNG_URL, client=None):
+        self.base_url = base_url.rstrip('/')
+        self.client = client or httpx.Client(timeout=SEARXNG_TIMEOUT)
+
+    def search(self, query, region, categories):
+        language = {'jp-jp': 'ja-JP'}.get(region, 'all')
+        response = self.client.get(f"{self.base_url}/search", params={
+            'q': query, 'format': 'json', 'language': language, 'categories': categories})
+        response.raise_for_status()
+        return response.json().get('results', [])
+
+    def open(self):
+        return _SearxNGSession(self)
+
+
+class _SearxNGSession(_Session):
+    def __init__(self, backend):
+        self.backend = backend
+
+    def text(self, query, region=None, max_results=None):
+        return [{'title': r.get('title', ''), 'body': r.get('content', ''), 'href': r.get('url', '')}
+                for r in self.backend.search(query, region, 'general')][:max_results]
+
+    def images(self, query, region=None, max_results=None):
+        images = []
+        for r in self.backend.search(query, region, 'images'):
+            if r.get('img_src'):
+                width, height = _resolution(r.get('resolution', ''))
+                images.append({'title': r.get('title', ''), 'image': r['img_src'],
+                               'thumbnail': r.get('thumbnail_src') or r['img_src'], 'url': r.get('url', ''),
+                               'width': width, 'height': height})
+        return images[:max_results]
+
+
+class LatencyTracker:
+    """Recent successful call latencies per (backend, kind), for the hedge delay."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def p90(self, key):
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        return percentile(samples, 90) if len(samples) >= HEDGE_MIN_SAMPLES else None
+
+    def hedge_delay(self, key):
+        p90 = self.p90(key)
+        return max(HEDGE_MIN_DELAY, p90) if p90 is not None else HEDGE_DEFAULT_DELAY
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._samples)
+        return {f"{backend}.{kind}": {'samples': len(self._samples[backend, kind]), 'p90': self.p90((backend, kind))}
+                for backend, kind in keys}
+
+
+latency_tracker = LatencyTracker()
+
+
+class HedgedSession(_Session):
+    """Searches the first backend; if it has not answered within its observed p90 (or fails), the next one is
+    fired too and the first non-empty answer wins. An empty answer (e.g. a product missing from the
+    local master) only counts once every backend has finished without finding anything.
+
+    The loser is cancelled if it has not started yet; a call already running
+    cannot be interrupted, so it finishes in the background (bounded by its own
+    timeout), still feeds the latency window and its result is dropped. Backend
+    sessions are opened on first use and closed once their last call is done.
+    """
+
+    def __init__(self, backends, tracker=latency_tracker, executor=hedge_executor):
+        self.backends = backends
+        self.tracker = tracker
+        self.executor = executor
+        self._sessions = {}
+        self._pending = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _session(self, backend):
+        with self._lock:
+            if backend.name not in self._sessions:
+                self._sessions[backend.name] = backend.open().__enter__()
+                self._pending[backend.name] = 0
+            self._pending[backend.name] += 1
+            return self._sessions[backend.name]
+
+    def _done(self, backend):
+        with self._lock:
+            self._pending[backend.name] -= 1
+            close = self._closed and not self._pending[backend.name]
+        if close:
+            self._sessions[backend.name].__exit__(None, None, None)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self._closed = True
+            idle = [name for name, pending in self._pending.items() if not pending]
+        for name in idle:
+            self._sessions[name].__exit__(None, None, None)
+        return False
+
+    def _call(self, backend, kind, query, kwargs):
+        start = time.perf_counter()
+        session = self._session(backend)
+        try:
+            results = list(getattr(session, kind)(query, **kwargs))
+        finally:
+            self._done(backend)
+        elapsed = time.perf_counter() - start
+        backend_seconds.observe(elapsed, backend=backend.name, kind=kind)
+        self.tracker.observe((backend.name, kind), elapsed)
+        return results
+
+    def _search(self, kind, query, kwargs):
+        queue = list(self.backends)
+        futures, settled = {}, []  # settled: finished without a usable answer (error or empty)
+        delay = self.tracker.hedge_delay((self.backends[0].name, kind))
+        while True:
+            # Each pass fires the next backend: at the start, after a hedge delay or after a failed/empty answer
+            if queue:
+                backend = queue.pop(0)
+                futures[self.executor.submit(in_context(self._call), backend, kind, query, kwargs)] = backend
+            pending = [f for f in futures if not f.done()]
+            if pending:
+                wait(pending, timeout=delay if queue else None, return_when=FIRST_COMPLETED)
+            for future, backend in futures.items():
+                if not future.done() or future in settled:
+                    continue
+                if future.exception() is None and future.result():
+                    for other in futures:
+                        other.cancel()
+                    if len(futures) > 1:
+                        hedged_requests.inc(kind=kind, winner=backend.name)
+                    return future.result()
+                settled.append(future)
+                if future.exception() is not None:
+                    logging.warning(f"Search backend {backend.name} failed: {future.exception()}")
+            if not queue and len(settled) == len(futures):
+                # No backend found anything: an empty answer beats an error
+                if any(f.exception() is None for f in settled):
+                    return []
+                raise settled[0].exception()
+
+    def text(self, query, **kwargs):
+        return self._search('text', query, kwargs)
+
+    def images(self, query, **kwargs):
+        return self._search('images', query, kwargs)
+
+
+BACKENDS = {
+    'catalog': LocalCatalogBackend,
+    'searxng': SearxNGBackend,
+}
+
+
+def build_backends(names, ddgs):
+    """Backends for SEARCH_BACKENDS-style `names` in priority order; `ddgs` is the DDGSBackend to use for 'ddgs'."""
+    backends = []
+    for name in names:
+        if name == 'ddgs':
+            backends.append(ddgs)
+        elif name in BACKENDS:
+            backends.append(BACKENDS[name]())
+        else:
+            raise ValueError(f"Unknown search backend {name!r}; expected ddgs or {', '.join(BACKENDS)}")
+    return backends
+
+
+def open_session(backends):
+    """A session over `backends`: the first one alone, or a HedgedSession when there are fallbacks."""
+    if len(backends) == 1:
+        return backends[0].open()
+    return HedgedSession(backends)
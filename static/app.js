@@ -3,6 +3,8 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- State ---
     let productContext = "";
     let selectedImageUrl = "";
+    let lastGeneratedKey = "";
+    let lastProposalData = null;
 
     // --- Elements ---
     const searchBtn = document.getElementById('search-btn');
@@ -12,6 +14,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const imageSelectionArea = document.getElementById('image-selection-area');
     const imageGrid = document.getElementById('image-grid');
     const proposalPreview = document.getElementById('proposal-preview');
+    const openProposalLink = document.getElementById('open-proposal-link');
+    const bundleProposalLink = document.getElementById('bundle-proposal-link');
 
     // --- Inputs ---
     const productNameInput = document.getElementById('product_name');
@@ -39,45 +43,27 @@ document.addEventListener('DOMContentLoaded', () => {
         showLoading("商品情報と画像を検索中...");
 
         try {
-            // Parallel Requests: Context & Images
-            const [searchRes, imageRes] = await Promise.all([
-                fetch('/api/search', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ product_name: productNameInput.value })
-                }),
-                fetch('/api/images', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ product_name: productNameInput.value, count: 8 })
-                })
-            ]);
-
-            const searchData = await searchRes.json();
-            const imageData = await imageRes.json();
-
-            // Store Context
-            productContext = searchData.context;
-
-            // Render Images
-            imageGrid.innerHTML = '';
-            selectedImageUrl = ''; // Reset selection
-
-            if (imageData.images && imageData.images.length > 0) {
-                imageData.images.forEach(url => {
-                    const div = document.createElement('div');
-                    div.className = 'image-item';
-                    div.innerHTML = `<img src="${url}" loading="lazy">`;
-                    div.onclick = () => selectImage(div, url);
-                    imageGrid.appendChild(div);
-                });
+            // One round-trip: the server searches context & images concurrently
+            // and streams each half back as soon as it is ready
+            const response = await fetch('/api/prepare', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ product_name: productNameInput.value, count: 8, stream: true })
+            });
 
-                // Show Selection Area
-                imageSelectionArea.classList.remove('hidden');
-                generateBtn.disabled = true; // Disable until image is picked
-            } else {
-                alert("画像が見つかりませんでした。");
-            }
+            if (!response.ok) throw new Error("Search Failed");
+
+            // Reset selection
+            productContext = "";
+            selectedImageUrl = '';
+
+            await readEventStream(response, (event, data) => {
+                if (event === 'context') {
+                    productContext = data.context;
+                } else if (event === 'images') {
+                    renderImages(data.images);
+                }
+            });
 
         } catch (error) {
             console.error(error);
@@ -88,6 +74,51 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
 
+    // Images go through the server's image proxy (downloaded once, resized, cached)
+    function proxiedImage(url, variant) {
+        return `/api/image-proxy?variant=${variant}&url=${encodeURIComponent(url)}`;
+    }
+
+    function renderImages(images) {
+        imageGrid.innerHTML = '';
+
+        if (images && images.length > 0) {
+            images.forEach(url => {
+                const div = document.createElement('div');
+                div.className = 'image-item';
+                div.innerHTML = `<img src="${proxiedImage(url, 'thumb')}" loading="lazy">`;
+                div.dataset.url = url;
+                div.onclick = () => selectImage(div, url);
+                imageGrid.appendChild(div);
+            });
+            suggestImage(images).catch(console.error);
+
+            // Show Selection Area
+            imageSelectionArea.classList.remove('hidden');
+            generateBtn.disabled = true; // Disable until image is picked
+        } else {
+            alert("画像が見つかりませんでした。");
+        }
+    }
+
+
+    // Marks the server's best-scoring candidate; the grid is usable before the ranking arrives
+    async function suggestImage(images) {
+        const response = await fetch('/api/images/rank', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ urls: images })
+        });
+        if (!response.ok) return;
+        const { suggested } = await response.json();
+        const item = [...imageGrid.querySelectorAll('.image-item')].find(el => el.dataset.url === suggested);
+        if (item) {
+            item.classList.add('suggested');
+            item.insertAdjacentHTML('beforeend', '<span class="suggested-badge">おすすめ</span>');
+        }
+    }
+
+
     // --- 2. Image Selection Logic ---
     function selectImage(element, url) {
         // Remove previous selection
@@ -103,7 +134,10 @@ document.addEventListener('DOMContentLoaded', () => {
         // NEW: If proposal is already generated, update the image immediately
         const mainImage = document.querySelector('.product-image img');
         if (mainImage) {
-            mainImage.src = url;
+            mainImage.src = proxiedImage(url, 'print');
+        }
+        if (lastProposalData) {
+            saveProposal(lastProposalData, url).catch(console.error);
         }
     }
 
@@ -116,6 +150,8 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         showLoading("提案書を生成中... (Geminiが考え中)"); // Fun loading message
+        // The links still point at the previous proposal until the new one is saved
+        setProposalLink(null);
 
         try {
             const payload = {
@@ -125,8 +161,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 image_url: selectedImageUrl,
                 context: productContext
             };
+            // Same inputs again means the user wants a fresh take, not the cached one
+            const payloadKey = JSON.stringify(payload);
+            payload.force_regenerate = payloadKey === lastGeneratedKey;
 
-            const response = await fetch('/api/generate', {
+            const response = await fetch('/api/generate/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(payload)
@@ -134,8 +173,30 @@ document.addEventListener('DOMContentLoaded', () => {
 
             if (!response.ok) throw new Error("Generation Failed");
 
-            const data = await response.json();
-            renderProposal(data, selectedImageUrl);
+            // The server sends the re-rendered preview after every field it receives
+            let finished = false;
+            lastProposalData = null;
+
+            await readEventStream(response, (event, data) => {
+                if (event === 'html') {
+                    hideLoading();
+                    showProposal(data.html);
+                } else if (event === 'saved') {
+                    setProposalLink(data.url);
+                } else if (event === 'done') {
+                    lastProposalData = data;
+                    finished = true;
+                } else if (event === 'error') {
+                    throw new Error(data.detail);
+                }
+            });
+
+            if (!finished) throw new Error("Generation stream ended early");
+            lastGeneratedKey = payloadKey;
+            if (window.innerWidth < 1000) {
+                // Scroll to preview on mobile
+                proposalPreview.scrollIntoView({ behavior: 'smooth' });
+            }
 
         } catch (error) {
             console.error(error);
@@ -145,69 +206,56 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-    // --- 4. Rendering Logic (HTML Injection) ---
-    function renderProposal(data, imageUrl) {
-        // This HTML structure must match the one used in create_proposal_v4.py for consistency
-        const html = `
-            <div class="company-header">
-                <div class="company-name">株式会社よつや</div>
-                <div>TEL 045-593-5547</div>
-                <div>FAX 045-590-1171</div>
-                <div>Mail: yotsuya.center@gmail.com</div>
-            </div>
-
-            <h1 class="proposal-title" contenteditable="true">商品提案書</h1>
-            
-            <div class="hero-section">
-                <div class="product-image">
-                    <img src="${imageUrl}" alt="${data.product_name}">
-                </div>
-            </div>
-
-            <div class="catch-copy" contenteditable="true">
-                ${data.catch_copy}
-            </div>
-
-            <div class="info-grid">
-                <div>
-                    <div class="section-title">お客様への3つのベネフィット</div>
-                    ${data.benefits.map(b => `
-                    <div class="benefit-card">
-                        <div class="benefit-title" contenteditable="true">${b.title}</div>
-                        <div class="benefit-detail" contenteditable="true">${b.detail}</div>
-                    </div>
-                    `).join('')}
-                </div>
-
-                <div>
-                    <div class="section-title">商品情報</div>
-                    <div class="specs-box">
-                        <h3 style="margin-top: 0; font-size: 16px;" contenteditable="true">${data.product_name}</h3>
-                        <ul class="specs-list">
-                        ${data.product_specs.map(spec => `<li contenteditable="true">${spec}</li>`).join('')}
-                        </ul>
-                        
-                        <div class="price-target-box">
-                            <div><span contenteditable="true">${data.capacity}</span>　<span class="price-group"><span class="price-label">納品価格</span> <span class="price-val" contenteditable="true">${data.price}</span><span class="tax-label">(税別)</span></span></div>
-                            <div class="target-val" contenteditable="true">ターゲット: ${data.target}</div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-
-            <div class="comment-section">
-                <div class="comment-text" contenteditable="true">
-                    "${data.comment}"
-                </div>
-            </div>
-        `;
+    // Reads a text/event-stream response body, calling onEvent(event, data) per message
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                message.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                onEvent(event, data ? JSON.parse(data) : null);
+            }
+        }
+    }
 
+    // --- 4. Rendering Logic ---
+    // Proposal HTML is rendered on the server from the same template the CLI uses
+    function showProposal(html) {
         proposalPreview.innerHTML = html;
+    }
 
-        // Scroll to preview on mobile
-        if (window.innerWidth < 1000) {
-            proposalPreview.scrollIntoView({ behavior: 'smooth' });
+    // Shows the A4 view and offline bundle links for a saved proposal; null hides both
+    function setProposalLink(url) {
+        for (const [link, href] of [[openProposalLink, url], [bundleProposalLink, url && `${url}/bundle`]]) {
+            if (href) link.href = href;
+            else link.removeAttribute('href');
+            link.classList.toggle('hidden', !href);
         }
     }
 
+    // Stores the proposal with a new image so the A4 view (/api/render) matches the preview
+    async function saveProposal(data, imageUrl) {
+        const response = await fetch('/api/proposals', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ data: data, image_url: imageUrl })
+        });
+        if (response.ok) setProposalLink((await response.json()).url);
+    }
+
 });
@@ -0,0 +1,122 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+import threading
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Files this small are not worth a compressed variant.
+MIN_COMPRESS_BYTES = 512
+
+
+class Asset:
+    """One static file held in memory with its content hash and precompressed variants."""
+
+    def __init__(self, name, content, mtime):
+        self.name = name
+        self.content = content
+        self.mtime = mtime
+        self.digest = hashlib.sha256(content).hexdigest()[:12]
+        self.media_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if self.media_type.startswith('text/') or self.media_type == 'application/javascript':
+            self.media_type += '; charset=utf-8'
+        self.encodings = {}
+        if len(content) >= MIN_COMPRESS_BYTES:
+            if brotli is not None:
+                self.encodings['br'] = brotli.compress(content, quality=11)
+            self.encodings['gzip'] = gzip.compress(content, compresslevel=9, mtime=0)
+            self.encodings = {name: data for name, data in self.encodings.items() if len(data) < len(content)}
+
+    @property
+    def hashed_name(self):
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.digest}{ext}"
+
+    def etag(self, encoding=None):
+        return f'"{self.digest}.{encoding}"' if encoding else f'"{self.digest}"'
+
+    def negotiate(self, accept_encoding):
+        """Returns (encoding or None, body) for the best variant the client accepts."""
+        accepted = {part.split(';')[0].strip() for part in (accept_encoding or '').lower().split(',')}
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encodings and encoding in accepted:
+                return encoding, self.encodings[encoding]
+        return None, self.content
+
+    def matches(self, if_none_match):
+        """True if an If-None-Match header names any variant of the current content."""
+        tags = {tag.strip().removeprefix('W/') for tag in (if_none_match or '').split(',')}
+        return '*' in tags or any(self.etag(encoding) in tags for encoding in (None, 'br', 'gzip'))
+
+
+class StaticAssets:
+    """Serves the web UI's static files from memory.
+
+    Files are read and compressed once; with `reload` (dev) a changed mtime
+    reloads them on the next request. Every asset also has a content-hashed
+    URL (style.<hash>.css) that can be cached forever, and `index.html`'s
+    references to /static/<name> are rewritten to those URLs when it is loaded.
+    """
+
+    def __init__(self, directory, prefix='/assets', reload=False, index='index.html'):
+        self.directory = directory
+        self.prefix = prefix
+        self.reload = reload
+        self.index = index
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self, name):
+        path = self._path(name)
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as f:
+            content = f.read()
+        if name == self.index:
+            # Load the other assets first so the page links their current hashed URLs
+            text = content.decode('utf-8')
+            for other in self.names():
+                if other != self.index:
+                    text = text.replace(f'/static/{other}', self.url(other))
+            content = text.encode('utf-8')
+        return Asset(name, content, mtime)
+
+    def names(self):
+        return sorted(entry.name for entry in os.scandir(self.directory) if entry.is_file())
+
+    def get(self, name):
+        """Returns the Asset for `name` (loading or reloading it), or None if there is no such file."""
+        if os.sep in name or name.startswith('.') or not os.path.isfile(self._path(name)):
+            return None
+        with self._lock:
+            asset = self._assets.get(name)
+        stale = asset is not None and self.reload and (
+            os.stat(self._path(name)).st_mtime_ns != asset.mtime
+            or (name == self.index and any(self.get(other).digest not in asset.content.decode('utf-8')
+                                            for other in self.names() if other != self.index)))
+        if asset is None or stale:
+            asset = self._load(name)
+            with self._lock:
+                self._assets[name] = asset
+        return asset
+
+    def url(self, name):
+        return f"{self.prefix}/{self.get(name).hashed_name}"
+
+    def resolve(self, requested):
+        """Maps a requested file name (hashed or plain) to (asset, immutable)."""
+        stem, ext = os.path.splitext(requested)
+        base, _, digest = stem.rpartition('.')
+        asset = self.get(f"{base}{ext}") if base else None
+        if asset is not None:
+            # An old hash still gets the current file, but only briefly cached
+            return asset, digest == asset.digest
+        return self.get(requested), False
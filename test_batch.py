@@ -0,0 +1,194 @@
+import threading
+import time
+
+import pytest
+
+from proposal_batch import BatchJournal, item_key, read_catalog, run_batch
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_read_catalog_accepts_csv_and_japanese_tsv(tmp_path):
+    csv_path = write(tmp_path / "catalog.csv", "name,price,capacity,image_url\n獺祭,5500円,720ml,\nMonte Viesgo Crianza,1800円,750ml,https://img/1.jpg\n")
+    tsv_path = write(tmp_path / "catalog.tsv", "商品名\t納品価格\t容量\nくにひろや洋酒ケーキ\t1200円\t1本\n")
+
+    assert read_catalog(csv_path) == [
+        {"name": "獺祭", "price": "5500円", "capacity": "720ml", "image_url": ""},
+        {"name": "Monte Viesgo Crianza", "price": "1800円", "capacity": "750ml", "image_url": "https://img/1.jpg"},
+    ]
+    assert read_catalog(tsv_path) == [{"name": "くにひろや洋酒ケーキ", "price": "1200円", "capacity": "1本"}]
+
+
+def test_read_catalog_rejects_missing_columns(tmp_path):
+    with pytest.raises(ValueError):
+        read_catalog(write(tmp_path / "catalog.csv", "name,price\n獺祭,5500円\n"))
+
+
+def test_resumed_batch_only_reprocesses_unfinished_rows(tmp_path):
+    items = [{"name": f"商品{i}", "price": "100円", "capacity": "1本"} for i in range(6)]
+    journal = BatchJournal(str(tmp_path / "journal.jsonl"))
+    processed = []
+
+    def flaky(item):
+        processed.append(item["name"])
+        if item["name"] in ("商品2", "商品4"):
+            raise RuntimeError("429 Resource exhausted")
+        return f"proposal_{item['name']}.html"
+
+    assert run_batch(items, flaky, journal, jobs=3) == {"done": 4, "failed": 2, "skipped": 0}
+
+    processed.clear()
+    summary = run_batch(items, lambda item: processed.append(item["name"]) or "ok.html", journal, jobs=3)
+    assert summary == {"done": 2, "failed": 0, "skipped": 4}
+    assert sorted(processed) == ["商品2", "商品4"]
+    assert all(record["status"] == "done" for record in journal.load().values())
+    assert set(journal.load()) == {item_key(item) for item in items}
+
+
+def test_rows_for_the_same_product_get_their_own_file():
+    from create_proposal_v4 import proposal_filename
+    rows = [{"name": "獺祭 純米大吟醸", "price": price, "capacity": capacity}
+            for price, capacity in (("5,500円", "720ml"), ("11,000円", "1800ml"))]
+    names = [proposal_filename(row["name"], "out", item_key(row)[:8]) for row in rows]
+    assert len(set(names)) == 2
+    assert all(name.startswith("out/proposal_獺祭_純米大吟醸_") for name in names)
+    assert proposal_filename("獺祭 純米大吟醸") == "proposal_獺祭_純米大吟醸.html"
+
+
+def test_batch_runs_jobs_concurrently(tmp_path):
+    items = [{"name": f"商品{i}", "price": "100円", "capacity": "1本"} for i in range(8)]
+    journal = BatchJournal(str(tmp_path / "journal.jsonl"))
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow(item):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return "ok.html"
+
+    run_batch(items, slow, journal, jobs=4)
+    assert peak[0] == 4
+
+
+def test_batch_api_runs_items_off_the_request_path(monkeypatch):
+    import asyncio
+
+    import httpx
+
+    import app_v5
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setattr(app_v5, "search_product_info", lambda name: "context")
+    monkeypatch.setattr(app_v5, "search_product_images", lambda name, count=5: [f"https://img/{name}.jpg"])
+
+    def fake_generate(api_key, product_name, price, capacity, context, **kwargs):
+        time.sleep(0.05)
+        if product_name == "broken":
+            return None
+        return {"product_name": product_name, "price": price, "capacity": capacity, "catch_copy": "copy",
+                "benefits": [], "product_specs": [], "comment": "", "target": ""}
+
+    monkeypatch.setattr(app_v5, "generate_proposal_content_gemini", fake_generate)
+    items = [{"product_name": name, "price": "100円", "capacity": "1本"} for name in ("獺祭", "broken", "Monte Viesgo")]
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            created = await client.post("/api/batch", json={"items": items})
+            job_id = created.json()["job_id"]
+            events = await client.get(f"/api/batch/{job_id}/events")
+            status = await client.get(f"/api/batch/{job_id}")
+            data = await client.get(f"/api/batch/{job_id}/items/0")
+            html = await client.get(f"/api/batch/{job_id}/items/0/html")
+            failed = await client.get(f"/api/batch/{job_id}/items/1")
+            return created, events, status, data, html, failed
+
+    created, events, status, data, html, failed = asyncio.run(run())
+
+    assert created.status_code == 202
+    assert "event: done" in events.text
+    assert status.json()["done"] == 2 and status.json()["failed"] == 1
+    assert data.json()["product_name"] == "獺祭"
+    assert app_v5.proxied_image_url("https://img/獺祭.jpg").replace("&", "&amp;") in html.text
+    assert failed.status_code == 409
+
+
+def test_saturating_batch_leaves_gemini_quota_for_interactive_generate(monkeypatch):
+    import asyncio
+
+    import httpx
+
+    import app_v5
+    from gemini_client import GeminiClientManager
+
+    class Model:
+        def generate_content(self, prompt, generation_config=None, stream=False):
+            time.sleep(0.01)
+            return type("Response", (), {"text": "{}", "usage_metadata": None})()
+
+    class Manager(GeminiClientManager):
+        def _make_model(self, api_key):
+            return Model()
+
+    # 4 requests per minute: the batch may use 2, and queues for the rest until it gives up
+    manager = Manager(["test-key"], "gemini-test", rpm_limit=4, max_queue_wait=1.5)
+
+    def generate(api_key, product_name, price, capacity, context, **kwargs):
+        manager.generate_content(product_name)
+        return {"product_name": product_name, "price": price, "capacity": capacity}
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setattr(app_v5, "search_product_info", lambda name: "context")
+    monkeypatch.setattr(app_v5, "generate_proposal_content_gemini", generate)
+    items = [{"product_name": f"item {i}", "price": "100円", "capacity": "1本", "image_url": "https://img/x.jpg"}
+             for i in range(6)]
+    payload = {"product_name": "獺祭", "price": "5,500円", "capacity": "720ml", "image_url": "", "context": ""}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            created = await client.post("/api/batch", json={"items": items})
+            await asyncio.sleep(0.3)  # the batch has used its share and is waiting for more
+            start = time.perf_counter()
+            responses = await asyncio.gather(*[client.post("/api/generate", json=payload) for _ in range(2)])
+            elapsed = time.perf_counter() - start
+            summary = (await client.get(f"/api/batch/{created.json()['job_id']}/events")).text
+            return responses, elapsed, summary
+
+    responses, elapsed, events = asyncio.run(run())
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert elapsed < 0.5
+    assert "event: done" in events
+    assert sum(key["requests_last_minute"] for key in manager.stats()["keys"]) == 4
+
+
+def test_batch_events_include_the_last_item_before_done():
+    import asyncio
+
+    import app_v5
+    from proposal_batch import BatchJob
+
+    job = BatchJob([{"product_name": "A"}, {"product_name": "B"}])
+    job.update(0, "done", result={"data": {}, "image_url": ""})
+    app_v5.batch_jobs[job.id] = job
+
+    async def run():
+        body = (await app_v5.api_batch_events(job.id)).body_iterator
+        chunks = [await body.__anext__()]
+        # From the loop thread the listener's put is only scheduled, so the job is
+        # already finished while the queue is still empty
+        job.update(1, "failed", error="boom")
+        return chunks + [chunk async for chunk in body]
+
+    chunks = asyncio.run(run())
+
+    assert [chunk.split("\n")[0] for chunk in chunks] == ["event: status", "event: item", "event: done"]
+    assert '"index": 1' in chunks[1]
@@ -0,0 +1,33 @@
+import product_search
+from bench_pipeline import run_benchmark
+from fake_providers import FakeDDGS, FakeProviderConfig
+from image_store import image_store
+
+INSTANT = dict(search_latency=0, image_latency=0, gemini_latency=0)
+
+
+def test_benchmark_reports_every_level_and_restores_providers():
+    client = image_store.client
+    rows = run_benchmark(['flow', 'cli'], [1, 3], rounds=1, config=FakeProviderConfig(**INSTANT))
+
+    assert [(row['scenario'], row['concurrency'], row['requests']) for row in rows] == [
+        ('flow', 1, 1), ('flow', 3, 3), ('cli', 1, 1), ('cli', 3, 3)]
+    assert all(row['errors'] == 0 and row['throughput'] > 0 and row['p50'] <= row['p99'] for row in rows)
+    assert product_search.DDGS is not FakeDDGS
+    assert image_store.client is client
+
+
+def test_injected_gemini_failures_count_as_errors():
+    config = FakeProviderConfig(gemini_error_rate=1.0, **INSTANT)
+    [row] = run_benchmark(['generate'], [2], rounds=2, config=config)
+    assert row['errors'] == row['requests'] == 4
+    assert row['p50'] is None
+
+
+def test_fake_search_payload_size_is_configurable():
+    FakeDDGS.config = FakeProviderConfig(snippet_chars=500, **INSTANT)
+    try:
+        results = FakeDDGS().text('獺祭', max_results=3)
+    finally:
+        FakeDDGS.config = FakeProviderConfig()
+    assert len(results) == 3 and all(len(r['body']) > 500 for r in results)
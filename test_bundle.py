@@ -0,0 +1,47 @@
+import base64
+import io
+import re
+
+import httpx
+from fontTools.ttLib import TTFont
+from PIL import Image
+
+import proposal_bundle
+from image_store import ImageStore
+from proposal_cache import ProposalCache
+
+FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+DATA = {
+    "product_name": "Monte Viesgo Crianza",
+    "price": "1,800円",
+    "capacity": "750ml",
+    "catch_copy": "Oak & fruit",
+    "benefits": [{"title": "Aged", "detail": "12 months in oak"}],
+    "product_specs": ["Tempranillo"],
+    "comment": "A bottle that lifts the table.",
+    "target": "Wine lovers",
+}
+
+
+def test_bundle_embeds_image_and_font_subset(tmp_path, monkeypatch):
+    photo = io.BytesIO()
+    Image.new("RGB", (1600, 1200), "red").save(photo, "JPEG")
+    client = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=photo.getvalue())))
+    store = ImageStore(root=str(tmp_path / "images"), cache=ProposalCache(path=str(tmp_path / "c.sqlite3")), client=client)
+    monkeypatch.setattr(proposal_bundle, "image_store", store)
+
+    html = proposal_bundle.render_proposal_bundle(DATA, "https://example.com/monte.jpg", font=FONT)
+
+    assert "fonts.googleapis.com" not in html and "https://example.com/monte.jpg" not in html
+    assert 'src="data:image/jpeg;base64,' in html
+    font_data = re.search(r"url\(data:font/(?:woff2|woff);base64,([A-Za-z0-9+/=]+)\)", html).group(1)
+    font = TTFont(io.BytesIO(base64.b64decode(font_data)))
+    cmap = set(font.getBestCmap())
+    assert {ord(ch) for ch in "Monte Viesgo Crianza"} - {ord(" ")} <= cmap
+    assert ord("Q") not in cmap  # unused glyphs are dropped
+    assert len(base64.b64decode(font_data)) < 60 * 1024
+
+
+def test_used_characters_include_css_content():
+    text = proposal_bundle.used_characters("<style>.x::before { content: '✓'; }</style><p>獺祭</p>")
+    assert "✓" in text and "獺" in text and " " not in text
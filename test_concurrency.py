@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import app_v5
+import context_builder
+import product_search
+import proposal_generation
+from proposal_cache import ProposalCache
+from proposal_store import proposal_store
+
+GENERATION_DELAY = 0.5
+CONCURRENT_REQUESTS = 10
+
+PAYLOAD = {
+    "product_name": "獺祭 純米大吟醸 磨き二割三分",
+    "price": "5,500円",
+    "capacity": "720ml",
+    "image_url": "https://example.com/dassai.jpg",
+    "context": "",
+}
+
+
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path, monkeypatch):
+    """Keeps the shared cache and saved proposals out of the real output/ directory."""
+    cache = ProposalCache(path=str(tmp_path / "cache.sqlite3"))
+    for module in (app_v5, product_search, proposal_generation, context_builder):
+        monkeypatch.setattr(module, "shared_cache", cache)
+    monkeypatch.setattr(proposal_store, "root", str(tmp_path / "proposals"))
+
+
+def slow_generate(api_key, product_name, price, capacity, context, **kwargs):
+    """Stands in for Gemini: blocks the calling thread like the real SDK does."""
+    time.sleep(GENERATION_DELAY)
+    return {"product_name": product_name, "price": price, "capacity": capacity}
+
+
+async def post_many(path, payload, count):
+    transport = httpx.ASGITransport(app=app_v5.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[client.post(path, json=payload) for _ in range(count)])
+        return time.perf_counter() - start, responses
+
+
+def test_simultaneous_generate_calls_finish_in_time_of_one(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setattr(app_v5, "generate_proposal_content_gemini", slow_generate)
+
+    elapsed, responses = asyncio.run(post_many("/api/generate", PAYLOAD, CONCURRENT_REQUESTS))
+
+    assert [r.status_code for r in responses] == [200] * CONCURRENT_REQUESTS
+    # Serialized on the event loop this would take CONCURRENT_REQUESTS * GENERATION_DELAY.
+    assert elapsed < GENERATION_DELAY * 2, f"{CONCURRENT_REQUESTS} requests took {elapsed:.2f}s"
+
+
+def test_generation_does_not_block_search(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setattr(app_v5, "generate_proposal_content_gemini", slow_generate)
+    monkeypatch.setattr(app_v5, "search_product_info", lambda product_name: "context")
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            generate = asyncio.create_task(client.post("/api/generate", json=PAYLOAD))
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            search = await client.post("/api/search", json={"product_name": PAYLOAD["product_name"]})
+            search_elapsed = time.perf_counter() - start
+            await generate
+            return search, search_elapsed
+
+    search, search_elapsed = asyncio.run(run())
+
+    assert search.json() == {"context": "context"}
+    assert search_elapsed < GENERATION_DELAY / 2
+
+
+def test_prepare_runs_both_searches_concurrently_on_one_session(monkeypatch):
+    sessions = []
+
+    def slow_info(product_name, ddgs=None):
+        sessions.append(ddgs)
+        time.sleep(GENERATION_DELAY)
+        return "context"
+
+    def slow_images(product_name, count=20, ddgs=None):
+        sessions.append(ddgs)
+        time.sleep(GENERATION_DELAY)
+        return [f"https://img/{i}.jpg" for i in range(count)]
+
+    monkeypatch.setattr(app_v5, "search_product_info", slow_info)
+    monkeypatch.setattr(app_v5, "search_product_images", slow_images)
+
+    elapsed, responses = asyncio.run(post_many("/api/prepare", {"product_name": "獺祭", "count": 3}, 1))
+    streamed = asyncio.run(post_many("/api/prepare", {"product_name": "獺祭", "stream": True}, 1))[1][0]
+
+    assert responses[0].json() == {"context": "context", "images": [f"https://img/{i}.jpg" for i in range(3)]}
+    assert elapsed < GENERATION_DELAY * 1.5
+    assert sessions[0] is not None and sessions[0] is sessions[1]
+    events = [line for line in streamed.text.splitlines() if line.startswith("event:")]
+    assert sorted(events[:2]) == ["event: context", "event: images"]
+    assert events[2:] == ["event: done"]
+
+
+def test_image_counts_are_clamped(monkeypatch):
+    requested = []
+
+    def images(product_name, count=20, ddgs=None):
+        requested.append(count)
+        return []
+
+    monkeypatch.setattr(app_v5, "search_product_images", images)
+    monkeypatch.setattr(app_v5, "search_product_info", lambda product_name, ddgs=None: "")
+
+    asyncio.run(post_many("/api/images", {"product_name": "獺祭", "count": 100000}, 1))
+    asyncio.run(post_many("/api/prepare", {"product_name": "獺祭", "count": -5}, 1))
+
+    assert requested == [app_v5.MAX_IMAGE_COUNT, 1]
+
+
+def test_saved_proposals_do_not_wait_behind_searches(monkeypatch):
+    monkeypatch.setattr(app_v5, "search_product_info", lambda product_name: time.sleep(GENERATION_DELAY) or "")
+    searches = app_v5.PROVIDER_CONCURRENCY["search"] * 2
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            busy = [asyncio.create_task(client.post("/api/search", json={"product_name": "獺祭"}))
+                    for _ in range(searches)]
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            saved = (await client.post("/api/proposals", json={"data": {"product_name": "獺祭"}, "image_url": ""})).json()
+            rendered = await client.get(saved["url"])
+            elapsed = time.perf_counter() - start
+            await asyncio.gather(*busy)
+            return rendered, elapsed
+
+    rendered, elapsed = asyncio.run(run())
+
+    assert rendered.status_code == 200
+    assert elapsed < GENERATION_DELAY / 2
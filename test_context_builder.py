@@ -0,0 +1,47 @@
+from context_builder import build_context, parse_snippets
+from text_rank import bm25_scores, text_tokens
+
+CONTEXT = (
+    "Title: 獺祭 純米大吟醸 磨き二割三分 720ml【送料無料】【ポイント10倍】 | 楽天市場\n"
+    "Snippet: 2024/05/01 獺祭 磨き二割三分は山田錦を23%まで磨いた純米大吟醸。華やかな香りと繊細な甘み...\n"
+    "URL: https://item.rakuten.co.jp/shop/dassai23/\n\n"
+    "Title: 獺祭 純米大吟醸 磨き二割三分 | 旭酒造\n"
+    "Snippet: 獺祭 磨き二割三分は山田錦を23%まで磨いた純米大吟醸。華やかな香りと繊細な甘み。\n"
+    "URL: https://www.asahishuzo.ne.jp/products/23/\n\n"
+    "Title: 週末のおすすめレシピ特集\n"
+    "Snippet: 今週は旬の野菜を使った簡単レシピをご紹介します。\n"
+    "URL: https://recipes.example.com/weekly\n\n"
+    "Title: 獺祭 二割三分 レビュー\n"
+    "Snippet: 贈答用に購入。冷やして飲むとフルーティーで飲みやすい日本酒でした。\n"
+    "URL: https://review.example.com/dassai\n\n"
+)
+
+
+def test_tokens_cover_japanese_and_latin_text():
+    assert text_tokens("獺祭 720ml") == ["720ml", "獺祭"]
+
+
+def test_bm25_prefers_documents_matching_rare_query_terms():
+    scores = bm25_scores("獺祭 スペック", ["獺祭 スペック 精米歩合", "獺祭 レビュー", "日本酒 ランキング"])
+    assert scores[0] > scores[1] > scores[2] == 0
+
+
+def test_build_context_dedupes_strips_and_ranks():
+    built, stats = build_context("獺祭 純米大吟醸 磨き二割三分", CONTEXT, budget=1000)
+
+    assert len(parse_snippets(CONTEXT)) == 4 and stats["snippets"] == 2
+    assert "送料無料" not in built and "楽天市場" not in built and "2024/05/01" not in built
+    assert "https://" not in built and "(item.rakuten.co.jp)" in built
+    assert built.index("磨き二割三分") < built.index("レビュー") and "レシピ" not in built
+    assert stats["tokens_saved"] == stats["original_tokens"] - stats["tokens"] > 0
+
+
+def test_build_context_respects_token_budget():
+    built, stats = build_context("獺祭 純米大吟醸 磨き二割三分", CONTEXT, budget=60)
+    assert stats["tokens"] <= 60 and stats["snippets"] == 1
+    assert "磨き二割三分" in built
+
+
+def test_free_text_context_is_kept():
+    built, _ = build_context("獺祭", "手入力のメモ：贈答向けに人気。")
+    assert built == "- 手入力のメモ：贈答向けに人気。"
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import gemini_client
+from gemini_client import GeminiClientManager, QuotaExhausted
+
+
+class FakeModel:
+    def __init__(self, api_key, calls, fail_with=None, delay=0):
+        self.api_key = api_key
+        self.calls = calls
+        self.fail_with = fail_with
+        self.delay = delay
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        self.calls.append(self.api_key)
+        time.sleep(self.delay)
+        if self.fail_with:
+            raise self.fail_with
+        return type("Response", (), {"text": "{}", "usage_metadata": None})()
+
+
+def make_manager(keys, calls, failing=(), delay=0, **kwargs):
+    class Manager(GeminiClientManager):
+        def _make_model(self, api_key):
+            error = google_exceptions.ResourceExhausted("quota") if api_key in failing else None
+            return FakeModel(api_key, calls, error, delay)
+
+    return Manager(keys, "gemini-test", **kwargs)
+
+
+def test_requests_spread_across_least_loaded_keys():
+    calls = []
+    manager = make_manager(["key-a", "key-b", "key-c"], calls, delay=0.1, rpm_limit=100)
+    threads = [threading.Thread(target=manager.generate_content, args=("prompt",)) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(calls) == ["key-a", "key-a", "key-b", "key-b", "key-c", "key-c"]
+
+
+def test_rate_limited_key_is_cooled_down_and_request_retried(monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_COOLDOWN", 60)
+    calls = []
+    manager = make_manager(["key-a", "key-b"], calls, failing={"key-a"}, rpm_limit=100)
+    manager.generate_content("prompt")
+    manager.generate_content("prompt")
+    assert calls == ["key-a", "key-b", "key-b"]
+    stats = {key["key"]: key for key in manager.stats()["keys"]}
+    assert stats["...ey-a"]["cooling_down"] and stats["...ey-a"]["rate_limited"] == 1
+
+
+def test_waits_for_quota_instead_of_failing(monkeypatch):
+    monkeypatch.setattr(gemini_client, "WINDOW", 0.3)
+    calls = []
+    manager = make_manager(["key-a"], calls, rpm_limit=1, max_queue_wait=2)
+    start = time.monotonic()
+    manager.generate_content("prompt")
+    manager.generate_content("prompt")
+    assert 0.25 < time.monotonic() - start < 1.5
+    assert calls == ["key-a", "key-a"]
+
+
+def test_gives_up_when_quota_does_not_free_in_time():
+    manager = make_manager(["key-a"], [], rpm_limit=1, max_queue_wait=0.1)
+    manager.generate_content("prompt")
+    with pytest.raises(QuotaExhausted):
+        manager.generate_content("prompt")
+
+
+def test_configured_api_keys_merges_pool_and_single_key(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEYS", "key-a, key-b,")
+    monkeypatch.setenv("GOOGLE_API_KEY", "key-a")
+    assert gemini_client.configured_api_keys() == ["key-a", "key-b"]
@@ -0,0 +1,64 @@
+import io
+
+import httpx
+from PIL import Image, ImageDraw
+
+import image_dedup
+import product_search
+from proposal_cache import ProposalCache
+
+
+def picture(size, shape):
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    w, h = size
+    if shape == "bottle":
+        draw.rectangle([w * 0.4, h * 0.2, w * 0.6, h * 0.9], fill=(20, 60, 20))
+    else:
+        draw.ellipse([w * 0.1, w * 0.1, w * 0.6, h * 0.5], fill=(200, 120, 0))
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=70)
+    return output.getvalue()
+
+
+def client_for(routes):
+    return httpx.Client(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, content=routes[str(request.url)]) if str(request.url) in routes
+        else httpx.Response(404)))
+
+
+def test_near_duplicates_collapse_to_highest_resolution(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_dedup, "hash_cache", ProposalCache(path=str(tmp_path / "hashes.sqlite3")))
+    client = client_for({
+        "https://t/1": picture((120, 160), "bottle"),
+        "https://t/2": picture((90, 120), "bottle"),
+        "https://t/3": picture((120, 160), "cake"),
+    })
+    candidates = [
+        {"image": "https://shop-a/small.jpg", "thumbnail": "https://t/1", "width": 300, "height": 400},
+        {"image": "https://cakes/1.jpg", "thumbnail": "https://t/3", "width": 600, "height": 800},
+        {"image": "https://shop-b/large.jpg", "thumbnail": "https://t/2", "width": 1200, "height": 1600},
+        {"image": "https://broken/1.jpg", "thumbnail": "https://t/missing"},
+    ]
+
+    distinct = image_dedup.dedupe_candidates(candidates, client=client)
+
+    assert [c["image"] for c in distinct] == ["https://shop-b/large.jpg", "https://cakes/1.jpg", "https://broken/1.jpg"]
+
+
+def test_fetch_over_fetches_and_returns_distinct_urls(monkeypatch):
+    requested = []
+
+    class FakeDDGS:
+        def images(self, query, region, max_results):
+            requested.append(max_results)
+            return [{"image": f"https://img/{i}"} for i in range(max_results)]
+
+    monkeypatch.setattr(product_search, "dedupe_candidates", lambda results: results[::3])
+    monkeypatch.setattr(product_search.ddgs_limiter, "acquire", lambda: 0)
+
+    entry = product_search.fetch_product_images("獺祭", 20, ddgs=FakeDDGS())
+
+    assert requested == [20 * product_search.IMAGE_OVERFETCH]
+    assert entry["urls"][:2] == ["https://img/0", "https://img/3"]
+    assert entry["exhausted"] == (len(entry["urls"]) < 20)
@@ -0,0 +1,62 @@
+import io
+
+import httpx
+import numpy as np
+from PIL import Image, ImageDraw
+
+from image_ranking import SIZE, rank_images, score_images
+from image_store import ImageStore
+from proposal_cache import ProposalCache
+
+
+def packshot(size=(800, 800), offset=(0, 0), background="white", text=False):
+    image = Image.new("RGB", size, background)
+    draw = ImageDraw.Draw(image)
+    w, h = size
+    dx, dy = offset
+    draw.rectangle([w * 0.35 + dx, h * 0.15 + dy, w * 0.65 + dx, h * 0.85 + dy], fill=(90, 20, 30))
+    if text:  # rows of glyph-like strokes: a shop banner, a caption and a watermark
+        for y in (h * 0.05, h * 0.45, h * 0.88):
+            for x in range(20, w - 40, 36):
+                draw.rectangle([x, y, x + 14, y + 50], fill="black")
+    return image
+
+
+def as_array(image):
+    return np.asarray(image.resize((SIZE, SIZE)), dtype=np.float32)
+
+
+def test_clean_centered_white_packshot_scores_best():
+    images = [
+        packshot(background=(120, 120, 120)),
+        packshot(),
+        packshot(offset=(-220, -100)),
+        packshot(text=True),
+        packshot(size=(1600, 300)),
+    ]
+    sizes = [image.size for image in images]
+    features, total = score_images(np.stack([as_array(image) for image in images]), sizes)
+
+    assert int(np.argmax(total)) == 1
+    assert features["white_background"][1] > 0.95 > features["white_background"][0]
+    assert features["centered"][1] > features["centered"][2]
+    assert features["clean"][1] > features["clean"][3]
+    assert features["aspect"][1] > features["aspect"][4]
+
+
+def test_rank_images_puts_unreadable_candidates_last(tmp_path):
+    def jpeg(image):
+        output = io.BytesIO()
+        image.save(output, "JPEG")
+        return output.getvalue()
+
+    routes = {"https://a/off.jpg": jpeg(packshot(offset=(-250, -150))), "https://a/good.jpg": jpeg(packshot())}
+    client = httpx.Client(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, content=routes[str(request.url)]) if str(request.url) in routes
+        else httpx.Response(404)))
+    store = ImageStore(root=str(tmp_path / "images"), cache=ProposalCache(path=str(tmp_path / "c.sqlite3")), client=client)
+
+    ranked = rank_images(["https://a/missing.jpg", "https://a/off.jpg", "https://a/good.jpg"], store=store)
+
+    assert [entry["url"] for entry in ranked] == ["https://a/good.jpg", "https://a/off.jpg", "https://a/missing.jpg"]
+    assert ranked[-1]["score"] == 0.0 and set(ranked[0]["features"]) >= {"resolution", "white_background"}
@@ -0,0 +1,173 @@
+import asyncio
+import io
+import os
+
+import httpx
+import pytest
+from PIL import Image
+
+import app_v5
+from image_store import ImageFetchError, ImageStore, PublicOnlyTransport
+from proposal_cache import ProposalCache
+
+
+def jpeg_bytes(size=(1600, 1200), color=(200, 30, 30)):
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, "JPEG")
+    return output.getvalue()
+
+
+def make_store(tmp_path, routes):
+    requests = []
+
+    def handler(request):
+        requests.append(str(request.url))
+        body = routes.get(str(request.url))
+        return httpx.Response(200, content=body) if body is not None else httpx.Response(404)
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    store = ImageStore(root=str(tmp_path / "images"), cache=ProposalCache(path=str(tmp_path / "cache.sqlite3")), client=client)
+    return store, requests
+
+
+def test_same_image_from_two_retailers_is_stored_once(tmp_path):
+    photo = jpeg_bytes()
+    store, requests = make_store(tmp_path, {"https://a.example/1.jpg": photo, "https://b.example/x.jpg": photo})
+
+    first = store.fetch("https://a.example/1.jpg")
+    second = store.fetch("https://b.example/x.jpg")
+    again = store.fetch("https://a.example/1.jpg")
+
+    assert first == second == again
+    assert len(requests) == 2
+    assert os.listdir(os.path.dirname(store.original_path(first))) == [first]
+
+
+def test_variants_are_resized_jpegs(tmp_path):
+    store, _ = make_store(tmp_path, {"https://a.example/1.jpg": jpeg_bytes()})
+    digest = store.fetch("https://a.example/1.jpg")
+
+    with Image.open(store.variant(digest, "thumb")) as thumb:
+        assert thumb.format == "JPEG" and max(thumb.size) == 320
+    with Image.open(store.variant(digest, "print")) as printed:
+        assert printed.size == (1200, 900)
+
+
+def test_localize_falls_back_for_broken_images(tmp_path):
+    store, _ = make_store(tmp_path, {"https://a.example/page.html": b"<html></html>"})
+    assert store.localize("https://a.example/page.html") is None
+    assert store.localize("https://a.example/missing.jpg") is None
+
+
+def test_proxy_endpoint_serves_cached_thumbnails(tmp_path, monkeypatch):
+    store, requests = make_store(tmp_path, {"https://a.example/1.jpg": jpeg_bytes()})
+    monkeypatch.setattr(app_v5, "image_store", store)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            url = app_v5.proxied_image_url("https://a.example/1.jpg", "thumb")
+            first, second = [await client.get(url) for _ in range(2)]
+            stored = await client.get(first.headers["content-location"])
+            return first, second, stored
+
+    first, second, stored = asyncio.run(run())
+
+    assert first.status_code == second.status_code == 200
+    assert first.headers["content-type"] == "image/jpeg"
+    assert len(first.content) < len(jpeg_bytes())
+    assert len(requests) == 1
+    assert "immutable" in stored.headers["cache-control"]
+    assert stored.content == first.content
+
+
+def test_private_and_redirected_private_addresses_are_refused(tmp_path):
+    def handler(request):
+        if request.url.host == "93.184.216.34":
+            return httpx.Response(302, headers={"Location": "http://127.0.0.1:8080/admin"})
+        return httpx.Response(200, content=jpeg_bytes())
+
+    client = httpx.Client(transport=PublicOnlyTransport(httpx.MockTransport(handler)), follow_redirects=True)
+    store = ImageStore(root=str(tmp_path / "images"), cache=ProposalCache(path=str(tmp_path / "cache.sqlite3")),
+                       client=client)
+    for url in ("http://169.254.169.254/latest/meta-data", "http://[::1]/x.jpg", "http://10.0.0.5/x.jpg",
+                "http://93.184.216.34/x.jpg"):
+        with pytest.raises(ImageFetchError, match="non-public"):
+            store.fetch(url)
+    assert not os.path.exists(tmp_path / "images")
+
+
+def test_store_evicts_least_recently_used_files(tmp_path):
+    photos = {f"https://a.example/{i}.jpg": jpeg_bytes(color=(i * 40, 0, 0)) for i in range(4)}
+    store, _ = make_store(tmp_path, photos)
+    store.max_bytes = sum(map(len, photos.values())) * 0.8
+
+    digests = []
+    for i, url in enumerate(photos):
+        digests.append(store.fetch(url))
+        os.utime(store.original_path(digests[-1]), (i, i))  # distinct, ordered use times
+    assert not store.has(digests[0])
+    assert store.has(digests[-1])
+    assert sum(size for _, size, _ in store._files()) <= store.max_bytes
+
+
+def test_eviction_leaves_unrelated_files_in_the_root_alone(tmp_path):
+    photos = {f"https://a.example/{i}.jpg": jpeg_bytes(color=(i * 40, 0, 0)) for i in range(3)}
+    store, _ = make_store(tmp_path, photos)
+    os.makedirs(store.root)
+    unrelated = os.path.join(store.root, "media__1.png")
+    with open(unrelated, "wb") as f:
+        f.write(b"x" * 4096)
+    os.utime(unrelated, (0, 0))  # older than anything the store writes
+    store.max_bytes = sum(map(len, photos.values())) * 0.8
+
+    for url in photos:
+        store.fetch(url)
+    assert os.path.exists(unrelated)
+    assert unrelated not in [path for _, _, path in store._files()]
+
+
+def test_replay_serves_recorded_images_without_downloading(tmp_path, monkeypatch):
+    import provider_cassette
+
+    cassette = str(tmp_path / "providers.jsonl.gz")
+    store, requests = make_store(tmp_path, {"https://a.example/1.jpg": jpeg_bytes()})
+    monkeypatch.setattr(app_v5, "image_store", store)
+    try:
+        provider_cassette.configure("record", cassette)
+        digest = store.fetch("https://a.example/1.jpg")
+        store.cache = ProposalCache(path=str(tmp_path / "empty.sqlite3"))  # the shared cache may have evicted it
+        provider_cassette.configure("replay", cassette)
+
+        async def run():
+            transport = httpx.ASGITransport(app=app_v5.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                served = await client.get(app_v5.proxied_image_url("https://a.example/1.jpg", "thumb"))
+                unknown = await client.get(app_v5.proxied_image_url("https://a.example/2.jpg", "thumb"))
+                return served, unknown
+
+        served, unknown = asyncio.run(run())
+    finally:
+        provider_cassette.configure("live")
+
+    assert served.status_code == 200
+    assert served.headers["etag"] == f'"{digest}.thumb"'
+    assert unknown.status_code == 502
+    assert requests == ["https://a.example/1.jpg"]
+
+
+def test_cli_proposals_keep_their_image_after_eviction(tmp_path, monkeypatch):
+    import create_proposal_v4
+
+    store, _ = make_store(tmp_path, {"https://a.example/1.jpg": jpeg_bytes()})
+    monkeypatch.setattr(create_proposal_v4, "image_store", store)
+    output = tmp_path / "html" / "proposal.html"
+    output.parent.mkdir()
+
+    create_proposal_v4.create_html_output({"product_name": "獺祭"}, "https://a.example/1.jpg", str(output))
+    for _, _, path in list(store._files()):
+        os.remove(path)
+
+    digest = store.fetch("https://a.example/1.jpg")
+    assert 'src="images/' in output.read_text(encoding="utf-8")
+    assert (output.parent / "images" / f"{digest}.jpg").exists()
@@ -0,0 +1,52 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app_v5
+import metrics
+from proposal_render import render_proposal_html
+
+
+def test_histogram_and_errors_render_in_prometheus_format():
+    registry = metrics.Registry()
+    latency = registry.register(metrics.Histogram("demo_seconds", "Demo.", labels=("stage",), buckets=(0.1, 1)))
+    errors = registry.register(metrics.Counter("demo_errors_total", "Demo errors.", labels=("stage", "error")))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, stage="ddgs_text")
+    errors.inc(stage="gemini", error='Quota"Exhausted')
+
+    text = registry.render()
+
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{stage="ddgs_text",le="0.1"} 2' in text
+    assert 'demo_seconds_bucket{stage="ddgs_text",le="1.0"} 3' in text
+    assert 'demo_seconds_bucket{stage="ddgs_text",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{stage="ddgs_text"} 4' in text
+    assert 'demo_errors_total{stage="gemini",error="Quota\\"Exhausted"} 1' in text
+
+
+def test_track_counts_errors_and_in_flight():
+    with pytest.raises(ValueError):
+        with metrics.track("test_stage"):
+            assert metrics.stage_in_flight.value(stage="test_stage") == 1
+            raise ValueError("boom")
+
+    assert metrics.stage_in_flight.value(stage="test_stage") == 0
+    assert metrics.stage_errors.value(stage="test_stage", error="ValueError") >= 1
+    assert metrics.stage_seconds.count(stage="test_stage") >= 1
+
+
+def test_metrics_endpoint_exposes_pipeline_stages():
+    render_proposal_html({"product_name": "獺祭"}, "")
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.get("/metrics")
+
+    response = asyncio.run(run())
+
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'proposal_stage_duration_seconds_count{stage="render"}' in response.text
+    assert "# TYPE proposal_stage_in_flight gauge" in response.text
@@ -0,0 +1,114 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+import app_v5
+import proposal_pdf
+from proposal_batch import BatchJob
+
+
+class FakeHTML:
+    """Stands in for weasyprint.HTML: the 'PDF' is the document's <title>."""
+
+    def __init__(self, string, base_url=None, url_fetcher=None):
+        self.string = string
+
+    def write_pdf(self, stylesheets=(), font_config=None):
+        return self.string.split("<title>")[1].split("</title>")[0].encode("utf-8")
+
+
+class FakeWriter:
+    def __init__(self):
+        self.parts = []
+
+    def append(self, stream):
+        self.parts.append(stream.read())
+
+    def write(self, output):
+        output.write(b"|".join(self.parts))
+
+
+@pytest.fixture
+def fake_pdf(monkeypatch):
+    monkeypatch.setattr(proposal_pdf, "HTML", FakeHTML)
+    monkeypatch.setattr(proposal_pdf, "PdfWriter", FakeWriter)
+    monkeypatch.setattr(proposal_pdf, "pdf_font", lambda: None)
+    monkeypatch.setattr(app_v5, "pdf_font", lambda: None)
+    executor = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setitem(app_v5.provider_executors, "pdf", executor)
+    yield executor
+    executor.shutdown()
+
+
+def proposal(name):
+    return {"data": {"product_name": name}, "image_url": ""}
+
+
+def test_catalog_keeps_catalog_order(fake_pdf):
+    htmls = [app_v5.render_proposal_html(p["data"], "") for p in map(proposal, ["A", "B", "C"])]
+    assert proposal_pdf.render_catalog_pdf(htmls, executor=fake_pdf) == "商品提案書: A|商品提案書: B|商品提案書: C".encode("utf-8")
+
+
+def test_batch_catalog_endpoint_merges_finished_items(fake_pdf):
+    job = BatchJob([{"product_name": name} for name in ["A", "B", "C"]])
+    job.update(2, "done", result=proposal("C"))
+    job.update(0, "done", result=proposal("A"))
+    job.update(1, "failed", error="boom")
+    app_v5.batch_jobs[job.id] = job
+
+    async def get():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.get(f"/api/batch/{job.id}/catalog.pdf")
+
+    response = asyncio.run(get())
+
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.content == "商品提案書: A|商品提案書: C".encode("utf-8")
+
+
+def test_pdf_endpoint_reports_missing_dependencies(monkeypatch):
+    monkeypatch.setattr(proposal_pdf, "HTML", None)
+    job = BatchJob([{"product_name": "A"}])
+    job.update(0, "done", result=proposal("A"))
+    app_v5.batch_jobs[job.id] = job
+
+    async def get():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.get(f"/api/batch/{job.id}/catalog.pdf")
+
+    response = asyncio.run(get())
+    assert response.status_code == 501
+    assert "weasyprint" in response.json()["detail"]
+
+
+def test_pdfs_use_the_local_font_and_never_fetch_remote_urls(monkeypatch, tmp_path):
+    rendered = {}
+
+    class RecordingHTML(FakeHTML):
+        def __init__(self, string, base_url=None, url_fetcher=None):
+            super().__init__(string)
+            rendered["fetcher"] = url_fetcher
+
+        def write_pdf(self, stylesheets=(), font_config=None):
+            rendered["css"] = [css.string for css in stylesheets]
+            return b"pdf"
+
+    class FakeCSS:
+        def __init__(self, string, font_config=None, url_fetcher=None):
+            self.string = string
+
+    monkeypatch.setattr(proposal_pdf, "HTML", RecordingHTML)
+    monkeypatch.setattr(proposal_pdf, "PdfWriter", FakeWriter)
+    monkeypatch.setattr(proposal_pdf, "CSS", FakeCSS, raising=False)
+    monkeypatch.setattr(proposal_pdf, "FontConfiguration", object, raising=False)
+    font = tmp_path / "NotoSansJP.ttf"
+
+    assert proposal_pdf.html_to_pdf(app_v5.render_proposal_html({"product_name": "A"}, ""), font=str(font)) == b"pdf"
+    assert font.as_uri() in rendered["css"][0]
+    for url in ("https://fonts.googleapis.com/css2?family=Noto+Sans+JP", "http://example.com/a.jpg"):
+        with pytest.raises(ValueError, match="Remote resource"):
+            rendered["fetcher"](url)
@@ -0,0 +1,69 @@
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import product_search
+
+QUERY_DELAY = 0.3
+
+
+class FakeDDGS:
+    """Each query variant answers after QUERY_DELAY with pages matching its wording."""
+
+    pages = {
+        "公式": [{"title": "獺祭 | 旭酒造 公式", "body": "獺祭の公式サイト。", "href": "https://asahishuzo.ne.jp/"}],
+        "仕様": [{"title": "獺祭 スペック 仕様", "body": "獺祭 精米歩合23% 仕様 原材料 山田錦", "href": "https://spec.example/dassai"}],
+        "レビュー": [
+            {"title": "日本酒ランキング", "body": "今月の人気銘柄。", "href": "https://rank.example/"},
+            {"title": "獺祭 レビュー", "body": "フルーティーで飲みやすい。", "href": "https://review.example/dassai"},
+        ],
+        "メーカー": [{"title": "獺祭 | 旭酒造 公式", "body": "獺祭の公式サイト。", "href": "https://asahishuzo.ne.jp/"}],
+    }
+
+    def __init__(self, fail=()):
+        self.fail = fail
+
+    def text(self, query, region, max_results):
+        time.sleep(QUERY_DELAY)
+        for word, results in self.pages.items():
+            if word in query:
+                if word in self.fail:
+                    raise RuntimeError("ratelimit")
+                return results
+        return []
+
+
+@pytest.fixture
+def fake_ddgs(monkeypatch):
+    monkeypatch.setattr(product_search.ddgs_limiter, "acquire", lambda: 0)
+
+    def install(fail=()):
+        @contextmanager
+        def session(ddgs=None):
+            yield FakeDDGS(fail)
+        monkeypatch.setattr(product_search, "_session", session)
+
+    return install
+
+
+def test_query_variants_run_concurrently_and_merge_by_bm25(fake_ddgs):
+    fake_ddgs()
+    start = time.perf_counter()
+    context = product_search.fetch_product_info("獺祭")
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < QUERY_DELAY * 2, f"{len(product_search.CONTEXT_QUERIES)} variants took {elapsed:.2f}s"
+    urls = [line[len("URL: "):] for line in context.splitlines() if line.startswith("URL: ")]
+    assert urls[0] == "https://spec.example/dassai"
+    assert urls.count("https://asahishuzo.ne.jp/") == 1
+    assert urls[-1] == "https://rank.example/"
+
+
+def test_failed_variants_are_tolerated_unless_all_fail(fake_ddgs):
+    fake_ddgs(fail=("公式", "レビュー"))
+    assert "https://spec.example/dassai" in product_search.fetch_product_info("獺祭")
+
+    fake_ddgs(fail=tuple(FakeDDGS.pages))
+    with pytest.raises(RuntimeError):
+        product_search.fetch_product_info("獺祭")
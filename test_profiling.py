@@ -0,0 +1,65 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import create_proposal_v4
+import profiling
+from profiling import RunProfile, aggregate, in_context, percentile, record, stage
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([3.0], 95) == 3.0
+
+
+def test_stage_and_record_are_noops_without_a_profile():
+    with stage('search'):
+        record('search_result_bytes', 10)
+
+
+def test_counters_follow_the_profile_into_executor_threads():
+    profile = RunProfile('電気ケトル')
+    with profile.activate():
+        with stage('image_selection'):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(in_context(lambda n: record('bytes_fetched_images', n)), [100, 200, 300]))
+            time.sleep(0.01)
+    report = profile.to_dict()
+    assert report['counters'] == {'bytes_fetched_images': 600}
+    assert report['stages']['image_selection']['wall'] >= 0.01
+
+
+def test_aggregate_reports_stage_percentiles_and_counter_totals():
+    runs = [{'name': str(i), 'stages': {'generation': {'wall': float(i), 'cpu': 0.1}},
+             'counters': {'prompt_chars': 1000}} for i in range(1, 21)]
+    report = aggregate(runs)
+    assert report['items'] == 20
+    assert report['stages']['generation']['count'] == 20
+    assert report['stages']['generation']['wall']['p50'] == 10.0
+    assert report['stages']['generation']['wall']['p95'] == 19.0
+    assert report['counters'] == {'prompt_chars': 20000}
+    assert 'generation' in profiling.format_aggregate(report)
+
+
+def test_batch_profile_writes_per_item_runs_and_aggregate(tmp_path, monkeypatch):
+    catalog = tmp_path / 'catalog.csv'
+    catalog.write_text('name,price,capacity\nケトルA,3980,1.0L\nケトルB,4980,1.2L\n', encoding='utf-8')
+    monkeypatch.setattr(create_proposal_v4, 'search_product_info', lambda name: record('search_result_bytes', 5) or 'ctx')
+    monkeypatch.setattr(create_proposal_v4, 'search_product_images', lambda name, count=5: [])
+    monkeypatch.setattr(create_proposal_v4, 'select_image_automatically', lambda urls: None)
+    monkeypatch.setattr(create_proposal_v4, 'generate_proposal_content',
+                        lambda *args, **kwargs: {'product_name': args[1]})
+    monkeypatch.setattr(create_proposal_v4, 'create_html_output', lambda data, image_url, path, bundle=False: None)
+    output = tmp_path / 'profile.json'
+
+    status = create_proposal_v4.batch_main([
+        str(catalog), '--api_key', 'key', '--output-dir', str(tmp_path / 'html'),
+        '--journal', str(tmp_path / 'journal.jsonl'), '--profile', str(output)])
+
+    assert status == 0
+    report = json.loads(output.read_text(encoding='utf-8'))
+    assert report['items'] == 2
+    assert {run['name'] for run in report['runs']} == {'ケトルA', 'ケトルB'}
+    assert set(report['stages']) == {'context_search', 'image_selection', 'generation', 'html_output'}
+    assert report['counters']['search_result_bytes'] == 10
@@ -0,0 +1,146 @@
+import threading
+import time
+
+from proposal_cache import LRUCache, ProposalCache, normalize_product_name
+
+
+def make_cache(tmp_path, **kwargs):
+    return ProposalCache(path=str(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def test_normalized_names_share_an_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return "context"
+
+    cache.get_or_fetch("context", "Monte  Viesgo Crianza", "{product_name} q", fetch)
+    assert cache.get_or_fetch("context", "ｍｏｎｔｅ viesgo crianza", "{product_name} q", fetch) == "context"
+    assert len(calls) == 1
+    assert normalize_product_name(" 獺祭　磨き ") == "獺祭 磨き"
+
+
+def test_query_template_is_part_of_the_key(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.get_or_fetch("context", "獺祭", "a", lambda: "first")
+    assert cache.get_or_fetch("context", "獺祭", "b", lambda: "second") == "second"
+
+
+def test_empty_results_are_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.get_or_fetch("context", "獺祭", "q", lambda: "")
+    assert cache.get_or_fetch("context", "獺祭", "q", lambda: "found") == "found"
+
+
+def test_stale_entry_is_served_while_refreshing(tmp_path):
+    cache = make_cache(tmp_path, ttl=0.05, stale_ttl=60)
+    cache.get_or_fetch("context", "獺祭", "q", lambda: "old")
+    time.sleep(0.1)
+
+    refreshed = threading.Event()
+
+    def fetch():
+        refreshed.set()
+        return "new"
+
+    assert cache.get_or_fetch("context", "獺祭", "q", fetch) == "old"
+    assert refreshed.wait(2)
+    deadline = time.time() + 2
+    while cache._refreshing and time.time() < deadline:
+        time.sleep(0.01)
+    value, _ = cache.get("context", "獺祭\x1fq")
+    assert value == "new"
+
+
+def test_expired_entry_is_a_miss(tmp_path):
+    cache = make_cache(tmp_path, ttl=0.01, stale_ttl=0.01)
+    cache.get_or_fetch("context", "獺祭", "q", lambda: "old")
+    time.sleep(0.05)
+    assert cache.get_or_fetch("context", "獺祭", "q", lambda: "new") == "new"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.set("context", "a", "A")
+    cache.set("context", "b", "B")
+    cache.get("context", "a")
+    cache.set("context", "c", "C")
+    assert cache.get("context", "a")[0] == "A"
+    assert cache.get("context", "b") == (None, None)
+
+
+def test_invalidate_by_product(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.get_or_fetch("context", "獺祭", "q", lambda: "dassai")
+    cache.get_or_fetch("context", "Monte Viesgo", "q", lambda: "monte")
+    assert cache.invalidate(product_name=" 獺祭 ") == 1
+    assert cache.get_or_fetch("context", "獺祭", "q", lambda: "fresh") == "fresh"
+    assert cache.get_or_fetch("context", "Monte Viesgo", "q", lambda: "unused") == "monte"
+
+
+def test_invalidate_by_product_clears_hashed_keys_from_memory(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("gemini", "9f86d081", {"data": "dassai"}, product="獺祭")
+    cache.store("gemini", "60303ae2", {"data": "monte"}, product="monte viesgo")
+    assert cache.lookup("gemini", "9f86d081") == {"data": "dassai"}  # now in the memory layer
+    assert cache.invalidate("gemini", "獺祭") == 1
+    assert cache.lookup("gemini", "9f86d081") is None
+    assert cache.lookup("gemini", "60303ae2") == {"data": "monte"}
+
+
+def test_memory_layer_is_bounded_by_bytes():
+    lru = LRUCache(max_bytes=10)
+    lru.set("a", "A", 6)
+    lru.set("b", "B", 6)
+    assert lru.get("a") is None
+    assert lru.get("b") == "B"
+
+
+def test_smaller_image_count_is_served_from_larger_result(tmp_path, monkeypatch):
+    import product_search
+
+    cache = make_cache(tmp_path)
+    monkeypatch.setattr(product_search, "shared_cache", cache)
+    requested = []
+
+    def fake_fetch(product_name, count, ddgs=None):
+        requested.append(count)
+        return {"urls": [f"https://img/{i}" for i in range(count)], "exhausted": False}
+
+    monkeypatch.setattr(product_search, "fetch_product_images", fake_fetch)
+    assert len(product_search.search_product_images("獺祭", count=8)) == 8
+    assert product_search.search_product_images("獺祭", count=5) == [f"https://img/{i}" for i in range(5)]
+    assert len(product_search.search_product_images("獺祭", count=40)) == 40
+    assert requested == [product_search.IMAGE_FETCH_MIN, 40]
+
+
+def test_gemini_responses_are_cached_by_prompt(tmp_path, monkeypatch):
+    import gemini_client
+    import proposal_generation
+
+    cache = make_cache(tmp_path)
+    monkeypatch.setattr(proposal_generation, "shared_cache", cache)
+    calls = []
+
+    class FakeModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, prompt, generation_config=None, stream=False):
+            calls.append(prompt)
+            usage = type("Usage", (), {"total_token_count": 1200})()
+            return type("Response", (), {"text": '{"catch_copy": "極限の磨き"}', "usage_metadata": usage})()
+
+    monkeypatch.setattr(gemini_client, "_manager", None)
+    monkeypatch.setattr(gemini_client.genai, "GenerativeModel", FakeModel)
+
+    args = ("key", "獺祭", "5,500円", "720ml", "context")
+    assert proposal_generation.generate_proposal_json(*args) == {"catch_copy": "極限の磨き"}
+    assert proposal_generation.generate_proposal_json(*args) == {"catch_copy": "極限の磨き"}
+    proposal_generation.generate_proposal_json(*args[:-1], "other context")
+    proposal_generation.generate_proposal_json(*args, force_regenerate=True)
+
+    assert len(calls) == 3
+    assert cache.stats()["gemini"] == {"miss": 2, "hit": 1, "tokens_saved": 1200, "forced": 1}
@@ -0,0 +1,107 @@
+import os
+import pytest
+import provider_cassette
+from create_proposal_v4 import create_proposal
+from fake_providers import FakeGenerativeModel, FakeProviderConfig, offline_providers
+from provider_cassette import Cassette, CassetteMiss, RecordingModel, ReplayModel
+
+INSTANT = dict(search_latency=0, image_latency=0, gemini_latency=0)
+
+
+@pytest.fixture(autouse=True)
+def live_afterwards():
+    yield
+    provider_cassette.configure('live')
+
+
+def test_cassette_persists_and_reports_misses(tmp_path):
+    path = str(tmp_path / 'providers.jsonl.gz')
+    Cassette(path).put('ddgs.text', {'query': '獺祭 公式'}, [{'title': '獺祭'}])
+
+    cassette = Cassette(path)
+    assert cassette.get('ddgs.text', {'query': '獺祭 公式'}) == [{'title': '獺祭'}]
+    with pytest.raises(CassetteMiss):
+        cassette.get('ddgs.text', {'query': '獺祭 レビュー'})
+    assert cassette.stats()['hits'] == 1 and cassette.stats()['misses'] == 1
+
+
+def test_recording_appends_and_survives_a_truncated_entry(tmp_path):
+    path = str(tmp_path / 'providers.jsonl.gz')
+    cassette = Cassette(path)
+    cassette.put('ddgs.text', {'query': 'a'}, ['first'])
+    size = os.path.getsize(path)
+    cassette.put('ddgs.text', {'query': 'b'}, ['second'])
+    complete = os.path.getsize(path)
+    cassette.put('ddgs.text', {'query': 'a'}, ['again'])
+    assert Cassette(path).get('ddgs.text', {'query': 'a'}) == ['again']
+
+    with open(path, 'r+b') as f:  # cut the last entry short, as a killed run would
+        f.truncate(complete + 12)
+    reloaded = Cassette(path)
+    assert reloaded.get('ddgs.text', {'query': 'a'}) == ['first']
+    assert reloaded.get('ddgs.text', {'query': 'b'}) == ['second']
+    assert os.path.getsize(path) > size
+
+
+def test_recording_after_a_truncated_entry_is_not_lost(tmp_path):
+    path = str(tmp_path / 'providers.jsonl.gz')
+    cassette = Cassette(path)
+    cassette.put('ddgs.text', {'query': 'a'}, ['one'])
+    cassette.put('ddgs.text', {'query': 'b'}, ['two'])
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 5)
+
+    resumed = Cassette(path)
+    resumed.put('ddgs.text', {'query': 'c'}, ['three'])
+    resumed.put('ddgs.text', {'query': 'd'}, ['four'])
+
+    reloaded = Cassette(path)
+    assert reloaded.get('ddgs.text', {'query': 'a'}) == ['one']
+    assert reloaded.get('ddgs.text', {'query': 'c'}) == ['three']
+    assert reloaded.get('ddgs.text', {'query': 'd'}) == ['four']
+
+
+def test_streamed_recording_replays_as_a_blocking_call(tmp_path):
+    FakeGenerativeModel.config = FakeProviderConfig(stream_chunks=5, **INSTANT)
+    cassette = Cassette(str(tmp_path / 'providers.jsonl.gz'))
+    try:
+        chunks = list(RecordingModel(FakeGenerativeModel('m'), 'm', cassette).generate_content('prompt', stream=True))
+    finally:
+        FakeGenerativeModel.config = FakeProviderConfig()
+
+    replayed = ReplayModel('m', Cassette(cassette.path))
+    assert [c.text for c in replayed.generate_content('prompt', stream=True)] == [c.text for c in chunks]
+    response = replayed.generate_content('prompt')
+    assert response.text == ''.join(c.text for c in chunks)
+    assert response.usage_metadata.total_token_count == chunks[-1].usage_metadata.total_token_count
+
+
+def test_replay_regenerates_the_recorded_proposal_without_providers(tmp_path):
+    cassette = str(tmp_path / 'providers.jsonl.gz')
+    workdir, output_dir = str(tmp_path / 'work'), str(tmp_path / 'html')
+    os.makedirs(workdir)
+    os.makedirs(output_dir)
+
+    # A live run first warms the cache; recording must still reach every provider
+    with offline_providers(FakeProviderConfig(**INSTANT), workdir):
+        create_proposal('key', '獺祭 純米大吟醸', '5,500円', '720ml', output_dir=output_dir)
+    provider_cassette.configure('record', cassette)
+    with offline_providers(FakeProviderConfig(**INSTANT), workdir):
+        recorded_path = create_proposal('key', '獺祭 純米大吟醸', '5,500円', '720ml', output_dir=output_dir)
+    with open(recorded_path, encoding='utf-8') as f:
+        recorded = f.read()
+    kinds = {entry['kind'] for entry in Cassette(cassette).entries.values()}
+    assert {'ddgs.text', 'ddgs.images', 'gemini', 'image.dhash', 'image.rank'} <= kinds
+
+    # Search, Gemini and image downloads would now fail every call; only the cassette can answer
+    provider_cassette.configure('replay', cassette)
+    broken = FakeProviderConfig(search_error_rate=1.0, gemini_error_rate=1.0, image_error_rate=1.0, **INSTANT)
+    replay_dir = str(tmp_path / 'replay')
+    os.makedirs(replay_dir)
+    with offline_providers(broken, replay_dir):
+        replayed_path = create_proposal('key', '獺祭 純米大吟醸', '5,500円', '720ml', output_dir=output_dir)
+    with open(replayed_path, encoding='utf-8') as f:
+        assert f.read() == recorded
+    stats = provider_cassette.stats()
+    assert stats['hits'] >= 2 and stats['misses'] == 0
+    assert not os.path.exists(os.path.join(replay_dir, 'images'))
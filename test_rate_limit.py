@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+import product_search
+from proposal_cache import ProposalCache
+from rate_limit import SingleFlight, TokenBucket
+
+
+def test_token_bucket_allows_burst_then_paces():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    waits = [bucket.acquire() for _ in range(4)]
+    elapsed = time.monotonic() - start
+
+    assert waits[:2] == [0.0, 0.0]
+    assert 0.08 < elapsed < 0.3
+    assert bucket.stats()["waited"] == 2
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    results = run_concurrently(5, lambda: flights.do("key", slow))
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flights.stats() == {"executed": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_single_flight_shares_errors():
+    flights = SingleFlight()
+
+    def failing():
+        time.sleep(0.05)
+        raise RuntimeError("202 Ratelimit")
+
+    results = run_concurrently(3, lambda: flights.do("key", failing))
+    assert all(isinstance(r, RuntimeError) for r in results)
+    with pytest.raises(RuntimeError):
+        flights.do("key", failing)
+
+
+def test_concurrent_identical_searches_hit_ddgs_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(product_search, "shared_cache", ProposalCache(path=str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(product_search, "ddgs_flights", SingleFlight())
+    upstream = []
+
+    def fake_fetch(product_name, ddgs=None):
+        upstream.append(product_name)
+        time.sleep(0.1)
+        return "Title: 獺祭\n"
+
+    monkeypatch.setattr(product_search, "fetch_product_info", fake_fetch)
+    results = run_concurrently(6, lambda: product_search.search_product_info("獺祭"))
+
+    assert results == ["Title: 獺祭\n"] * 6
+    assert len(upstream) == 1
+    assert product_search.ddgs_flights.stats()["coalesced"] == 5
+
+
+def test_background_searches_also_spend_their_own_budget(monkeypatch):
+    from rate_limit import background_work
+
+    monkeypatch.setattr(product_search, "ddgs_limiter", TokenBucket(rate=100, capacity=100))
+    monkeypatch.setattr(product_search, "ddgs_batch_limiter", TokenBucket(rate=1, capacity=1))
+    product_search.acquire_ddgs()
+    with background_work():
+        assert product_search.acquire_ddgs() == 0
+        assert product_search.ddgs_batch_limiter.acquired == 1
+    assert product_search.ddgs_limiter.acquired == 2
+
+
+def test_named_limiters_and_flights_are_exported_as_metrics():
+    import metrics
+
+    bucket = TokenBucket(rate=1000, capacity=1, name="test_bucket")
+    bucket.acquire()
+    bucket.acquire()
+    flights = SingleFlight(name="test_flight")
+    run_concurrently(4, lambda: flights.do("key", lambda: time.sleep(0.2)))
+
+    text = metrics.registry.render()
+    assert 'rate_limiter_wait_seconds_bucket{limiter="test_bucket",le="0.0"} 1' in text
+    assert 'rate_limiter_wait_seconds_count{limiter="test_bucket"} 2' in text
+    assert 'singleflight_calls_total{flight="test_flight",outcome="executed"} 1' in text
+    assert 'singleflight_calls_total{flight="test_flight",outcome="coalesced"} 3' in text
@@ -0,0 +1,110 @@
+import os
+import asyncio
+
+import httpx
+
+import app_v5
+from proposal_cache import ProposalCache
+from proposal_render import proposal_id, render_proposal_fragment, render_proposal_html, template_digest
+from proposal_store import proposal_store
+
+DATA = {
+    "product_name": "Monte Viesgo Crianza",
+    "price": "1,800円",
+    "capacity": "750ml",
+    "catch_copy": "樽熟成の深み & 果実味",
+    "benefits": [{"title": "<熟成>", "detail": "12ヶ月の樽熟成"}],
+    "product_specs": ["テンプラニーリョ100%"],
+    "comment": "食卓を格上げする一本です。",
+    "target": "ワイン好きの30〜50代",
+}
+IMAGE_URL = "https://example.com/monte.jpg"
+
+
+def test_document_and_fragment_share_the_template():
+    document = render_proposal_html(DATA, IMAGE_URL)
+    fragment = render_proposal_fragment(DATA, IMAGE_URL)
+
+    assert document.startswith("<!DOCTYPE html>")
+    assert "contenteditable" not in document
+    assert 'class="catch-copy" contenteditable="true"' in fragment
+    assert "&lt;熟成&gt;" in document and "&amp; 果実味" in fragment
+
+
+def test_fragment_tolerates_partial_data():
+    fragment = render_proposal_fragment({"product_name": "獺祭", "benefits": [None, {"title": "t", "detail": "d"}]}, "")
+    assert fragment.count('class="benefit-card"') == 1
+    assert '""' not in fragment.split('class="comment-text"')[1]
+
+
+def test_render_endpoint_revalidates_with_etag(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_v5, "shared_cache", ProposalCache(path=str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(proposal_store, "root", str(tmp_path / "proposals"))
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            saved = (await client.post("/api/proposals", json={"data": DATA, "image_url": IMAGE_URL})).json()
+            # Saved proposals do not live in the (expiring, evicting) shared cache
+            monkeypatch.setattr(app_v5, "shared_cache", ProposalCache(path=str(tmp_path / "cold.sqlite3")))
+            first = await client.get(saved["url"])
+            again = await client.get(saved["url"], headers={"If-None-Match": first.headers["etag"]})
+            fragment = await client.get(saved["url"], params={"fragment": "true"},
+                                        headers={"If-None-Match": first.headers["etag"]})
+            missing = await client.get("/api/render/0123456789abcdef")
+            return saved, first, again, fragment, missing
+
+    saved, first, again, fragment, missing = asyncio.run(run())
+
+    assert saved["proposal_id"] == proposal_id(DATA, IMAGE_URL)
+    assert first.status_code == 200 and first.headers["etag"] == f'"{saved["proposal_id"]}.{template_digest()}"'
+    assert again.status_code == 304 and again.content == b""
+    assert fragment.status_code == 200 and "<!DOCTYPE" not in fragment.text
+    assert missing.status_code == 404
+
+
+def test_wildcard_if_none_match_only_matches_existing_proposals(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_v5, "shared_cache", ProposalCache(path=str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(proposal_store, "root", str(tmp_path / "proposals"))
+    star = {"If-None-Match": "*"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            saved = (await client.post("/api/proposals", json={"data": DATA, "image_url": IMAGE_URL})).json()
+            responses = {}
+            for suffix in ("", "/bundle", "/pdf"):
+                responses[suffix] = (await client.get(saved["url"] + suffix, headers=star),
+                                     await client.get(f"/api/render/0123456789abcdef{suffix}", headers=star))
+            weak = await client.get(saved["url"], headers={"If-None-Match": f'W/{responses[""][0].headers["etag"]}'})
+            return responses, weak
+
+    responses, weak = asyncio.run(run())
+
+    for existing, missing in responses.values():
+        assert existing.status_code == 304
+        assert missing.status_code == 404
+    assert weak.status_code == 304
+
+
+def test_template_digest_follows_template_changes(tmp_path, monkeypatch):
+    import proposal_render
+    for name in ("proposal.html", "proposal_content.html"):
+        (tmp_path / name).write_text("<p>{{ data }}</p>", encoding="utf-8")
+    monkeypatch.setattr(proposal_render, "TEMPLATE_DIR", str(tmp_path))
+    before = template_digest()
+    (tmp_path / "proposal_content.html").write_text("<div>{{ data }}</div>", encoding="utf-8")
+    os.utime(tmp_path / "proposal_content.html", ns=(1, 1))
+    assert template_digest() != before
+
+
+def test_bytecode_cache_directory_is_created_on_first_write(tmp_path):
+    from jinja2 import DictLoader, Environment
+
+    from proposal_render import LazyBytecodeCache
+
+    directory = tmp_path / "jinja"
+    env = Environment(loader=DictLoader({"t.html": "{{ x }}"}), bytecode_cache=LazyBytecodeCache(str(directory)))
+    assert not directory.exists()
+    assert env.get_template("t.html").render(x=1) == "1"
+    assert len(list(directory.iterdir())) == 1
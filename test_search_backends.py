@@ -0,0 +1,132 @@
+import time
+import threading
+import httpx
+import pytest
+from search_backends import (HedgedSession, LatencyTracker, LocalCatalogBackend, SearchBackend, SearxNGBackend,
+                             hedged_requests)
+
+
+class StubBackend(SearchBackend):
+    def __init__(self, name, delay=0.0, error=None, empty=False):
+        self.name = name
+        self.empty = empty
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.closed = threading.Event()
+
+    def open(self):
+        backend = self
+
+        class Session:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                backend.closed.set()
+
+            def text(self, query, **kwargs):
+                backend.calls += 1
+                time.sleep(backend.delay)
+                if backend.error:
+                    raise backend.error
+                if backend.empty:
+                    return []
+                return [{'title': backend.name, 'body': query, 'href': f"https://{backend.name}/"}]
+
+        return Session()
+
+
+def tracker_with_p90(name, seconds):
+    tracker = LatencyTracker()
+    for _ in range(20):
+        tracker.observe((name, 'text'), seconds)
+    return tracker
+
+
+def test_slow_primary_is_hedged_after_its_p90():
+    primary, secondary = StubBackend('ddgs', delay=0.5), StubBackend('catalog')
+    before = hedged_requests.value(kind='text', winner='catalog')
+    start = time.perf_counter()
+    with HedgedSession([primary, secondary], tracker=tracker_with_p90('ddgs', 0.05)) as session:
+        results = session.text('獺祭')
+    assert time.perf_counter() - start < 0.4
+    assert results[0]['title'] == 'catalog'
+    assert hedged_requests.value(kind='text', winner='catalog') == before + 1
+    # The loser finishes in the background and its session is closed afterwards
+    assert primary.closed.wait(2)
+
+
+def test_empty_hedge_answer_does_not_beat_a_slow_primary():
+    primary, secondary = StubBackend('ddgs', delay=0.5), StubBackend('catalog', empty=True)
+    with HedgedSession([primary, secondary], tracker=tracker_with_p90('ddgs', 0.05)) as session:
+        results = session.text('獺祭')
+    assert results[0]['title'] == 'ddgs'
+    assert secondary.calls == 1
+
+
+def test_empty_answer_is_returned_when_no_backend_finds_anything():
+    backends = [StubBackend('ddgs', error=RuntimeError('ddgs down')), StubBackend('catalog', empty=True)]
+    with HedgedSession(backends, tracker=LatencyTracker()) as session:
+        assert session.text('獺祭') == []
+
+
+def test_fast_primary_never_fires_the_hedge():
+    primary, secondary = StubBackend('ddgs'), StubBackend('catalog')
+    with HedgedSession([primary, secondary], tracker=tracker_with_p90('ddgs', 0.5)) as session:
+        assert session.text('獺祭')[0]['title'] == 'ddgs'
+    assert secondary.calls == 0
+
+
+def test_failed_primary_falls_back_without_waiting():
+    primary, secondary = StubBackend('ddgs', error=RuntimeError('ratelimit')), StubBackend('catalog')
+    start = time.perf_counter()
+    with HedgedSession([primary, secondary], tracker=tracker_with_p90('ddgs', 5.0)) as session:
+        assert session.text('獺祭')[0]['title'] == 'catalog'
+    assert time.perf_counter() - start < 1
+
+
+def test_error_is_raised_when_every_backend_fails():
+    backends = [StubBackend('ddgs', error=RuntimeError('ddgs down')), StubBackend('catalog', error=ValueError('x'))]
+    with HedgedSession(backends, tracker=LatencyTracker()) as session:
+        with pytest.raises(RuntimeError, match='ddgs down'):
+            session.text('獺祭')
+
+
+def test_local_catalog_ranks_products_by_bm25(tmp_path):
+    path = tmp_path / 'product_master.csv'
+    path.write_text('商品名,説明,URL,画像\n'
+                    '獺祭 純米大吟醸 磨き二割三分,山田錦を23%まで磨いた純米大吟醸,https://example.jp/dassai,'
+                    'https://example.jp/dassai.jpg|https://example.jp/dassai2.jpg\n'
+                    'Monte Viesgo Crianza,スペインの赤ワイン,https://example.jp/monte,https://example.jp/monte.jpg\n',
+                    encoding='utf-8')
+    with LocalCatalogBackend(str(path)).open() as session:
+        results = session.text('獺祭 純米大吟醸 公式', max_results=5)
+        images = session.images('獺祭 純米大吟醸 商品画像 白背景', max_results=5)
+    assert [r['href'] for r in results] == ['https://example.jp/dassai']
+    assert [i['image'] for i in images] == ['https://example.jp/dassai.jpg', 'https://example.jp/dassai2.jpg']
+
+
+def test_searxng_results_are_mapped_to_ddgs_shapes():
+    def handler(request):
+        if request.url.params['categories'] == 'images':
+            results = [{'title': 'ボトル', 'img_src': 'https://img/1.jpg', 'resolution': '800 x 1200', 'url': 'https://p/'}]
+        else:
+            results = [{'title': '獺祭', 'content': '純米大吟醸', 'url': 'https://asahishuzo.ne.jp/'}]
+        assert request.url.params['language'] == 'ja-JP'
+        return httpx.Response(200, json={'results': results})
+
+    backend = SearxNGBackend('http://searx.local/', client=httpx.Client(transport=httpx.MockTransport(handler)))
+    with backend.open() as session:
+        assert session.text('獺祭', region='jp-jp', max_results=5) == [
+            {'title': '獺祭', 'body': '純米大吟醸', 'href': 'https://asahishuzo.ne.jp/'}]
+        [image] = session.images('獺祭', region='jp-jp', max_results=5)
+    assert (image['image'], image['thumbnail'], image['width'], image['height']) == ('https://img/1.jpg', 'https://img/1.jpg', 800, 1200)
+
+
+def test_backend_without_open_fails_when_created():
+    class Incomplete(SearchBackend):
+        name = 'incomplete'
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,53 @@
+import asyncio
+import gzip
+import os
+import re
+
+import httpx
+
+import app_v5
+from static_assets import StaticAssets
+
+
+def get(path, headers=None):
+    async def run():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.get(path, headers=headers or {})
+    return asyncio.run(run())
+
+
+def test_index_links_hashed_immutable_assets():
+    index = get("/", {"Accept-Encoding": "gzip"})
+    assert index.headers["cache-control"] == "no-cache" and index.headers["content-encoding"] == "gzip"
+
+    script = re.search(r'src="(/assets/app\.[0-9a-f]{12}\.js)"', index.text).group(1)
+    asset = get(script, {"Accept-Encoding": "br, gzip"})
+    assert asset.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert asset.headers["content-encoding"] in ("br", "gzip")
+    assert "javascript" in asset.headers["content-type"]
+    with open(os.path.join("static", "app.js"), encoding="utf-8") as f:
+        assert asset.text == f.read()
+
+    assert get("/assets/app.js").headers["cache-control"] == "no-cache"
+    assert get("/assets/missing.css").status_code == 404
+
+
+def test_revalidation_returns_304():
+    first = get("/", {"Accept-Encoding": "gzip"})
+    again = get("/", {"Accept-Encoding": "gzip", "If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304 and again.content == b""
+
+
+def test_reload_picks_up_changed_files(tmp_path):
+    (tmp_path / "index.html").write_text('<link href="/static/style.css">', encoding="utf-8")
+    (tmp_path / "style.css").write_text("body { color: red; }" * 50, encoding="utf-8")
+    assets = StaticAssets(str(tmp_path), reload=True)
+    before = assets.get("index.html").content
+
+    (tmp_path / "style.css").write_text("body { color: blue; }" * 50, encoding="utf-8")
+    os.utime(tmp_path / "style.css", ns=(1, 1))
+    after = assets.get("index.html").content
+
+    assert before != after and assets.url("style.css").encode() in after
+    assert gzip.decompress(assets.get("style.css").encodings["gzip"]).startswith(b"body { color: blue; }")
@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import app_v5
+import context_builder
+import gemini_client
+import product_search
+import proposal_generation
+from proposal_cache import ProposalCache
+from proposal_generation import ProposalStreamParser
+from proposal_store import proposal_store
+
+PROPOSAL = {
+    "product_name": "獺祭 純米大吟醸 磨き二割三分",
+    "price": "5,500円",
+    "capacity": "720ml",
+    "catch_copy": "極限の\"磨き\"が生む、至高の一滴",
+    "benefits": [
+        {"title": "華やかな香り", "detail": "果実のような香り, 上品な甘み]"},
+        {"title": "贈答に最適", "detail": "知名度の高さ"},
+        {"title": "食中酒", "detail": "和食に合う"},
+    ],
+    "product_specs": ["精米歩合23%", "山田錦100%"],
+    "comment": "自信を持っておすすめします。",
+    "target": "贈答需要のある40〜60代",
+}
+
+
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path, monkeypatch):
+    """Keeps the shared cache and saved proposals out of the real output/ directory."""
+    cache = ProposalCache(path=str(tmp_path / "cache.sqlite3"))
+    for module in (app_v5, product_search, proposal_generation, context_builder):
+        monkeypatch.setattr(module, "shared_cache", cache)
+    monkeypatch.setattr(proposal_store, "root", str(tmp_path / "proposals"))
+
+
+def feed_in_chunks(text, size):
+    parser = ProposalStreamParser()
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+def test_parser_emits_each_field_once_whatever_the_chunking():
+    text = json.dumps(PROPOSAL, ensure_ascii=False, indent=4)
+    expected = list(proposal_generation.proposal_events(PROPOSAL))
+    for size in (1, 2, 5, 17, len(text)):
+        assert feed_in_chunks(text, size) == expected
+
+
+def test_parser_waits_for_separator_before_emitting_numbers():
+    parser = ProposalStreamParser()
+    assert parser.feed('{"count": 12') == []
+    assert parser.feed('3, "unit": "本"') == [
+        ("field", {"key": "count", "value": 123}),
+        ("field", {"key": "unit", "value": "本"}),
+    ]
+
+
+def test_benefits_are_emitted_before_the_response_completes():
+    text = json.dumps(PROPOSAL, ensure_ascii=False)
+    cut = text.index('"product_specs"')
+    events = ProposalStreamParser().feed(text[:cut])
+    assert [e[1]["index"] for e in events if e[0] == "item" and e[1]["key"] == "benefits"] == [0, 1, 2]
+
+
+def test_stream_proposal_json_streams_and_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(proposal_generation, "shared_cache", ProposalCache(path=str(tmp_path / "cache.sqlite3")))
+    text = json.dumps(PROPOSAL, ensure_ascii=False)
+    chunks = [text[i:i + 40] for i in range(0, len(text), 40)]
+    calls = []
+
+    class FakeModel:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, prompt, generation_config=None, stream=False):
+            calls.append(stream)
+            return [type("Chunk", (), {"text": chunk})() for chunk in chunks]
+
+    monkeypatch.setattr(gemini_client, "_manager", None)
+    monkeypatch.setattr(gemini_client.genai, "GenerativeModel", FakeModel)
+
+    args = ("key", PROPOSAL["product_name"], PROPOSAL["price"], PROPOSAL["capacity"], "context")
+    streamed = list(proposal_generation.stream_proposal_json(*args))
+    replayed = list(proposal_generation.stream_proposal_json(*args))
+
+    assert streamed[-1] == ("done", PROPOSAL)
+    assert streamed == replayed
+    assert calls == [True]
+
+
+def test_stream_endpoint_sends_server_sent_events(tmp_path, monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+
+    def fake_stream(api_key, product_name, price, capacity, context, **kwargs):
+        yield from proposal_generation.proposal_events(PROPOSAL)
+        yield "done", PROPOSAL
+
+    monkeypatch.setattr(app_v5, "stream_proposal_content_gemini", fake_stream)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_v5.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.post("/api/generate/stream", json={
+                "product_name": PROPOSAL["product_name"], "price": PROPOSAL["price"],
+                "capacity": PROPOSAL["capacity"], "image_url": "", "context": "",
+            })
+
+    response = asyncio.run(run())
+    messages = [m for m in response.text.split("\n\n") if m]
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [m.split("\n", 1)[0][len("event: "):] for m in messages]
+    assert events[:2] == ["field", "html"]
+    assert events[-3:] == ["html", "saved", "done"]
+    assert "極限の" in json.loads(messages[-3].split("data: ", 1)[1])["html"]
+    assert json.loads(messages[-1].split("data: ", 1)[1]) == PROPOSAL
@@ -0,0 +1,36 @@
+import re
+import math
+import unicodedata
+from collections import Counter
+
+
+def text_tokens(text):
+    """Search tokens for mixed Japanese/Latin text: lowercase words plus character bigrams of CJK runs."""
+    text = unicodedata.normalize('NFKC', text).lower()
+    tokens = re.findall(r'[a-z0-9]+', text)
+    for run in re.findall(r'[぀-ヿ㐀-鿿豈-﫿ー]+', text):
+        tokens.extend(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+    return tokens
+
+
+def bm25_scores(query, documents, k1=1.5, b=0.75):
+    """Okapi BM25 score of each document (a string) for `query`, with IDF taken from `documents` themselves."""
+    docs = [Counter(text_tokens(document)) for document in documents]
+    if not docs:
+        return []
+    lengths = [sum(doc.values()) for doc in docs]
+    avg_length = sum(lengths) / len(docs) or 1
+    terms = set(text_tokens(query))
+    idf = {}
+    for term in terms:
+        containing = sum(1 for doc in docs if term in doc)
+        idf[term] = math.log(1 + (len(docs) - containing + 0.5) / (containing + 0.5))
+    scores = []
+    for doc, length in zip(docs, lengths):
+        score = 0.0
+        for term in terms:
+            tf = doc.get(term, 0)
+            if tf:
+                score += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+        scores.append(score)
+    return scores